@@ -0,0 +1,38 @@
+"""
+Benchmark writing and indexing many small items of HDF5Datasets outputs,
+with and without packing
+"""
+import glob
+import sys
+import tempfile
+import time
+
+from dflow.config import config
+from dflow.python.opio import Artifact, HDF5Datasets
+from dflow.python.utils import handle_input_artifact, handle_output_artifact
+
+
+def write_and_read(name, value, data_root):
+    sign = Artifact(HDF5Datasets)
+    handle_output_artifact(name, value, sign, data_root=data_root)
+    path = glob.glob("%s/outputs/artifacts/%s/*.h5" % (data_root, name))[0]
+    return handle_input_artifact(name, sign, path=path)
+
+
+def benchmark(n=10**5):
+    pack_size = config["hdf5_pack_size"]
+    for size in [0, 1024]:
+        config["hdf5_pack_size"] = size
+        with tempfile.TemporaryDirectory() as tmpdir:
+            value = ["item %s" % i for i in range(n)]
+            t = time.time()
+            res = write_and_read("foo", value, tmpdir)
+            t1 = time.time()
+            assert res[n - 1].get_data() == "item %s" % (n - 1)
+            print("pack size %s: write and index %s items: %.3fs" % (
+                size, n, t1 - t))
+    config["hdf5_pack_size"] = pack_size
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
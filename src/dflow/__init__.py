@@ -1,30 +1,86 @@
+import importlib
 import logging
 import os
 
-from .argo_objects import ArgoStep, ArgoWorkflow
-from .code_gen import gen_code
-from .common import (CustomArtifact, HTTPArtifact, LineageClient,
-                     LocalArtifact, S3Artifact, import_func, jsonpickle)
 from .config import config, s3_config, set_config, set_s3_config
-from .context import Context
-from .dag import DAG
-from .executor import ContainerExecutor, Executor, RemoteExecutor
-from .io import (AutonamedDict, IfExpression, InputArtifact, InputParameter,
-                 Inputs, OutputArtifact, OutputParameter, Outputs,
-                 if_expression)
-from .op_template import (HTTPOPTemplate, OPTemplate, PythonScriptOPTemplate,
-                          Secret, ShellOPTemplate)
-from .resource import Resource
-from .slurm import SlurmJob, SlurmJobTemplate, SlurmRemoteExecutor
-from .step import (HookStep, Step, argo_concat, argo_enumerate, argo_len,
-                   argo_range, argo_sequence, argo_sum)
-from .steps import Steps
-from .task import Task
-from .utils import (copy_artifact, copy_s3, download_artifact, download_s3,
-                    path_list_of_artifact, path_object_of_artifact, randstr,
-                    upload_artifact, upload_s3)
-from .workflow import (DockerSecret, Workflow, parse_repo,
-                       query_archived_workflows, query_workflows)
+
+# attributes are imported on first access (PEP 562), so that OP scripts in
+# pods only load the modules they use
+lazy_attributes = {
+    "ArgoStep": "argo_objects",
+    "ArgoWorkflow": "argo_objects",
+    "gen_code": "code_gen",
+    "CustomArtifact": "common",
+    "HTTPArtifact": "common",
+    "LineageClient": "common",
+    "LocalArtifact": "common",
+    "S3Artifact": "common",
+    "import_func": "common",
+    "jsonpickle": "common",
+    "BufferedLineageClient": "lineage",
+    "Context": "context",
+    "DAG": "dag",
+    "ContainerExecutor": "executor",
+    "Executor": "executor",
+    "RemoteExecutor": "executor",
+    "AutonamedDict": "io",
+    "IfExpression": "io",
+    "InputArtifact": "io",
+    "InputParameter": "io",
+    "Inputs": "io",
+    "OutputArtifact": "io",
+    "OutputParameter": "io",
+    "Outputs": "io",
+    "if_expression": "io",
+    "HTTPOPTemplate": "op_template",
+    "OPTemplate": "op_template",
+    "PythonScriptOPTemplate": "op_template",
+    "Secret": "op_template",
+    "ShellOPTemplate": "op_template",
+    "Resource": "resource",
+    "SlurmJob": "slurm",
+    "SlurmJobTemplate": "slurm",
+    "SlurmRemoteExecutor": "slurm",
+    "HookStep": "step",
+    "Step": "step",
+    "argo_concat": "step",
+    "argo_enumerate": "step",
+    "argo_len": "step",
+    "argo_range": "step",
+    "argo_sequence": "step",
+    "argo_sum": "step",
+    "Steps": "steps",
+    "Task": "task",
+    "copy_artifact": "utils",
+    "copy_s3": "utils",
+    "download_artifact": "utils",
+    "download_s3": "utils",
+    "path_list_of_artifact": "utils",
+    "path_object_of_artifact": "utils",
+    "randstr": "utils",
+    "upload_artifact": "utils",
+    "upload_s3": "utils",
+    "DockerSecret": "workflow",
+    "Workflow": "workflow",
+    "parse_repo": "workflow",
+    "query_archived_workflows": "workflow",
+    "query_workflows": "workflow",
+}
+
+
+def __getattr__(name):
+    if name in lazy_attributes:
+        module = importlib.import_module(".%s" % lazy_attributes[name],
+                                         __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(lazy_attributes))
+
 
 log_level = os.environ.get('LOG_LEVEL')
 if log_level:
@@ -45,12 +101,24 @@ __all__ = ["S3Artifact", "DAG", "Executor", "RemoteExecutor", "AutonamedDict",
            "query_archived_workflows", "ContainerExecutor", "ArgoStep",
            "ArgoWorkflow", "argo_enumerate", "path_object_of_artifact",
            "CustomArtifact", "gen_code", "jsonpickle", "HTTPArtifact",
-           "HookStep", "HTTPOPTemplate"]
+           "HookStep", "HTTPOPTemplate", "BufferedLineageClient"]
 
 
 if os.environ.get("DFLOW_LINEAGE"):
+    from .common import import_func
     config["lineage"] = import_func(os.environ.get("DFLOW_LINEAGE"))()
+    if config["lineage_buffered"]:
+        from .lineage import BufferedLineageClient
+        config["lineage"] = BufferedLineageClient(config["lineage"])
 if os.environ.get("DFLOW_S3_STORAGE_CLIENT"):
+    from .common import import_func
     s3_config["storage_client"] = import_func(os.environ.get(
         "DFLOW_S3_STORAGE_CLIENT"))()
-parse_repo()
+# parse the artifact repository at import, except in pods (Argo sets
+# ARGO_TEMPLATE in their containers), where OP scripts do not need it.
+# Workflow.__init__ also parses the repository of its artifact_repo_key
+# if it has not been parsed yet
+if s3_config["repo_key"] is not None and s3_config["repo"] is None and \
+        "ARGO_TEMPLATE" not in os.environ:
+    from .workflow import parse_repo
+    parse_repo()
@@ -318,15 +318,70 @@ def get_hash(node_name):
     return fnva(node_name.encode(), FNV1_32_INIT, FNV_32_PRIME, 2**32)
 
 
+def get_hashes(node_names: List[str]) -> List[int]:
+    """
+    Compute hashes of many node names at once, vectorised with numpy if
+    available
+    """
+    node_names = list(node_names)
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is None or len(node_names) < 64:
+        return [get_hash(node_name) for node_name in node_names]
+
+    data = [node_name.encode() for node_name in node_names]
+    lengths = np.fromiter(map(len, data), dtype=np.int64, count=len(data))
+    # sort by length descending, so that the rows still being hashed at
+    # column i are always a prefix of the matrix
+    order = np.argsort(-lengths, kind="stable")
+    lengths = lengths[order]
+    mask = np.arange(lengths[0]) < lengths[:, None]
+    buf = np.zeros(mask.shape, dtype=np.uint32)
+    buf[mask] = np.frombuffer(b"".join(data[i] for i in order),
+                              dtype=np.uint8)
+    active = mask.sum(axis=0)
+    hval = np.full(len(data), FNV1_32_INIT, dtype=np.uint32)
+    prime = np.uint32(FNV_32_PRIME)
+    for i, n in enumerate(active):
+        # uint32 multiplication wraps around, i.e. modulo 2**32
+        hval[:n] = (hval[:n] ^ buf[:n, i]) * prime
+    result = np.empty_like(hval)
+    result[order] = hval
+    return result.tolist()
+
+
 def get_pod_name(wf_name, node_name, template_name, node_id):
     if wf_name == node_name:
         return wf_name
+    return "%s-%s" % (get_pod_name_prefix(wf_name, template_name),
+                      get_hash(node_name))
+
+
+def get_pod_names(wf_name: str, nodes: List[tuple]) -> List[str]:
+    """
+    Compute pod names of many nodes at once
+
+    Args:
+        wf_name: workflow name
+        nodes: a list of (node name, template name) tuples
+    Returns:
+        a list of pod names
+    """
+    nodes = list(nodes)
+    hashes = get_hashes([node_name for node_name, _ in nodes])
+    return [wf_name if wf_name == node_name else "%s-%s" % (
+        get_pod_name_prefix(wf_name, template_name), hash_val)
+        for (node_name, template_name), hash_val in zip(nodes, hashes)]
+
+
+def get_pod_name_prefix(wf_name, template_name):
     prefix = "%s-%s" % (wf_name, template_name)
     max_prefix_length = max_k8s_resource_name_length - k8s_naming_hash_length
     if len(prefix) > max_prefix_length - 1:
         prefix = prefix[:max_prefix_length-1]
-    hash_val = get_hash(node_name)
-    return "%s-%s" % (prefix, hash_val)
+    return prefix
 
 
 def fnva(data, hval_init, fnv_prime, fnv_size):
@@ -336,6 +391,12 @@ def fnva(data, hval_init, fnv_prime, fnv_size):
     assert isinstance(data, bytes)
 
     hval = hval_init
+    if fnv_size & (fnv_size - 1) == 0:
+        # modulo a power of 2 is a bitwise and, which is much cheaper
+        mask = fnv_size - 1
+        for byte in data:
+            hval = ((hval ^ byte) * fnv_prime) & mask
+        return hval
     for byte in data:
         hval = hval ^ byte
         hval = (hval * fnv_prime) % fnv_size
@@ -361,6 +422,7 @@ class ArgoWorkflow(ArgoObjectDict):
             type: Union[str, List[str]] = None,
             parent_id: Optional[str] = None,
             sort_by_generation: bool = False,
+            lite: bool = False,
     ) -> List[ArgoStep]:
         if name is not None and not isinstance(name, list):
             name = [name]
@@ -406,6 +468,8 @@ class ArgoWorkflow(ArgoObjectDict):
                     continue
                 if id is not None and step["id"] not in id:
                     continue
+                if lite:
+                    step = lite_node(step)
                 step = ArgoStep(step, self.metadata.name)
                 step_list.append(step)
         else:
@@ -461,6 +525,23 @@ class ArgoWorkflow(ArgoObjectDict):
         return get_duration(self.status)
 
 
+lite_node_fields = ["id", "name", "displayName", "type", "phase",
+                    "templateName", "boundaryID", "startedAt", "finishedAt",
+                    "progress", "message", "children", "outboundNodes",
+                    "memoizationStatus"]
+
+
+def lite_node(node):
+    """
+    Compact summary of a node without inputs and outputs except the key
+    """
+    lite = {k: node[k] for k in lite_node_fields if k in node}
+    for par in node.get("inputs", {}).get("parameters", []):
+        if par["name"] == "dflow_key":
+            lite["inputs"] = {"parameters": [par]}
+    return lite
+
+
 def get_duration(status) -> datetime.timedelta:
     if status.startedAt is None:
         return datetime.timedelta()
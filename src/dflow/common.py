@@ -6,7 +6,7 @@ import shutil
 from abc import ABC
 from copy import copy, deepcopy
 from importlib import import_module
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Union
 
 import jsonpickle as jp
 
@@ -219,6 +219,21 @@ class LineageClient(ABC):
     def get_artifact_metadata(self, urn: str) -> object:
         pass
 
+    def gen_artifact_urn(self, namespace: str, name: str) -> Optional[str]:
+        """
+        URN of an artifact known before registering it, None if it is
+        assigned by the lineage service (registrations are not buffered)
+        """
+        return None
+
+    def register_batch(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Register a batch of records in order, each record is a dict with
+        "method" (register_artifact or register_task) and "kwargs"
+        """
+        for record in records:
+            getattr(self, record["method"])(**record["kwargs"])
+
 
 def import_func(s):
     fields = s.split(".")
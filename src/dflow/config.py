@@ -83,6 +83,36 @@ config = {
     "dispatcher_debug": boolize(os.environ.get("DISPATCHER_DEBUG", False)),
     "dereference_symlink": boolize(os.environ.get("DFLOW_DEREFERENCE_SYMLINK",
                                                   False)),
+    "catalog_pool_workers": int(os.environ.get("DFLOW_CATALOG_POOL_WORKERS",
+                                               10)),
+    "catalog_cache_size": int(os.environ.get("DFLOW_CATALOG_CACHE_SIZE",
+                                             128)),
+    "merge_sliced_catalog": boolize(os.environ.get(
+        "DFLOW_MERGE_SLICED_CATALOG", False)),
+    "snapshot_dir": nullable(os.environ.get("DFLOW_SNAPSHOT_DIR", None)),
+    "reuse_pool_workers": int(os.environ.get("DFLOW_REUSE_POOL_WORKERS", 10)),
+    "reuse_configmap_size_limit": int(os.environ.get(
+        "DFLOW_REUSE_CONFIGMAP_SIZE_LIMIT", 512 * 1024)),
+    "hdf5_compression": nullable(os.environ.get("DFLOW_HDF5_COMPRESSION",
+                                                None)),
+    "hdf5_chunk_size": int(os.environ.get("DFLOW_HDF5_CHUNK_SIZE",
+                                          1024 * 1024)),
+    "hdf5_pack_size": int(os.environ.get("DFLOW_HDF5_PACK_SIZE", 0)),
+    "hdf5_stream_files": boolize(os.environ.get("DFLOW_HDF5_STREAM_FILES",
+                                                False)),
+    "stage_pool_workers": int(os.environ.get("DFLOW_STAGE_POOL_WORKERS", 8)),
+    "transfer_pool_workers": int(os.environ.get(
+        "DFLOW_TRANSFER_POOL_WORKERS", 4)),
+    "list_shard_workers": int(os.environ.get("DFLOW_LIST_SHARD_WORKERS", 1)),
+    "lineage_buffered": boolize(os.environ.get("DFLOW_LINEAGE_BUFFERED",
+                                               False)),
+    "lineage_batch_size": int(os.environ.get("DFLOW_LINEAGE_BATCH_SIZE", 100)),
+    "lineage_flush_interval": float(os.environ.get(
+        "DFLOW_LINEAGE_FLUSH_INTERVAL", 1.0)),
+    "lineage_max_queue": int(os.environ.get("DFLOW_LINEAGE_MAX_QUEUE", 10000)),
+    "lineage_spill_dir": os.environ.get("DFLOW_LINEAGE_SPILL_DIR", None),
+    "lineage_close_timeout": float(os.environ.get(
+        "DFLOW_LINEAGE_CLOSE_TIMEOUT", 60)),
 }
 
 
@@ -116,6 +146,46 @@ def set_config(
         http_headers: HTTP headers for requesting Argo server
         workflow_annotations: default annotations for workflows
         overwrite_reused_artifact: overwrite reused artifact
+        catalog_pool_workers: maximum number of concurrent downloads of
+            catalog fragments, or of concurrent assembling of input parts
+        catalog_cache_size: maximum number of artifact catalogs cached in
+            memory, 0 for no cache
+        merge_sliced_catalog: write a merged catalog object for the sliced
+            output artifacts after a sliced step, so that readers download
+            one object instead of one catalog fragment per slice
+        snapshot_dir: directory for local snapshots of succeeded workflows
+            (e.g. ~/.dflow/snapshots), None for no snapshot
+        reuse_pool_workers: maximum number of concurrent API calls for
+            creating cache entries of reused steps
+        reuse_configmap_size_limit: maximum size in bytes for packing cache
+            entries of reused steps into a single ConfigMap
+        hdf5_compression: compression filter ("gzip" or "lzf") for HDF5Datasets
+            outputs, None for no compression
+        hdf5_chunk_size: chunk size in bytes for HDF5Datasets outputs
+        hdf5_pack_size: items of HDF5Datasets outputs not larger than it (in
+            bytes) are packed into a shared dataset, 0 for no packing
+        hdf5_stream_files: stream files of HDF5Datasets outputs larger than
+            the chunk size chunk by chunk, text files streamed are not
+            readable by older versions
+        stage_pool_workers: maximum number of concurrent file operations
+            for staging output artifacts in pods
+        transfer_pool_workers: maximum number of concurrent object
+            transfers of download_s3 and copy_s3, overlapped with listing
+        list_shard_workers: maximum number of concurrent listings of the
+            common prefixes of a recursive listing (OSS and Minio), 1 for
+            a sequential listing
+        lineage_buffered: wrap the lineage client set by DFLOW_LINEAGE in a
+            BufferedLineageClient
+        lineage_batch_size: number of queued lineage registrations which
+            triggers a flush of BufferedLineageClient
+        lineage_flush_interval: maximum seconds a lineage registration stays
+            queued in BufferedLineageClient
+        lineage_max_queue: maximum number of lineage registrations queued in
+            memory, more are spilled to lineage_spill_dir (or wait)
+        lineage_spill_dir: directory for spilling lineage registrations
+            which are queued or failed, replayed later, None for no spill
+        lineage_close_timeout: maximum seconds for flushing lineage
+            registrations when the process exits
     """
     config.update(kwargs)
 
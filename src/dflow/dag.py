@@ -166,6 +166,8 @@ class DAG(OPTemplate):
             self.tasks.append(t)
             if t.check_step is not None:
                 self.tasks.append(t.check_step)
+            if t.merge_step is not None:
+                self.tasks.append(t.merge_step)
 
     def convert_to_argo(self, memoize_prefix=None,
                         memoize_configmap="dflow", context=None):
@@ -197,7 +199,8 @@ class DAG(OPTemplate):
         for task in self.tasks:
             if not task.name.endswith("-init-artifact") and \
                 not task.name.endswith("-check-num-success") and \
-                    not task.name.endswith("-check-success-ratio"):
+                    not task.name.endswith("-check-success-ratio") and \
+                    not task.name.endswith("-merge-catalog"):
                 graph_tasks.append(task.convert_to_graph())
                 templates.append(task.template)
 
@@ -205,6 +205,7 @@ class RemoteExecutor(Executor):
             singularity_executable: Optional[str] = None,
             podman_executable: Optional[str] = None,
             action_retries: int = -1,
+            max_retry_interval: int = 60,
     ) -> None:
         self.host = host
         self.port = port
@@ -235,6 +236,7 @@ class RemoteExecutor(Executor):
                 self.podman_executable is not None:
             self.map_tmp_dir = False
         self.action_retries = action_retries
+        self.max_retry_interval = max_retry_interval
 
     def execute(self, cmd):
         # add '' in case shell will expand ~
@@ -265,71 +267,156 @@ class RemoteExecutor(Executor):
             self.download("%s/%s" % (self.workdir, path),
                           os.path.dirname(path)) + "\n"
 
-    def get_script(self, template):
-        if self.map_tmp_dir:
-            remote_script = render_script_with_tmp_root(
-                template, "%s/tmp" % self.workdir)
-        else:
-            remote_script = template.script
-        remote_command = template.command if self.remote_command is None \
-            else self.remote_command
+    def upload_all(self, paths):
+        """
+        Upload the existing paths into the remote working directory in a
+        single tar stream, retaining their structure
+        """
+        script = "set --\n"
+        for path in paths:
+            if os.path.isabs(path):
+                script += "if [ -e %s ]; then set -- \"$@\" -C / %s; fi\n" % (
+                    path, path.lstrip("/"))
+            else:
+                script += "if [ -e %s ]; then set -- \"$@\" -C \"$PWD\" %s; "\
+                    "fi\n" % (path, path)
+        script += "upload_all %s '%s' \"$@\" || exit 1\n" % (
+            self.action_retries, self.workdir)
+        return script
+
+    def download_all(self, paths):
+        """
+        Download the paths from the remote working directory in a single
+        tar stream, missing paths are skipped
+        """
+        script = ""
+        abs_paths = [p.lstrip("/") for p in paths if os.path.isabs(p)]
+        rel_paths = [p for p in paths if not os.path.isabs(p)]
+        for local_dir, group in [("/", abs_paths), ("$PWD", rel_paths)]:
+            if group:
+                script += "download_all %s '%s' \"%s\" %s || exit 1\n" % (
+                    self.action_retries, self.workdir, local_dir,
+                    " ".join(group))
+        return script
+
+    def get_functions(self):
+        """
+        Shell functions for remote actions over SSH
+        """
         ssh_pass = "sshpass -p %s " % self.password if self.password is not \
             None else ""
         identity = "-i /root/.ssh/%s " % os.path.basename(
             self.private_key_file) if self.private_key_file is not None else ""
+        # all SSH sessions of the step share a multiplexed connection
         script = """
-execute() {
-    if [ $1 != 0 ]; then
-        %sssh %s-C -o StrictHostKeyChecking=no -p %s %s@%s -- $2
-        if [ $? != 0 ]; then
-            echo retry: $1
-            sleep 1
-            execute $(($1-1)) '$2'
-        fi
-    fi
-}
+SSH="%sssh %s-C -o StrictHostKeyChecking=no -o ControlMaster=auto \
+-o ControlPath=/tmp/dflow-ssh-%%C -o ControlPersist=yes -p %s %s@%s"
+trap '$SSH -O exit >/dev/null 2>&1' EXIT
 """ % (ssh_pass, identity, self.port, self.username, self.host)
         script += """
-upload() {
-    if [ $1 != 0 ]; then
-        %sssh %s-C -o StrictHostKeyChecking=no -p %s %s@%s -- mkdir -p $3 && \
-        %sscp %s-C -o StrictHostKeyChecking=no -P %s -r $2 %s@%s:$3
-        if [ $? != 0 ]; then
-            echo retry: $1
-            sleep 1
-            upload $(($1-1)) $2 $3
+retry() {
+    n=$1
+    shift
+    delay=1
+    while [ $n != 0 ]; do
+        "$@" && return 0
+        n=$(($n-1))
+        echo retry: $n
+        sleep $delay
+        delay=$(($delay*2))
+        if [ $delay -gt %s ]; then
+            delay=%s
         fi
-    fi
+    done
+    return 1
 }
-""" % (ssh_pass, identity, self.port, self.username, self.host,
-            ssh_pass, identity, self.port, self.username, self.host)
+""" % (self.max_retry_interval, self.max_retry_interval)
         script += """
+execute_once() {
+    $SSH -- "$1"
+}
+
+execute() {
+    retry $1 execute_once "$2"
+}
+
+upload_once() {
+    tar -C "$(dirname "$1")" -cf - "$(basename "$1")" | \
+        $SSH -- "mkdir -p $2 && tar -xf - -C $2"
+}
+
+upload() {
+    retry $1 upload_once "$2" "$3"
+}
+
+download_once() {
+    $SSH -- "tar -C $(dirname "$1") -cf - $(basename "$1")" > \
+        dflow_download.tar && tar -xf dflow_download.tar -C "$2" && \
+        rm -f dflow_download.tar
+}
+
 download() {
-    if [ $1 != 0 ]; then
-        %sscp %s-C -o StrictHostKeyChecking=no -P %s -r %s@%s:$2 $3
-        if [ $? != 0 ]; then
-            echo retry: $1
-            sleep 1
-            download $(($1-1)) $2 $3
-        fi
+    retry $1 download_once "$2" "$3"
+}
+
+upload_all_once() {
+    dir=$1
+    shift
+    tar -cf - "$@" | $SSH -- "mkdir -p $dir && tar -xf - -C $dir"
+}
+
+upload_all() {
+    n=$1
+    shift
+    if [ $# -gt 1 ]; then
+        retry $n upload_all_once "$@"
     fi
 }
-""" % (ssh_pass, identity, self.port, self.username, self.host)
+
+download_all_once() {
+    dir=$1
+    local_dir=$2
+    shift 2
+    $SSH -- "cd $dir && set -- $* && for p in \\"\\$@\\"; do shift; \
+if [ -e \\"\\$p\\" ]; then set -- \\"\\$@\\" \\"\\$p\\"; fi; done; \
+if [ \\$# -gt 0 ]; then tar -cf - \\"\\$@\\"; fi" > dflow_download.tar && \
+        if [ -s dflow_download.tar ]; then \
+            tar -xf dflow_download.tar -C "$local_dir"; fi && \
+        rm -f dflow_download.tar
+}
+
+download_all() {
+    n=$1
+    shift
+    retry $n download_all_once "$@"
+}
+"""
+        return script
+
+    def get_script(self, template):
+        if self.map_tmp_dir:
+            remote_script = render_script_with_tmp_root(
+                template, "%s/tmp" % self.workdir)
+        else:
+            remote_script = template.script
+        remote_command = template.command if self.remote_command is None \
+            else self.remote_command
+        script = self.get_functions()
         script += "cat <<'EOF'> script\n" + remote_script + "\nEOF\n"
-        for art in template.inputs.artifacts.values():
-            script += self.upload_if_exists(art.path)
+        inputs = [art.path for art in template.inputs.artifacts.values()]
         for par in template.inputs.parameters.values():
             if par.save_as_artifact:
-                script += self.upload_if_exists(par.path)
-        script += self.upload_if_exists("script")
+                inputs.append(par.path)
+        inputs.append("script")
+        script += self.upload_all(inputs)
         script += self.run(template.image, remote_command)
-        for art in template.outputs.artifacts.values():
-            script += self.mkdir_and_download(art.path)
+        outputs = [art.path for art in template.outputs.artifacts.values()]
         for par in template.outputs.parameters.values():
             if par.save_as_artifact:
-                script += self.mkdir_and_download(par.path)
+                outputs.append(par.path)
             elif par.value_from_path is not None:
-                script += self.mkdir_and_download(par.value_from_path)
+                outputs.append(par.value_from_path)
+        script += self.download_all(outputs)
         return script
 
     def render(self, template):
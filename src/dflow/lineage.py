@@ -0,0 +1,315 @@
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Union
+
+from .common import LineageClient, jsonpickle
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedLineageClient(LineageClient):
+    """
+    Lineage client queueing the registrations of artifacts and tasks, which
+    are flushed in batches by a background thread
+
+    A registration is queued only when the wrapped client knows the URNs
+    before registering (gen_artifact_urn), otherwise it is registered
+    synchronously. A batch is flushed when it is full or when its oldest
+    registration has been queued for flush_interval seconds. With a spill
+    directory, registrations beyond max_queue and batches failed are written
+    to disk and replayed later, also by another process using the same
+    directory. Registrations should be idempotent, as a batch partly
+    registered before a failure is registered again.
+
+    Args:
+        client: the lineage client wrapped
+        batch_size: number of queued registrations which triggers a flush
+        flush_interval: maximum seconds a registration stays queued
+        max_queue: maximum number of registrations queued in memory, more
+            are spilled to spill_dir, or wait without spill_dir
+        spill_dir: directory for spilling registrations, None for no spill
+        close_timeout: maximum seconds for flushing when closed (the
+            client is closed when the process exits)
+    """
+
+    def __init__(
+            self,
+            client: LineageClient,
+            batch_size: Optional[int] = None,
+            flush_interval: Optional[float] = None,
+            max_queue: Optional[int] = None,
+            spill_dir: Optional[str] = None,
+            close_timeout: Optional[float] = None,
+    ) -> None:
+        self.client = client
+        self.batch_size = batch_size if batch_size is not None else \
+            config["lineage_batch_size"]
+        self.flush_interval = flush_interval if flush_interval is not None \
+            else config["lineage_flush_interval"]
+        self.max_queue = max_queue if max_queue is not None else \
+            config["lineage_max_queue"]
+        self.spill_dir = spill_dir if spill_dir is not None else \
+            config["lineage_spill_dir"]
+        self.close_timeout = close_timeout if close_timeout is not None else \
+            config["lineage_close_timeout"]
+        self.queue = []
+        self.oldest = 0.0
+        self.in_flight = 0
+        self.flushes = 0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.closed = False
+        self.thread = None
+        self.cond = threading.Condition()
+        self.stats = {"registered": 0, "batches": 0, "spilled": 0,
+                      "replayed": 0, "failures": 0}
+        self.spill_pending = False
+        if self.spill_dir is not None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            # replay what previous processes left
+            if any(f.endswith(".jsonl") for f in os.listdir(self.spill_dir)):
+                self.spill_pending = True
+                self._start()
+        atexit.register(self.close)
+
+    def register_workflow(self, workflow_name: str) -> str:
+        self.flush(self.close_timeout)
+        return self.client.register_workflow(workflow_name)
+
+    def register_artifact(
+            self,
+            namespace: str,
+            name: str,
+            uri: str,
+            **kwargs) -> str:
+        urn = self.client.gen_artifact_urn(namespace, name)
+        if urn is not None and self._enqueue({
+                "method": "register_artifact",
+                "kwargs": dict(namespace=namespace, name=name, uri=uri,
+                               **kwargs)}):
+            return urn
+        self.flush(self.close_timeout)
+        return self.client.register_artifact(namespace, name, uri, **kwargs)
+
+    def register_task(
+            self,
+            task_name: str,
+            input_urns: Dict[str, Union[str, List[str]]],
+            output_uris: Dict[str, str],
+            workflow_urn: str) -> Dict[str, str]:
+        output_urns = {name: self.client.gen_artifact_urn(task_name, name)
+                       for name in output_uris}
+        if None not in output_urns.values() and self._enqueue({
+                "method": "register_task",
+                "kwargs": dict(task_name=task_name, input_urns=input_urns,
+                               output_uris=output_uris,
+                               workflow_urn=workflow_urn)}):
+            return output_urns
+        self.flush(self.close_timeout)
+        return self.client.register_task(task_name, input_urns, output_uris,
+                                         workflow_urn)
+
+    def get_artifact_metadata(self, urn: str) -> object:
+        # the artifact may be queued
+        self.flush(self.close_timeout)
+        return self.client.get_artifact_metadata(urn)
+
+    def gen_artifact_urn(self, namespace: str, name: str) -> Optional[str]:
+        return self.client.gen_artifact_urn(namespace, name)
+
+    def register_batch(self, records: List[Dict[str, Any]]) -> None:
+        self.client.register_batch(records)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the queued registrations are registered (or spilled)
+
+        Args:
+            timeout: maximum seconds to wait, None for no limit
+
+        Returns:
+            whether the queue is empty
+        """
+        with self.cond:
+            self.flushes += 1
+            self.cond.notify_all()
+            try:
+                return self.cond.wait_for(
+                    lambda: not self.queue and not self.in_flight, timeout)
+            finally:
+                self.flushes -= 1
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Flush the queued registrations and stop the background thread,
+        registrations not flushed in time are spilled (or dropped without
+        spill directory). Later registrations are synchronous
+
+        Args:
+            timeout: maximum seconds to wait, close_timeout by default
+        """
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(self.close_timeout if timeout is None
+                             else timeout)
+        with self.cond:
+            records, self.queue = self.queue, []
+        if records:
+            if self.spill_dir is not None:
+                self._spill(records)
+            else:
+                logger.warning("%s lineage registrations are dropped",
+                               len(records))
+
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _enqueue(self, record):
+        with self.cond:
+            if self.closed:
+                return False
+            if len(self.queue) >= self.max_queue:
+                if self.spill_dir is not None:
+                    records, self.queue = self.queue + [record], []
+                    self._spill(records)
+                    return True
+                self.cond.wait_for(lambda: len(self.queue) < self.max_queue
+                                   or self.closed)
+                if self.closed:
+                    return False
+            if not self.queue:
+                self.oldest = time.monotonic()
+            self.queue.append(record)
+            self._start()
+            if len(self.queue) >= self.batch_size:
+                self.cond.notify_all()
+        return True
+
+    def _next_batch(self):
+        # None for stopping the thread, an empty batch for replaying spills
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                wait = self.retry_at - now
+                if wait > 0 and self.closed and self.spill_dir is not None:
+                    # the service is failing, spill the queue when closed
+                    return None
+                if wait <= 0:
+                    if self.queue:
+                        wait = self.oldest + self.flush_interval - now
+                        if self.closed or self.flushes or wait <= 0 or \
+                                len(self.queue) >= self.batch_size:
+                            break
+                    elif self.closed:
+                        return None
+                    elif self.spill_pending:
+                        break
+                    else:
+                        wait = None
+                self.cond.wait(wait)
+            batch = self.queue[:self.batch_size]
+            del self.queue[:self.batch_size]
+            self.oldest = now
+            self.in_flight = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if batch:
+                self._register(batch)
+            else:
+                self._replay()
+            with self.cond:
+                self.in_flight = 0
+                self.cond.notify_all()
+
+    def _register(self, batch):
+        try:
+            self.client.register_batch(batch)
+        except Exception as e:
+            self._fail(len(batch), e)
+            if self.spill_dir is not None:
+                self._spill(batch)
+            else:
+                with self.cond:
+                    self.queue[:0] = batch
+        else:
+            with self.cond:
+                self.failures = 0
+                self.stats["registered"] += len(batch)
+                self.stats["batches"] += 1
+
+    def _fail(self, n, e):
+        logger.warning("Failed to register %s lineage records: %s", n, e)
+        with self.cond:
+            self.failures += 1
+            self.stats["failures"] += 1
+            self.retry_at = time.monotonic() + min(
+                self.flush_interval * 2 ** self.failures, 30)
+
+    def _spill(self, records):
+        name = "%d-%s" % (time.time() * 1e6, uuid.uuid4().hex)
+        self._write_spill(os.path.join(self.spill_dir, name + ".jsonl"),
+                          records)
+        logger.debug("Spilled %s lineage records to %s", len(records), name)
+        with self.cond:
+            self.stats["spilled"] += len(records)
+            self.spill_pending = True
+            self.cond.notify_all()
+
+    def _write_spill(self, path, records):
+        with open(path + ".tmp", "w") as f:
+            for record in records:
+                f.write(jsonpickle.dumps(record) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def _replay(self):
+        with self.cond:
+            self.spill_pending = False
+        for name in sorted(os.listdir(self.spill_dir)):
+            if not name.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.spill_dir, name)
+            # claim the file, other processes may replay the same directory
+            claimed = "%s.%s" % (path, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, "r") as f:
+                records = [jsonpickle.loads(line) for line in f
+                           if line.strip()]
+            for i in range(0, len(records), self.batch_size):
+                try:
+                    self.client.register_batch(records[i:i + self.batch_size])
+                except Exception as e:
+                    self._fail(len(records) - i, e)
+                    self._write_spill(path, records[i:])
+                    os.remove(claimed)
+                    with self.cond:
+                        self.spill_pending = True
+                    return
+                with self.cond:
+                    self.failures = 0
+                    self.stats["batches"] += 1
+            os.remove(claimed)
+            with self.cond:
+                self.stats["replayed"] += len(records)
+                if self.queue:
+                    # give way to fresh registrations
+                    self.spill_pending = True
+                    return
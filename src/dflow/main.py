@@ -5,6 +5,7 @@ from typing import List, Optional
 
 from dflow import (S3Artifact, Secret, Workflow, config, download_artifact,
                    gen_code, query_workflows, upload_artifact)
+from dflow.snapshot import SnapshotStore, snapshot_phases
 
 
 def main_parser():
@@ -277,6 +278,40 @@ def main_parser():
         help="key in the secret",
     )
 
+    parser_snapshot = subparsers.add_parser(
+        "snapshot",
+        help="Export or import snapshots of succeeded workflows",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    snapshot_subparsers = parser_snapshot.add_subparsers(
+        title="Valid actions", dest="action")
+    parser_export = snapshot_subparsers.add_parser(
+        "export",
+        help="Export the snapshot of a workflow",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser_export.add_argument("ID", help="the workflow ID.")
+    parser_export.add_argument(
+        "-u",
+        "--uid",
+        type=str,
+        default=None,
+        help="the workflow UID",
+    )
+    parser_export.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="output file, <ID>.json.gz by default",
+    )
+    parser_import = snapshot_subparsers.add_parser(
+        "import",
+        help="Import the snapshot of a workflow",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser_import.add_argument("FILE", help="the snapshot file")
+
     parser_codegen = subparsers.add_parser(
         "codegen",
         help="Generate code from graph",
@@ -507,6 +542,26 @@ def main():
             s = Secret(args.value, args.name, args.key)
             print("Secret (name: %s, key: %s) created" % (s.secret_name,
                                                           s.secret_key))
+    elif args.command == "snapshot":
+        if config["snapshot_dir"] is None:
+            config["snapshot_dir"] = "~/.dflow/snapshots"
+        store = SnapshotStore()
+        if args.action == "export":
+            wf = Workflow(id=args.ID, uid=args.uid)
+            uid = wf.uid
+            if store.load(wf.namespace, wf.id, uid) is None:
+                info = wf.query()
+                phase = info.status.phase
+                assert phase in snapshot_phases, \
+                    "Workflow %s is %s, not succeeded" % (wf.id, phase)
+                uid = info.metadata.uid
+            output = args.output if args.output is not None else \
+                "%s.json.gz" % args.ID
+            store.export(wf.namespace, wf.id, uid, output)
+            print("Exported snapshot to %s" % output)
+        elif args.action == "import":
+            path = store.import_(args.FILE)
+            print("Imported snapshot to %s" % path)
     elif args.command == "codegen":
         with open(args.GRAPH, "r") as f:
             graph = json.load(f)
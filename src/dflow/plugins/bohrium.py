@@ -1,5 +1,9 @@
+import base64
 import json
+import logging
 import os
+import threading
+import time
 from copy import deepcopy
 from getpass import getpass
 from typing import Optional
@@ -14,6 +18,8 @@ from ..utils import StorageClient, randstr
 from ..workflow import Workflow
 from .dispatcher import DispatcherArtifact
 
+logger = logging.getLogger(__name__)
+
 succ_code = [0, "0000"]
 config = {
     "bohrium_url": os.environ.get("BOHRIUM_BOHRIUM_URL",
@@ -32,9 +38,156 @@ config = {
     "openapi_url": os.environ.get("BOHRIUM_OPENAPI_URL",
                                   "https://openapi.dp.tech"),
     "app_key": os.environ.get("BOHRIUM_APP_KEY"),
+    "pool_maxsize": int(os.environ.get("BOHRIUM_POOL_MAXSIZE", 32)),
+    "token_ttl": float(os.environ["BOHRIUM_TOKEN_TTL"])
+    if os.environ.get("BOHRIUM_TOKEN_TTL") else None,
+    "token_refresh_margin": float(os.environ.get(
+        "BOHRIUM_TOKEN_REFRESH_MARGIN", 300)),
 }
 
 
+class BohriumSession:
+    """
+    Pooled HTTP session for Bohrium and Tiefblue APIs, with request metrics
+
+    Connections are kept in one adapter shared by all threads, each call
+    uses a light requests.Session mounting it so that headers are never
+    shared between threads.
+
+    Args:
+        pool_maxsize: maximum number of connections kept per host
+    """
+
+    def __init__(self, pool_maxsize: Optional[int] = None) -> None:
+        import requests
+
+        class MeteredAdapter(requests.adapters.HTTPAdapter):
+            def send(adapter, request, **kwargs):
+                start = time.monotonic()
+                error = False
+                try:
+                    rsp = super().send(request, **kwargs)
+                    error = rsp.status_code >= 400
+                    return rsp
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    self.record(request.method, request.path_url,
+                                time.monotonic() - start, error)
+
+        if pool_maxsize is None:
+            pool_maxsize = config["pool_maxsize"]
+        self.adapter = MeteredAdapter(pool_maxsize=pool_maxsize)
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def session(self):
+        import requests
+        session = requests.Session()
+        session.mount("http://", self.adapter)
+        session.mount("https://", self.adapter)
+        return session
+
+    def request(self, method, url, **kwargs):
+        return self.session().request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def record(self, method, path, latency, error=False):
+        # strip the query and the object key of Tiefblue APIs
+        name = "%s %s" % (method, "/".join(path.split("?")[0].split(
+            "/")[:3]))
+        with self.lock:
+            self.count += 1
+            self.errors += int(error)
+            self.total_time += latency
+            self.max_time = max(self.max_time, latency)
+            endpoint = self.endpoints.setdefault(
+                name, {"count": 0, "errors": 0, "total_time": 0.0})
+            endpoint["count"] += 1
+            endpoint["errors"] += int(error)
+            endpoint["total_time"] += latency
+
+    def stats(self):
+        """
+        Request counts and latencies in seconds, in total and by endpoint
+        """
+        with self.lock:
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "total_time": self.total_time,
+                "mean_time": self.total_time / self.count if self.count
+                else 0.0,
+                "max_time": self.max_time,
+                "endpoints": deepcopy(self.endpoints),
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.count = 0
+            self.errors = 0
+            self.total_time = 0.0
+            self.max_time = 0.0
+            self.endpoints = {}
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Get the Bohrium session shared in the process"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = BohriumSession()
+    return _session
+
+
+def _token_expiry(token):
+    # the expiry of a JWT, without verifying it
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+_client_class = None
+
+
+def _tiefblue_client(base_url, token):
+    """Tiefblue client sending its requests through the shared session"""
+    global _client_class
+    try:
+        import tiefblue
+    except Exception:
+        raise RuntimeError("Please install lbg utility by "
+                           "`pip install -U lbg`")
+    if _client_class is None:
+        class PooledClient(tiefblue.Client):
+            def _session(self, header_param=None):
+                header = {}
+                if self._token:
+                    header["Authorization"] = "Bearer %s" % self._token
+                if header_param is not None:
+                    header[self.TIEFBLUE_HEADER_KEY] = self._dump_parameter(
+                        header_param)
+                session = get_session().session()
+                session.headers = header
+                return session
+        _client_class = PooledClient
+    return _client_class(base_url=base_url, token=token)
+
+
 def _raise_error(res, op):
     if res["code"] not in succ_code:
         if "error" in res:
@@ -78,7 +231,6 @@ def update_headers():
 
 
 def _login(login_url=None, username=None, phone=None, password=None):
-    import requests
     if username is None and phone is None:
         username = input("Bohrium email: ")
         if not username:
@@ -91,15 +243,14 @@ def _login(login_url=None, username=None, phone=None, password=None):
         "phone": phone,
         "password": password,
     }
-    rsp = requests.post(login_url, headers={
-                        "Content-type": "application/json"}, json=data)
+    rsp = get_session().post(login_url, headers={
+        "Content-type": "application/json"}, json=data)
     res = json.loads(rsp.text)
     _raise_error(res, "login")
     return res["data"]["token"]
 
 
 def create_job_group(job_group_name):
-    import requests
     data = {
         "name": job_group_name,
     }
@@ -110,7 +261,7 @@ def create_job_group(job_group_name):
     }
     url = config["bohrium_url"] + "/brm/v1/job_group/add"
     if config["access_key"] is not None:
-        rsp = requests.get(
+        rsp = get_session().get(
             config["openapi_url"] + "/openapi/v1/ticket/get",
             headers={"x-app-key": config["app_key"]},
             params={"accessKey": config["access_key"]}
@@ -125,7 +276,7 @@ def create_job_group(job_group_name):
     else:
         authorization = login()
         headers["Authorization"] = "Bearer " + authorization
-    rsp = requests.post(url, headers=headers, json=data)
+    rsp = get_session().post(url, headers=headers, json=data)
     res = json.loads(rsp.text)
     _raise_error(res, "get job group id")
     return res["data"]["groupId"]
@@ -246,6 +397,16 @@ class BohriumContext(Context):
 
 
 class TiefblueClient(StorageClient):
+    """
+    Storage client of Tiefblue
+
+    The storage token is refreshed ahead of its expiry (from the JWT, or
+    config["token_ttl"] after it is obtained), and once more on an expired
+    token error. One Tiefblue client is kept per token and requests go
+    through the shared BohriumSession, so that the client can be used from
+    multiple threads.
+    """
+
     def __init__(
             self,
             bohrium_url: Optional[str] = None,
@@ -292,8 +453,13 @@ class TiefblueClient(StorageClient):
         self.openapi_url = openapi_url if openapi_url is not None else \
             config["openapi_url"]
         self.app_key = app_key if app_key is not None else config["app_key"]
+        self.lock = threading.RLock()
+        self.token_expiry = None
+        self._client = None
         if self.token is None:
             self.get_token()
+        else:
+            self.token_expiry = _token_expiry(self.token)
         s3_config["repo_type"] = "oss"
         s3_config["prefix"] = self.prefix
         if self.sharePath:
@@ -313,9 +479,18 @@ class TiefblueClient(StorageClient):
 
     def __setstate__(self, d):
         self.__dict__.update(d)
+        self.lock = threading.RLock()
+        self.token_expiry = _token_expiry(self.token)
+        self._client = None
 
     def get_token(self, retry=1):
-        import requests
+        with self.lock:
+            self._get_token(retry)
+            self.token_expiry = _token_expiry(self.token)
+            if self.token_expiry is None and config["token_ttl"] is not None:
+                self.token_expiry = time.time() + config["token_ttl"]
+
+    def _get_token(self, retry=1):
         url = self.bohrium_url + "/brm/v1/storage/token"
         headers = {
             "Content-type": "application/json",
@@ -324,7 +499,7 @@ class TiefblueClient(StorageClient):
             "projectId": self.project_id,
         }
         if self.access_key is not None:
-            rsp = requests.get(
+            rsp = get_session().get(
                 self.openapi_url + "/openapi/v1/ticket/get",
                 headers={"x-app-key": self.app_key},
                 params={"accessKey": self.access_key}
@@ -342,11 +517,11 @@ class TiefblueClient(StorageClient):
                 self.authorization = login(
                     self.username, self.phone, self.password, self.bohrium_url)
             headers["Authorization"] = "Bearer " + self.authorization
-        rsp = requests.get(url, headers=headers, params=params)
+        rsp = get_session().get(url, headers=headers, params=params)
         if not rsp.text:
             if retry > 0:
                 self.authorization = None
-                self.get_token(retry=retry-1)
+                self._get_token(retry=retry-1)
                 return
             raise RuntimeError("Bohrium unauthorized")
         res = json.loads(rsp.text)
@@ -356,112 +531,73 @@ class TiefblueClient(StorageClient):
         self.sharePath = res["data"]["sharePath"]
         self.userSharePath = res["data"]["userSharePath"]
 
-    def upload(self, key, path):
-        try:
-            import tiefblue
-        except Exception:
-            raise RuntimeError("Please install lbg utility by "
-                               "`pip install -U lbg`")
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
+    def refresh_token(self, expired=None):
+        """
+        Get a new token, unless the expired one has been replaced by
+        another thread meanwhile
+        """
+        with self.lock:
+            if expired is None or self.token == expired:
+                self.get_token()
+
+    def client(self):
+        """The Tiefblue client of the current token, refreshed if due"""
+        with self.lock:
+            if self.token_expiry is not None and time.time() > \
+                    self.token_expiry - config["token_refresh_margin"]:
+                try:
+                    self.refresh_token(self.token)
+                except Exception:
+                    logger.warning("Failed to refresh the storage token "
+                                   "ahead of its expiry", exc_info=True)
+                    # rely on the expired token error from now on
+                    self.token_expiry = None
+            if self._client is None or self._client._token != self.token:
+                self._client = _tiefblue_client(self.tiefblue_url,
+                                                self.token)
+            return self._client
+
+    def call(self, method, *args, **kwargs):
+        import tiefblue
+        client = self.client()
         try:
-            client.upload_from_file(
-                key, path, progress_bar=config["upload_progress"])
+            return getattr(client, method)(*args, **kwargs)
         except tiefblue.client.TiefblueException as e:
-            if e.code == 190001:
-                self.get_token()
-                client = tiefblue.Client(base_url=self.tiefblue_url,
-                                         token=self.token)
-                client.upload_from_file(
-                    key, path, progress_bar=config["upload_progress"])
-            else:
+            if e.code != 190001:
                 raise e
+            self.refresh_token(client._token)
+            return getattr(self.client(), method)(*args, **kwargs)
+
+    def upload(self, key, path):
+        self.call("upload_from_file", key, path,
+                  progress_bar=config["upload_progress"])
 
     def download(self, key, path):
-        try:
-            import tiefblue
-        except Exception:
-            raise RuntimeError("Please install lbg utility by "
-                               "`pip install -U lbg`")
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        try:
-            client.download_from_file(key, path)
-        except tiefblue.client.TiefblueException as e:
-            if e.code == 190001:
-                self.get_token()
-                client = tiefblue.Client(base_url=self.tiefblue_url,
-                                         token=self.token)
-                client.download_from_file(key, path)
-            else:
-                raise e
+        self.call("download_from_file", key, path)
 
     def list(self, prefix, recursive=False):
-        try:
-            import tiefblue
-        except Exception:
-            raise RuntimeError("Please install lbg utility by "
-                               "`pip install -U lbg`")
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
-        keys = []
+        return list(self.iter_list(prefix, recursive))
+
+    def iter_list(self, prefix, recursive=False):
         next_token = ""
         while True:
-            try:
-                res = client.list(prefix=prefix, recursive=recursive,
-                                  next_token=next_token)
-            except tiefblue.client.TiefblueException as e:
-                if e.code == 190001:
-                    self.get_token()
-                    client = tiefblue.Client(base_url=self.tiefblue_url,
-                                             token=self.token)
-                    res = client.list(prefix=prefix, recursive=recursive,
-                                      next_token=next_token)
-                else:
-                    raise e
+            res = self.call("list", prefix=prefix, recursive=recursive,
+                            next_token=next_token)
             for obj in res["objects"]:
                 if (recursive or obj["path"] == prefix) and \
                         obj["path"].endswith("/"):
                     continue
-                keys.append(obj["path"])
+                yield obj["path"]
             if not res["hasNext"]:
                 break
             next_token = res["nextToken"]
-        return keys
 
     def copy(self, src, dst):
-        try:
-            import tiefblue
-        except Exception:
-            raise RuntimeError("Please install lbg utility by "
-                               "`pip install -U lbg`")
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
-        try:
-            client.copy(src, dst)
-        except tiefblue.client.TiefblueException as e:
-            if e.code == 190001:
-                self.get_token()
-                client = tiefblue.Client(base_url=self.tiefblue_url,
-                                         token=self.token)
-                client.copy(src, dst)
-            else:
-                raise e
+        self.call("copy", src, dst)
 
     def get_md5(self, key):
-        try:
-            import tiefblue
-        except Exception:
-            raise RuntimeError("Please install lbg utility by "
-                               "`pip install -U lbg`")
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
-        try:
-            meta = client.meta(key)
-        except tiefblue.client.TiefblueException as e:
-            if e.code == 190001:
-                self.get_token()
-                client = tiefblue.Client(base_url=self.tiefblue_url,
-                                         token=self.token)
-                meta = client.meta(key)
-            else:
-                raise e
+        meta = self.call("meta", key)
         return meta["entityTag"] if "entityTag" in meta else ""
 
 
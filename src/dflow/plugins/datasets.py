@@ -24,13 +24,13 @@ global_config["artifact_register"]["launching+models"] = \
 
 
 def wait_for_mount(point, timeout=60):
-    for _ in range(timeout):
-        df_info = os.popen("df -h").read()
-        for line in df_info.splitlines()[1:]:
-            if line.split()[-1] == point:
-                return
-        time.sleep(1)
-    raise TimeoutError("Time out waiting for mounting on %s" % point)
+    deadline = time.monotonic() + timeout
+    interval = 0.05
+    while not os.path.ismount(point):
+        if time.monotonic() >= deadline:
+            raise TimeoutError("Time out waiting for mounting on %s" % point)
+        time.sleep(interval)
+        interval = min(interval * 2, 1)
 
 
 config = {
@@ -43,14 +43,20 @@ config = {
                                   "https://webdav.mlops.dp.tech"),
     "user": os.environ.get("DATASETS_USER"),
     "password": os.environ.get("DATASETS_PASSWORD"),
+    "cache_dir": os.environ.get("DATASETS_CACHE_DIR"),
 }
 
+# where the node-level cache is mounted in pods
+cache_mount_path = "/launching-cache"
+complete_tag = ".dflow-complete"
+
 
 class DatasetsArtifact(DispatcherArtifact):
     def __init__(self, element, version, type="datasets",
                  rclone_image=None, rclone_image_pull_policy=None,
                  rclone_type=None, ftp_host=None, webdav_host=None,
-                 user=None, password=None, rclone_kwargs=None, sub_path=None):
+                 user=None, password=None, rclone_kwargs=None, sub_path=None,
+                 cache_dir=None):
         self.element = element
         self.version = version
         self.type = type
@@ -91,6 +97,9 @@ class DatasetsArtifact(DispatcherArtifact):
         if rclone_kwargs is not None:
             self.rclone_kwargs.update(rclone_kwargs)
         self._sub_path = sub_path
+        if cache_dir is None:
+            cache_dir = config["cache_dir"]
+        self.cache_dir = cache_dir
 
     @classmethod
     def from_urn(cls, urn: str):
@@ -155,35 +164,69 @@ class DatasetsArtifact(DispatcherArtifact):
             machine.input_data["job_resources"] = []
         machine.input_data["job_resources"].append(self.get_bohrium_urn(name))
 
-    def download(self, name: str, path: str):
-        wait_for_mount("/launching/%s" % name)
+    @property
+    def cacheable(self):
+        # a version other than draft is immutable
+        return self.cache_dir is not None and self.version != "draft"
+
+    def get_cache_key(self) -> str:
+        return "%s/%s@%s" % (self.type, self.element, self.version)
+
+    def link(self, root: str, path: str):
         if self._sub_path is not None:
-            os.symlink("/launching/%s/%s" % (name, self._sub_path), path)
+            os.symlink("%s/%s" % (root, self._sub_path), path)
         else:
-            os.symlink("/launching/%s" % name, path)
+            os.symlink(root, path)
+
+    def download(self, name: str, path: str):
+        cached = "%s/%s" % (cache_mount_path, self.get_cache_key())
+        if os.path.exists("%s/%s" % (cached, complete_tag)):
+            self.link(cached, path)
+            return
+        wait_for_mount("/launching/%s" % name)
+        self.link("/launching/%s" % name, path)
 
     def remote_download(self, name: str, path: str):
+        if self.cacheable:
+            subprocess.run(self.get_cache_script(self.cache_dir), shell=True,
+                           check=True)
+            self.link("%s/%s" % (self.cache_dir, self.get_cache_key()), path)
+            return None
         cmd = self.get_mount_script("/launching/%s" % name)
         p = subprocess.Popen(cmd, shell=True, start_new_session=True)
         wait_for_mount("/launching/%s" % name)
-        if self._sub_path is not None:
-            os.symlink("/launching/%s/%s" % (name, self._sub_path), path)
-        else:
-            os.symlink("/launching/%s" % name, path)
+        self.link("/launching/%s" % name, path)
         return p.pid
 
     def bohrium_download(self, name: str, path: str):
         os.stat("/launching/%s" % name)
-        if self._sub_path is not None:
-            os.symlink("/launching/%s/%s" % (name, self._sub_path), path)
-        else:
-            os.symlink("/launching/%s" % name, path)
+        self.link("/launching/%s" % name, path)
 
-    def get_mount_script(self, path):
-        script = "rclone config create %s@%s %s %s" % (
+    def get_config_script(self):
+        return "rclone config create %s@%s %s %s" % (
             self.element, self.version, self.rclone_type,
             " ".join([k + " " + (str(v).lower() if isinstance(
                 v, bool) else str(v)) for k, v in self.rclone_kwargs.items()]))
+
+    def get_cache_script(self, root):
+        """
+        Script copying the dataset version into a cache directory once, the
+        first process holding the lock copies while others wait for it
+        """
+        path = "%s/%s" % (root, self.get_cache_key())
+        script = "mkdir -p %s && " % os.path.dirname(path)
+        script += "if [ ! -e %s/%s ]; then (flock 9 && " % (path, complete_tag)
+        script += "if [ ! -e %s/%s ]; then " % (path, complete_tag)
+        script += self.get_config_script()
+        script += " && rm -rf %s.partial %s" % (path, path)
+        script += " && rclone copy %s@%s: %s.partial" % (
+            self.element, self.version, path)
+        script += " && mv %s.partial %s && touch %s/%s; fi) 9>%s.lock; fi" % (
+            path, path, path, complete_tag, path)
+        return script
+
+    def get_mount_script(self, path):
+        script = self.get_config_script()
         script += " && mkdir -p %s" % path
         script += " && rclone mount %s@%s: %s" % (
             self.element, self.version, path)
@@ -191,6 +234,8 @@ class DatasetsArtifact(DispatcherArtifact):
 
     def render(self, template: PythonOPTemplate, name: str
                ) -> PythonOPTemplate:
+        if self.cacheable:
+            return self.render_cache(template, name)
         if "launching" not in [v.name for v in template.volumes]:
             template.volumes.append(V1Volume(
                 name="launching",
@@ -204,13 +249,6 @@ class DatasetsArtifact(DispatcherArtifact):
                 name="launching",
                 mount_path="/launching",
                 mount_propagation="HostToContainer"))
-        script = "rclone config create %s@%s %s %s" % (
-            self.element, self.version, self.rclone_type,
-            " ".join([k + " " + (str(v).lower() if isinstance(
-                v, bool) else str(v)) for k, v in self.rclone_kwargs.items()]))
-        script += " && mkdir -p /launching/%s" % name
-        script += " && rclone mount %s@%s: /launching/%s" % (
-            self.element, self.version, name)
         template.sidecars.append(V1alpha1UserContainer(
             name="rclone-%s" % name.replace("_", "-"),
             image=self.rclone_image,
@@ -226,3 +264,30 @@ class DatasetsArtifact(DispatcherArtifact):
         ))
         template.render_script()
         return template
+
+    def render_cache(self, template: PythonOPTemplate, name: str
+                     ) -> PythonOPTemplate:
+        """
+        Populate a read-only cache on the node with an init container
+        instead of mounting the dataset with FUSE in each pod
+        """
+        if "datasets-cache" not in [v.name for v in template.volumes]:
+            template.volumes.append(V1Volume(
+                name="datasets-cache",
+                host_path=V1HostPathVolumeSource(
+                    path=self.cache_dir, type="DirectoryOrCreate")))
+        if "datasets-cache" not in [m.name for m in template.mounts]:
+            template.mounts.append(V1VolumeMount(
+                name="datasets-cache", mount_path=cache_mount_path,
+                read_only=True))
+        template.init_containers.append(V1alpha1UserContainer(
+            name="rclone-cache-%s" % name.replace("_", "-"),
+            image=self.rclone_image,
+            image_pull_policy=self.rclone_image_pull_policy,
+            command=["sh", "-c"],
+            args=[self.get_cache_script(cache_mount_path)],
+            volume_mounts=[V1VolumeMount(name="datasets-cache",
+                                         mount_path=cache_mount_path)],
+        ))
+        template.render_script()
+        return template
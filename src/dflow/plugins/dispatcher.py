@@ -57,7 +57,11 @@ class DispatcherExecutor(Executor):
         podman_executable: podman executable to run remotely
         remote_root: remote root path for working
         retry_on_submission_error: max retries on submission error
-        merge_sliced_step: handle multi slices in a single dispatcher job
+        merge_sliced_step: batch the items of a sliced step into a single
+            dispatcher submission, each item runs as a task in its own
+            directory (group tasks into jobs by `group_size` of resources or
+            use job arrays by `batch_type` of machine), the exit code of each
+            item is reported in the output parameter `dflow_batch_results`
         terminate_grace_period: grace period in seconds after termination
             for collecting outputs
     """
@@ -357,33 +361,33 @@ class DispatcherExecutor(Executor):
                           self.docker_executable, self.singularity_executable,
                           self.podman_executable, args=self.container_args)
         task_dict["command"] = cmd
-        task_dict["forward_files"] = ["script"]
-        for art in template.inputs.artifacts.values():
-            task_dict["forward_files"].append("./" + art.path)
-        for par in template.inputs.parameters.values():
-            if par.save_as_artifact:
-                task_dict["forward_files"].append("./" + par.path)
         merge = self.merge_sliced_step and hasattr(template, "slices") and\
             template.slices is not None
         if merge:
-            assert not template.slices.sub_path, "sub_path mode of slices "\
-                "is incompatible with merge_sliced_step"
-            assert template.slices.group_size is None, "group_size of slices "\
-                "is incompatible with merge_sliced_step"
-            assert template.slices.pool_size is None, "pool_size of slices "\
-                "is incompatible with merge_sliced_step"
             sliced_output_parameters = template.slices.output_parameter.copy()
             if "dflow_success_tag" in template.outputs.parameters:
                 sliced_output_parameters.append("dflow_success_tag")
+            # item-dependent parameters are substituted per task in the pod
+            item_vars = {k: v for k, v in getattr(
+                template, "dflow_vars", {}).items() if "item" in k}
+            sub_path_artifacts = [
+                name for name in template.slices.input_artifact
+                if "dflow_%s_sub_path" % name in template.inputs.parameters]
+            # download the whole artifact, each task links its sub path
+            for name in sub_path_artifacts:
+                new_template.inputs.artifacts[name].path = \
+                    "%s/inputs/artifacts/%s" % (template.tmp_root, name)
+        task_dict["forward_files"] = ["script"]
+        for art in new_template.inputs.artifacts.values():
+            task_dict["forward_files"].append("./" + art.path)
+        for par in template.inputs.parameters.values():
+            if par.save_as_artifact:
+                task_dict["forward_files"].append("./" + par.path)
         task_dict["backward_files"] = []
         for art in template.outputs.artifacts.values():
             task_dict["backward_files"].append("./" + art.path)
         for name, par in template.outputs.parameters.items():
-            if par.save_as_artifact:
-                task_dict["backward_files"].append(
-                    "./" + par.value_from_path)
-            elif par.value_from_path is not None and not (
-                    merge and sliced_output_parameters):
+            if par.save_as_artifact or par.value_from_path is not None:
                 task_dict["backward_files"].append(
                     "./" + par.value_from_path)
 
@@ -402,11 +406,16 @@ class DispatcherExecutor(Executor):
                 template.download_method = "remote_download"
             template.render_script()
             new_template.volumes = [v for v in new_template.volumes
-                                    if v.name not in ["launching", "dev-fuse"]]
+                                    if v.name not in ["launching", "dev-fuse",
+                                                      "datasets-cache"]]
             new_template.mounts = [m for m in new_template.mounts
-                                   if m.name != "launching"]
+                                   if m.name not in ["launching",
+                                                     "datasets-cache"]]
             new_template.sidecars = [s for s in new_template.sidecars
                                      if not s.name.startswith("rclone-")]
+            new_template.init_containers = [
+                c for c in new_template.init_containers or []
+                if not c.name.startswith("rclone-cache-")]
             new_template.script += handle_packages_script(
                 "./tmp/inputs/artifacts/dflow_python_packages")
             new_template.script += "from dflow import config\n"
@@ -420,6 +429,14 @@ class DispatcherExecutor(Executor):
             script = template.script
         # keep the script human-readable
         script = script.replace("\"\"\"", "'''")
+        if merge:
+            for v in item_vars.values():
+                script = script.replace("{{inputs.parameters.%s}}" % v,
+                                        "<dflow_batch:%s>" % v)
+            for name in sub_path_artifacts:
+                script = script.replace(
+                    "{{inputs.parameters.dflow_%s_sub_path}}" % name,
+                    "<dflow_batch:dflow_%s_sub_path>" % name)
         new_template.script += script
         new_template.script += "\"\"\")\n"
 
@@ -491,7 +508,6 @@ class DispatcherExecutor(Executor):
                 InputParameter(value=None)
             new_template.inputs.parameters["dflow_sequence_format"] = \
                 InputParameter(value="")
-            new_template.script += "from copy import deepcopy\n"
             new_template.script += "with open('script', 'r') as f:\n"
             new_template.script += "    script = f.read()\n"
             new_template.script += "tasks = []\n"
@@ -518,52 +534,75 @@ class DispatcherExecutor(Executor):
                 "\n"
             new_template.script += "    item_list = [format % i if format != "\
                 "'' else i for i in r]\n"
-            new_template.script += "forward_common_files = "\
-                "task.forward_files[1:]\n"
+            new_template.inputs.parameters["dflow_batch_sub_paths"] = \
+                InputParameter(value="{}")
+            new_template.script += "import re\n"
+            new_template.script += "sub_paths = json.loads(r'''{{inputs."\
+                "parameters.dflow_batch_sub_paths}}''')\n"
+            new_template.script += "def render_sub_path(sub_path, item):\n"
+            new_template.script += "    return re.sub(r'<item(\\.[^>]*)?>', "\
+                "lambda m: str(item[m.group(1)[1:]] if m.group(1) else item)"\
+                ", sub_path)\n"
+            new_template.script += "def link(src, dst):\n"
+            # hardlink shared inputs to be visible in containers, copy
+            # across devices
+            new_template.script += "    return 'if [ -e ../%s ]; then rm -rf "\
+                "%s && mkdir -p $(dirname %s) && (cp -al ../%s %s 2>/dev/null"\
+                " || cp -r ../%s %s); fi' % (src, dst, dst, src, dst, src, "\
+                "dst)\n"
+            new_template.script += "common_files = [os.path.normpath(f) for f"\
+                " in task.forward_files[1:]]\n"
             new_template.script += "for i, item in enumerate(item_list):\n"
-            new_template.script += "    new_task_dict = deepcopy(task."\
-                "serialize())\n"
+            new_template.script += "    task_dir = 'task.%06d' % i\n"
+            new_template.script += "    os.makedirs(task_dir, exist_ok=True)\n"
             new_template.script += "    new_script = script\n"
-            for k, v in new_template.dflow_vars.items():
-                if "item" in k:
-                    old = "'{{inputs.parameters.%s}}'" % v
-                    new = "item" if k == "{{item}}" else "item[%s]" % k[6:-2]
-                    new_template.script += "    new_script = new_script."\
-                        "replace(%s, %s if isinstance(%s, str) else "\
-                        "json.dumps(%s))\n" % (old, new, new, new)
-            for name in template.slices.output_parameter:
-                new_template.script += "    new_script = new_script.replace("\
-                    "\"handle_output_parameter('%s'\", "\
-                    "\"handle_output_parameter('%s_\" + str(i) + \"'\")\n" % (
-                        name, name)
-                path = template.outputs.parameters[name].value_from_path
-                new_template.script += "    os.makedirs(os.path.dirname("\
-                    "'./%s'), exist_ok=True)\n" % path
-                new_template.script += "    new_task_dict['backward_files']"\
-                    ".append('./%s_' + str(i))\n" % path
-            if "dflow_success_tag" in template.outputs.parameters:
+            for k, v in item_vars.items():
+                if k == "{{item}}":
+                    new = "item"
+                elif k.startswith("{{item."):
+                    new = "item[%s]" % repr(k[7:-2])
+                else:
+                    new = "item" + k[6:-2]
                 new_template.script += "    new_script = new_script.replace("\
-                    "'success_tag', 'success_tag_' + str(i))\n"
-                path = template.outputs.parameters[
-                    "dflow_success_tag"].value_from_path
-                new_template.script += "    os.makedirs(os.path.dirname("\
-                    "'./%s'), exist_ok=True)\n" % path
-                new_template.script += "    new_task_dict['backward_files']"\
-                    ".append('./%s_' + str(i))\n" % path
-            new_template.script += "    new_task_dict['backward_files']"\
-                ".append('log')\n"  # work around no Bohrium result file
-            new_template.script += "    with open('script' + str(i), 'w')"\
-                " as f:\n"
+                    "'<dflow_batch:%s>', %s if isinstance(%s, str) else "\
+                    "json.dumps(%s))\n" % (v, new, new, new)
+            new_template.script += "    links = [link(f, f) for f in "\
+                "common_files if os.path.basename(f) not in sub_paths or "\
+                "os.path.dirname(f) != 'tmp/inputs/artifacts']\n"
+            new_template.script += "    for name, sub_path in sub_paths."\
+                "items():\n"
+            new_template.script += "        sub_path = render_sub_path("\
+                "sub_path, item)\n"
+            new_template.script += "        src = 'tmp/inputs/artifacts/%s/"\
+                "%s' % (name, sub_path)\n"
+            new_template.script += "        dst = 'tmp/inputs/artifacts/%s' "\
+                "% name\n"
+            new_template.script += "        if name in %s:\n" % \
+                sub_path_artifacts
+            new_template.script += "            dst += '/' + sub_path\n"
+            new_template.script += "            new_script = new_script."\
+                "replace('<dflow_batch:dflow_%s_sub_path>' % name, sub_path)\n"
+            new_template.script += "        links.append(link(src, dst))\n"
+            new_template.script += "    with open(os.path.join(task_dir, "\
+                "'script'), 'w') as f:\n"
             new_template.script += "        f.write(new_script)\n"
-            new_template.script += "    new_task_dict['command'] = new_task_"\
-                "dict['command'].replace('script', 'script' + str(i))\n"
-            new_template.script += "    new_task_dict['forward_files'] = ["\
-                "'script' + str(i)]\n"
+            new_template.script += "    new_task_dict = task.serialize()\n"
+            new_template.script += "    new_task_dict['task_work_path'] = "\
+                "task_dir + '/'\n"
+            new_template.script += "    new_task_dict['forward_files'] = "\
+                "['script']\n"
+            # the exit code is recorded per item instead of failing the
+            # submission, outputs of a failed item are collected if any
+            new_template.script += "    new_task_dict['backward_files'] = "\
+                "['tmp/outputs', 'dflow_exit_code', 'log']\n"
+            new_template.script += "    new_task_dict['command'] = '(%s); "\
+                "echo $? > dflow_exit_code; mkdir -p tmp/outputs' % ' && '."\
+                "join(links + [task.command])\n"
             new_template.script += "    tasks.append(Task.load_from_dict("\
                 "new_task_dict))\n"
             new_template.script += "submission = Submission(work_base='.', "\
                 "machine=machine, resources=resources, task_list=tasks, "\
-                "forward_common_files=forward_common_files)\n"
+                "forward_common_files=common_files)\n"
         else:
             new_template.script += "submission = Submission(work_base='.', "\
                 "machine=machine, resources=resources, task_list=[task])\n"
@@ -596,20 +635,73 @@ class DispatcherExecutor(Executor):
         else:
             new_template.script += "submission.run_submission(clean=%s)\n" % \
                 self.clean
+        new_template.script_rendered = True
+
         if merge:
+            new_template.outputs.parameters["dflow_batch_results"] = \
+                OutputParameter(value_from_path="/tmp/outputs/parameters/"
+                                "dflow_batch_results", default="[]")
+            new_template.script += "import shutil\n"
+            new_template.script += "def merge_dir(src, dst):\n"
+            new_template.script += "    for dn, ds, fs in os.walk(src):\n"
+            new_template.script += "        target = os.path.join(dst, "\
+                "os.path.relpath(dn, src))\n"
+            new_template.script += "        os.makedirs(target, "\
+                "exist_ok=True)\n"
+            new_template.script += "        for f in fs:\n"
+            new_template.script += "            shutil.move(os.path.join(dn, "\
+                "f), os.path.join(target, f))\n"
+            new_template.script += "results = []\n"
+            for name in sliced_output_parameters:
+                new_template.script += "res_%s = []\n" % name
+            new_template.script += "for i, item in enumerate(item_list):\n"
+            new_template.script += "    task_dir = 'task.%06d' % i\n"
+            new_template.script += "    fname = os.path.join(task_dir, "\
+                "'dflow_exit_code')\n"
+            new_template.script += "    exit_code = None\n"
+            new_template.script += "    if os.path.isfile(fname):\n"
+            new_template.script += "        with open(fname, 'r') as f:\n"
+            new_template.script += "            exit_code = int(f.read())\n"
+            new_template.script += "    results.append({'item': item, "\
+                "'exit_code': exit_code})\n"
             for name in sliced_output_parameters:
                 path = template.outputs.parameters[name].value_from_path
-                new_template.script += "res = []\n"
-                new_template.script += "for i in range(len(item_list)):\n"
-                new_template.script += "    fname = './%s_' + str(i)\n" % path
+                new_template.script += "    fname = os.path.join(task_dir, "\
+                    "'./%s')\n" % path
                 new_template.script += "    if os.path.isfile(fname):\n"
                 new_template.script += "        with open(fname, 'r') as f:\n"
-                new_template.script += "            res.append(f.read())\n"
+                new_template.script += "            res_%s.append(f.read())\n"\
+                    % name
+                new_template.script += "    else:\n"
+                new_template.script += "        res_%s.append(None)\n" % name
+            new_template.script += "    merge_dir(os.path.join(task_dir, "\
+                "'tmp/outputs'), 'tmp/outputs')\n"
+            for name in sliced_output_parameters:
+                path = template.outputs.parameters[name].value_from_path
                 new_template.script += "with open('./%s', 'w') as f:\n" % path
-                new_template.script += "    f.write(json.dumps(res))\n"
-        new_template.script_rendered = True
-
-        if machine_dict["context_type"] == "Bohrium":
+                new_template.script += "    f.write(json.dumps(res_%s))\n" % \
+                    name
+            new_template.script += "os.makedirs('tmp/outputs/parameters', "\
+                "exist_ok=True)\n"
+            new_template.script += "with open('tmp/outputs/parameters/"\
+                "dflow_batch_results', 'w') as f:\n"
+            new_template.script += "    f.write(json.dumps(results))\n"
+            new_template.script += "failed = [r for r in results if "\
+                "r['exit_code'] != 0]\n"
+            new_template.script += "for r in failed:\n"
+            new_template.script += "    print('Item %s failed with exit code "\
+                "%s' % (r['item'], r['exit_code']))\n"
+            if "dflow_success_tag" not in template.outputs.parameters:
+                # the tasks always succeed for dispatcher, pass the exit
+                # codes of items through: a fatal error of any item (2) is
+                # not retried, other failures are transient (1)
+                new_template.script += "if failed:\n"
+                new_template.script += "    import sys\n"
+                new_template.script += "    print('%s of %s items failed' "\
+                    "% (len(failed), len(results)))\n"
+                new_template.script += "    sys.exit(2 if any(r['exit_code'] "\
+                    "== 2 for r in failed) else 1)\n"
+        elif machine_dict["context_type"] == "Bohrium":
             new_template.script += "for job in submission.belonging_jobs:\n" \
                 "    assert machine.get_exit_code(job) == 0\n"
         else:
@@ -1,12 +1,25 @@
+import argparse
 import inspect
+import json
+import logging
+import multiprocessing
 import os
 import shutil
-from typing import Union
+import socketserver
+import sys
+import threading
+import traceback
+from typing import Optional, Union
 
-from dp.launching.cli import to_runner
-from dp.launching.typing import BaseModel, Field
-from dp.launching.typing.io import InputFilePath, OutputDirectory
-from pydantic.main import ModelMetaclass
+try:
+    from dp.launching.cli import to_runner
+    from dp.launching.typing import BaseModel, Field
+    from dp.launching.typing.io import InputFilePath, OutputDirectory
+    from pydantic.main import ModelMetaclass
+    _launching_error = None
+except ImportError as e:
+    # not needed by the serve mode
+    _launching_error = e
 
 from dflow import (OPTemplate, S3Artifact, Step, Workflow, download_artifact,
                    upload_s3)
@@ -14,8 +27,18 @@ from dflow.python import OP, Artifact, BigParameter, Parameter
 from dflow.python.utils import (handle_input_artifact, handle_output_artifact,
                                 handle_output_parameter)
 
+logger = logging.getLogger(__name__)
+
+
+def _check_launching():
+    if _launching_error is not None:
+        raise ImportError("dp.launching is required to convert an OP to a "
+                          "parser: %s" % _launching_error) \
+            from _launching_error
+
 
 def OP_template_to_parser(templ: OPTemplate, version: str = "1.0.0"):
+    _check_launching()
     ns = {"output_dir": Field(default='./outputs', description='output dir'),
           "__annotations__": {"output_dir": OutputDirectory}}
     for name, par in templ.inputs.parameters.items():
@@ -71,6 +94,7 @@ def OP_template_to_parser(templ: OPTemplate, version: str = "1.0.0"):
 
 
 def python_OP_to_parser(op: OP, version: str = "1.0.0"):
+    _check_launching()
     ns = {"output_dir": Field(default='./outputs', description='output dir'),
           "__annotations__": {"output_dir": OutputDirectory}}
     for name, sign in op.get_input_sign().items():
@@ -96,26 +120,10 @@ def python_OP_to_parser(op: OP, version: str = "1.0.0"):
                                        (BaseModel,), ns)
 
     def op_runner(opts: OPOptions) -> int:
-        op_in = {}
-        for name, sign in op.get_input_sign().items():
-            if isinstance(sign, Artifact):
-                op_in[name] = handle_input_artifact(
-                    name, sign,
-                    path=os.path.abspath(getattr(opts, name).get_path()))
-            else:
-                op_in[name] = getattr(opts, name)
-        op_out = op.execute(op_in)
-        os.makedirs('outputs/parameters', exist_ok=True)
-        os.makedirs('outputs/artifacts', exist_ok=True)
-        for name, sign in op.get_output_sign().items():
-            value = op_out[name]
-            if isinstance(sign, Artifact):
-                if os.path.isdir('outputs/artifacts/%s' % name):
-                    shutil.rmtree('outputs/artifacts/%s' % name)
-                handle_output_artifact(name, value, sign, data_root=".")
-            else:
-                handle_output_parameter(name, value, sign, data_root=".")
-        return 0
+        return run_python_OP(op, {
+            name: getattr(opts, name).get_path()
+            if isinstance(sign, Artifact) else getattr(opts, name)
+            for name, sign in op.get_input_sign().items()})
 
     def to_parser():
         return to_runner(
@@ -126,6 +134,257 @@ def python_OP_to_parser(op: OP, version: str = "1.0.0"):
     return to_parser
 
 
+def run_python_OP(op: OP, options: dict) -> int:
+    """
+    Run a Python OP in the current directory, the outputs are written in
+    the outputs directory
+
+    Args:
+        op: the OP instance
+        options: input parameters, paths for input artifacts
+    """
+    op_in = {}
+    for name, sign in op.get_input_sign().items():
+        if isinstance(sign, Artifact):
+            op_in[name] = handle_input_artifact(
+                name, sign, path=os.path.abspath(options[name]))
+        else:
+            op_in[name] = options[name]
+    op_out = op.execute(op_in)
+    os.makedirs('outputs/parameters', exist_ok=True)
+    os.makedirs('outputs/artifacts', exist_ok=True)
+    for name, sign in op.get_output_sign().items():
+        value = op_out[name]
+        if isinstance(sign, Artifact):
+            if os.path.isdir('outputs/artifacts/%s' % name):
+                shutil.rmtree('outputs/artifacts/%s' % name)
+            handle_output_artifact(name, value, sign, data_root=".")
+        else:
+            handle_output_parameter(name, value, sign, data_root=".")
+    return 0
+
+
+# the OP of worker processes
+_worker_op = None
+
+
+def _init_worker(op):
+    global _worker_op
+    _worker_op = op
+
+
+def _load_request(line):
+    """
+    Load a request from a JSON line, return the request and None, or None
+    and the error response for a malformed line
+    """
+    try:
+        return json.loads(line), None
+    except ValueError:
+        return None, {"id": None, "code": 1, "error": traceback.format_exc()}
+
+
+def _execute_request(request, op=None):
+    if op is None:
+        op = _worker_op
+    response = {"id": request.get("id") if isinstance(request, dict)
+                else None}
+    cwd = os.getcwd()
+    try:
+        if not isinstance(request, dict):
+            raise ValueError("A request should be a JSON object, got %r"
+                             % (request,))
+        if not isinstance(request.get("options", {}), dict):
+            raise ValueError("Options of a request should be a JSON object")
+        workdir = os.path.abspath(request.get("workdir", "."))
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)
+        options = {}
+        for name, sign in op.get_input_sign().items():
+            if name in request.get("options", {}):
+                options[name] = request["options"][name]
+            elif hasattr(sign, "default"):
+                options[name] = sign.default
+            else:
+                raise ValueError("Missing option %s" % name)
+        response["code"] = run_python_OP(op, options)
+        parameters = {}
+        artifacts = {}
+        for name, sign in op.get_output_sign().items():
+            if isinstance(sign, Artifact):
+                artifacts[name] = os.path.join(
+                    workdir, "outputs", "artifacts", name)
+            else:
+                with open("outputs/parameters/%s" % name, "r") as f:
+                    parameters[name] = f.read()
+        response["outputs"] = {"parameters": parameters,
+                               "artifacts": artifacts}
+    except Exception:
+        response["code"] = 1
+        response["error"] = traceback.format_exc()
+    finally:
+        os.chdir(cwd)
+    return response
+
+
+class OPServer:
+    """
+    Long-lived worker keeping a Python OP imported, which executes
+    requests of JSON lines (from stdin or a Unix socket) in the same way as
+    the one-shot runner
+
+    A request is {"id": ..., "workdir": ..., "options": {...}}, where the
+    options are the input parameters and paths of input artifacts (relative
+    to the workdir). The OP is executed in the workdir and its outputs are
+    written in the outputs directory there. The response is {"id": ...,
+    "code": 0, "outputs": {"parameters": {...}, "artifacts": {...}}} with
+    the output parameters (as written in the outputs directory) and the
+    paths of output artifacts, or {"id": ..., "code": 1, "error": ...}
+    (with a null id for a malformed request)
+
+    Args:
+        op: the OP instance
+        workers: number of worker processes forked from the server (OPs
+            are executed in their workdirs, so concurrent requests run in
+            different processes), 1 for executing in the server process
+    """
+
+    def __init__(self, op: OP, workers: int = 1) -> None:
+        self.op = op
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def get_pool(self):
+        # forked on first use, after stdout is redirected
+        with self.lock:
+            if self.pool is None and self.workers > 1:
+                self.pool = multiprocessing.Pool(
+                    self.workers, initializer=_init_worker,
+                    initargs=(self.op,))
+            return self.pool
+
+    def handle(self, request: dict) -> dict:
+        """
+        Execute a request and return the response
+        """
+        pool = self.get_pool()
+        if pool is not None:
+            return pool.apply(_execute_request, (request,))
+        with self.lock:
+            return _execute_request(request, self.op)
+
+    def serve_stdio(self, input=None, output=None) -> None:
+        """
+        Serve requests from stdin until it is closed, responses are written
+        to stdout in the order of completion
+
+        Args:
+            input: file of requests, stdin by default
+            output: file of responses, stdout by default
+        """
+        if input is None:
+            input = sys.stdin
+        if output is None:
+            # other writes to stdout (e.g. prints of the OP) go to stderr
+            output = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+            sys.stdout.flush()
+            os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        write_lock = threading.Lock()
+
+        def respond(response):
+            with write_lock:
+                output.write(json.dumps(response) + "\n")
+                output.flush()
+
+        for line in input:
+            if not line.strip():
+                continue
+            request, error = _load_request(line)
+            if error is not None:
+                respond(error)
+                continue
+            pool = self.get_pool()
+            if pool is not None:
+                pool.apply_async(_execute_request, (request,),
+                                 callback=respond)
+            else:
+                respond(_execute_request(request, self.op))
+        self.close()
+
+    def serve_socket(self, path: str) -> None:
+        """
+        Serve requests from a Unix socket until interrupted, requests of a
+        connection are executed one by one, concurrent requests should use
+        several connections
+
+        Args:
+            path: path of the Unix socket
+        """
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    request, response = _load_request(line)
+                    if response is None:
+                        response = server.handle(request)
+                    self.wfile.write((json.dumps(response) + "\n").encode())
+                    self.wfile.flush()
+
+        if os.path.exists(path):
+            os.remove(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as srv:
+            srv.daemon_threads = True
+            logger.info("Serving %s on %s", self.op.__class__.__name__, path)
+            try:
+                srv.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(path)
+                self.close()
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+def OP_to_server(op: Union[OP, type], workers: int = 1,
+                 socket_path: Optional[str] = None):
+    """
+    Serve a Python OP by a long-lived worker, the returned function accepts
+    command line arguments "--workers" and "--socket" (serving stdin
+    without it) overriding the arguments here
+
+    Args:
+        op: the OP class or instance
+        workers: number of worker processes
+        socket_path: path of the Unix socket, None for stdin
+    """
+    if inspect.isclass(op) and issubclass(op, OP):
+        op = op()
+    elif not isinstance(op, OP):
+        raise ValueError("Only Python OP supported")
+
+    def to_server(argv=None):
+        parser = argparse.ArgumentParser(
+            description="Serve %s" % op.__class__.__name__)
+        parser.add_argument("--workers", type=int, default=workers)
+        parser.add_argument("--socket", default=socket_path)
+        args = parser.parse_args(argv)
+        server = OPServer(op, args.workers)
+        if args.socket is not None:
+            server.serve_socket(args.socket)
+        else:
+            server.serve_stdio()
+    return to_server
+
+
 def OP_to_parser(op: Union[OP, OPTemplate], version: str = "1.0.0"):
     if inspect.isclass(op) and issubclass(op, OP):
         return python_OP_to_parser(op(), version)
@@ -1,4 +1,6 @@
+import atexit
 import os
+import threading
 from typing import Dict, List, Optional, Union
 
 from dp.metadata import Dataset, MetadataContext
@@ -26,6 +28,9 @@ class MetadataClient(LineageClient):
         self.gms_endpoint = gms_endpoint
         self.project = project
         self.token = token
+        self.urn_context_manager = None
+        self.urn_context = None
+        self.lock = threading.Lock()
 
     def register_workflow(
             self,
@@ -47,18 +52,23 @@ class MetadataClient(LineageClient):
             tags: Optional[List[str]] = None,
             properties: Optional[Dict[str, str]] = None,
             **kwargs) -> str:
+        with MetadataContext(project=self.project, endpoint=self.gms_endpoint,
+                             token=self.token) as context:
+            return self._register_artifact(
+                context, namespace, name, uri, description, tags, properties)
+
+    def _register_artifact(self, context, namespace, name, uri,
+                           description="", tags=None, properties=None,
+                           **kwargs):
         if tags is None:
             tags = []
         if properties is None:
             properties = {}
-        with MetadataContext(project=self.project, endpoint=self.gms_endpoint,
-                             token=self.token) as context:
-            client = context.client
-            urn = Dataset.gen_urn(context, namespace, name)
-            ds = Dataset(urn=urn, display_name=name, uri=uri,
-                         description=description, tags=tags,
-                         properties=properties)
-            client.update_dataset(ds)
+        urn = Dataset.gen_urn(context, namespace, name)
+        ds = Dataset(urn=urn, display_name=name, uri=uri,
+                     description=description, tags=tags,
+                     properties=properties)
+        context.client.update_dataset(ds)
         return urn
 
     def register_task(
@@ -69,24 +79,29 @@ class MetadataClient(LineageClient):
             workflow_urn: str) -> Dict[str, str]:
         with MetadataContext(project=self.project, endpoint=self.gms_endpoint,
                              token=self.token) as context:
-            client = context.client
-            task = Task(task_name, workflow_urn)
-            job = client.prepare_job(task)
-            inputs = []
-            for urn in input_urns.values():
-                if isinstance(urn, list):
-                    inputs += urn
-                elif isinstance(urn, str):
-                    inputs.append(urn)
-            inputs = list(filter(lambda x: x != "", inputs))
-            run = client.begin_job(job, inputs=inputs)
-            output_urns = {}
-            for name, uri in output_uris.items():
-                urn = Dataset.gen_urn(context, task_name, name)
-                ds = Dataset(urn=urn, display_name=name, uri=uri)
-                client.update_dataset(ds)
-                output_urns[name] = urn
-            client.end_job(run, outputs=list(output_urns.values()))
+            return self._register_task(context, task_name, input_urns,
+                                       output_uris, workflow_urn)
+
+    def _register_task(self, context, task_name, input_urns, output_uris,
+                       workflow_urn):
+        client = context.client
+        task = Task(task_name, workflow_urn)
+        job = client.prepare_job(task)
+        inputs = []
+        for urn in input_urns.values():
+            if isinstance(urn, list):
+                inputs += urn
+            elif isinstance(urn, str):
+                inputs.append(urn)
+        inputs = list(filter(lambda x: x != "", inputs))
+        run = client.begin_job(job, inputs=inputs)
+        output_urns = {}
+        for name, uri in output_uris.items():
+            urn = Dataset.gen_urn(context, task_name, name)
+            ds = Dataset(urn=urn, display_name=name, uri=uri)
+            client.update_dataset(ds)
+            output_urns[name] = urn
+        client.end_job(run, outputs=list(output_urns.values()))
         return output_urns
 
     def get_artifact_metadata(self, urn: str) -> object:
@@ -95,3 +110,33 @@ class MetadataClient(LineageClient):
             client = context.client
             ds = client.get_dataset(urn)
         return ds
+
+    def gen_artifact_urn(self, namespace: str, name: str) -> str:
+        # URNs of buffered registrations are generated in the caller, so a
+        # context is kept for them rather than set up for each one
+        with self.lock:
+            if self.urn_context is None:
+                self.urn_context_manager = MetadataContext(
+                    project=self.project, endpoint=self.gms_endpoint,
+                    token=self.token)
+                self.urn_context = self.urn_context_manager.__enter__()
+                atexit.register(self.close)
+            return Dataset.gen_urn(self.urn_context, namespace, name)
+
+    def close(self) -> None:
+        """
+        Release the context kept for generating URNs
+        """
+        with self.lock:
+            if self.urn_context is not None:
+                self.urn_context_manager.__exit__(None, None, None)
+                self.urn_context_manager = None
+                self.urn_context = None
+
+    def register_batch(self, records: List[dict]) -> None:
+        # one context (and connection) for the whole batch
+        with MetadataContext(project=self.project, endpoint=self.gms_endpoint,
+                             token=self.token) as context:
+            for record in records:
+                getattr(self, "_" + record["method"])(
+                    context, **record["kwargs"])
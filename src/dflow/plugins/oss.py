@@ -4,7 +4,7 @@ from typing import Optional
 import oss2
 
 from ..config import s3_config
-from ..utils import StorageClient
+from ..utils import StorageClient, iter_list_sharded
 
 
 class OSSClient(StorageClient):
@@ -14,6 +14,7 @@ class OSSClient(StorageClient):
             bucket_name: Optional[str] = None,
             access_key_id: Optional[str] = None,
             access_key_secret: Optional[str] = None,
+            list_shard_workers: Optional[int] = None,
     ) -> None:
         if endpoint is None:
             endpoint = os.environ.get("OSS_ENDPOINT")
@@ -30,6 +31,7 @@ class OSSClient(StorageClient):
         auth = oss2.Auth(access_key_id, access_key_secret)
         bucket = oss2.Bucket(auth, endpoint, bucket_name)
         self.bucket = bucket
+        self.list_shard_workers = list_shard_workers
 
     def to_dict(self):
         retained_keys = ["endpoint", "bucket_name"]
@@ -54,33 +56,33 @@ class OSSClient(StorageClient):
         self.bucket.get_object_to_file(self.prefixing(key), path)
 
     def list(self, prefix, recursive=False):
+        return list(self.iter_list(prefix, recursive))
+
+    def _iter_list(self, prefix, recursive):
         prefix = self.prefixing(prefix)
-        keys = []
-        if recursive:
-            marker = ""
-            while True:
+        marker = ""
+        while True:
+            if recursive:
                 r = self.bucket.list_objects(prefix, marker=marker)
-                for obj in r.object_list:
-                    if not obj.key.endswith("/"):
-                        keys.append(self.unprefixing(obj.key))
-                if not r.is_truncated:
-                    break
-                marker = r.next_marker
-        else:
-            marker = ""
-            while True:
+            else:
                 r = self.bucket.list_objects(prefix, delimiter="/",
                                              marker=marker)
-                for obj in r.object_list:
-                    if obj.key == prefix and obj.key.endswith("/"):
-                        continue
-                    keys.append(self.unprefixing(obj.key))
+            for obj in r.object_list:
+                if obj.key.endswith("/") and (recursive or obj.key == prefix):
+                    continue
+                yield self.unprefixing(obj.key)
+            if not recursive:
                 for key in r.prefix_list:
-                    keys.append(self.unprefixing(key))
-                if not r.is_truncated:
-                    break
-                marker = r.next_marker
-        return keys
+                    yield self.unprefixing(key)
+            if not r.is_truncated:
+                break
+            marker = r.next_marker
+
+    def iter_list(self, prefix, recursive=False):
+        if recursive:
+            return iter_list_sharded(self._iter_list, prefix,
+                                     self.list_shard_workers)
+        return self._iter_list(prefix, recursive)
 
     def copy(self, src, dst):
         self.bucket.copy_object(self.bucket_name, self.prefixing(src),
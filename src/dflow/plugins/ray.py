@@ -1,5 +1,13 @@
+import io
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import time
 from copy import deepcopy
-from typing import Any, List, Optional, Union
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
 
 from dflow.executor import Executor
 from dflow.op_template import ScriptOPTemplate
@@ -12,6 +20,8 @@ try:
 except ImportError:
     pass
 
+logger = logging.getLogger(__name__)
+
 
 def _ray_init_container(main_image: str,
                         install_mirror: Union[bool, str, None] = None,
@@ -46,6 +56,271 @@ def _ray_init_container(main_image: str,
     )
 
 
+def _map_paths(obj, func):
+    if isinstance(obj, str):
+        return func(obj)
+    if isinstance(obj, Path):
+        return obj.__class__(func(str(obj)))
+    if isinstance(obj, list):
+        return [_map_paths(o, func) for o in obj]
+    if isinstance(obj, tuple):
+        return tuple(_map_paths(o, func) for o in obj)
+    if isinstance(obj, dict):
+        return {k: _map_paths(v, func) for k, v in obj.items()}
+    return obj
+
+
+def _list_paths(obj):
+    paths = []
+
+    def add(p):
+        if os.path.isabs(p) and os.path.lexists(p):
+            paths.append(p)
+        return p
+    _map_paths(obj, add)
+    return paths
+
+
+def _pack(paths, arcname=lambda p: p):
+    """Pack files or directories into an uncompressed tar in memory"""
+    if not paths:
+        return None
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tf:
+        for p in set(paths):
+            tf.add(p, arcname=arcname(p).lstrip("/"))
+    return buf.getvalue()
+
+
+def _unpack(data, root):
+    if data is None:
+        return
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r") as tf:
+        if hasattr(tarfile, "fully_trusted_filter"):
+            tf.extractall(root, filter="fully_trusted")
+        else:
+            tf.extractall(root)
+
+
+def _artifact_names(sign):
+    from dflow.python import Artifact
+    return [n for n, s in sign.items() if isinstance(s, Artifact)]
+
+
+# scratch roots of shared contexts unpacked in this worker process
+_slice_roots = {}
+
+
+def execute_slice_on_ray(context, sliced_input, slice_dir):
+    """
+    Execute a slice in a Ray worker
+
+    The context is passed wrapped in a list so that Ray does not resolve the
+    object reference, it is fetched and its shared files are unpacked only
+    once per worker process. Without a shared filesystem, the sliced input
+    files are unpacked into a scratch root, and the output files are packed
+    back with their paths mapped to the driver.
+    """
+    import ray
+
+    from dflow.python.utils import try_to_execute
+    ref = context[0]
+    key = ref.hex()
+    input, op_obj, output_sign, cwd, timeout, shared_fs, files = \
+        ray.get(ref)
+    input = deepcopy(input)
+    if shared_fs:
+        input.update(sliced_input)
+        output, error = try_to_execute(input, slice_dir, op_obj, output_sign,
+                                       cwd, timeout)
+        return output, error, None
+
+    if key not in _slice_roots:
+        root = tempfile.mkdtemp(prefix="dflow-ray-")
+        _unpack(files, root)
+        _slice_roots[key] = root
+    root = _slice_roots[key]
+    input_names = _artifact_names(op_obj.get_input_sign())
+    shared = set(root + p for name in input_names
+                 for p in _list_paths(input.get(name)))
+    sliced_input, files = sliced_input
+    _unpack(files, root)
+
+    def to_worker(p):
+        return root + p if os.path.isabs(p) else p
+
+    def to_driver(p):
+        return p[len(root):] if p.startswith(root + "/") else p
+
+    def remove(p):
+        if not p.startswith(root + "/") or p in shared:
+            return
+        if os.path.isdir(p) and not os.path.islink(p):
+            shutil.rmtree(p, ignore_errors=True)
+        elif os.path.lexists(p):
+            os.remove(p)
+    for name in input_names:
+        if input.get(name) is not None:
+            input[name] = _map_paths(input[name], to_worker)
+        if sliced_input.get(name) is not None:
+            sliced_input[name] = _map_paths(sliced_input[name], to_worker)
+    input.update(sliced_input)
+    os.makedirs(root + cwd, exist_ok=True)
+    output, error = try_to_execute(input, slice_dir, op_obj, output_sign,
+                                   root + cwd, timeout)
+    results = None
+    if output is not None:
+        paths = []
+        for name in _artifact_names(output_sign):
+            if output.get(name) is not None:
+                paths += _list_paths(output[name])
+                output[name] = _map_paths(output[name], to_driver)
+        results = _pack(paths, to_driver)
+        for p in paths:
+            remove(p)
+    # the inputs of this slice are no longer needed in the worker
+    for name in input_names:
+        for p in _list_paths(sliced_input.get(name)):
+            remove(p)
+    return output, error, results
+
+
+def run_slices_on_ray(input, sliced_inputs, slice_dirs, op_obj, output_sign,
+                      cwd, pool_size=None, timeout=None, start_method=None,
+                      chunksize=None, callback=None, deadline=None,
+                      num_cpus=None, num_gpus=None, memory=None,
+                      resources=None, max_in_flight=None, shared_fs=False):
+    """
+    Execute an OP on each slice of the inputs as Ray tasks, a drop-in
+    replacement of dflow.python.utils.run_slices
+
+    The unsliced inputs and their files are put in the object store once.
+    Without a shared filesystem, the files of each sliced input are shipped
+    with its task and the output files are streamed back as each task
+    completes. The Ray runtime (including the runtime env) is initialized
+    once by the caller and reused by all slices.
+
+    Args:
+        input: the OPIO of the whole inputs
+        sliced_inputs: names of sliced inputs
+        slice_dirs: working directory of each slice, or None
+        op_obj: the OP object
+        output_sign: output sign of the OP
+        cwd: current working directory
+        pool_size: ignored, see max_in_flight
+        timeout: timeout in seconds of each slice, the task is cancelled
+        start_method: ignored
+        chunksize: ignored
+        callback: called with (index, output, error) once a slice completes
+        deadline: timeout in seconds of all slices, slices not completed by
+            then are cancelled and fail with TimeoutError
+        num_cpus: CPUs required by each task
+        num_gpus: GPUs required by each task
+        memory: memory in bytes required by each task
+        resources: custom resources required by each task
+        max_in_flight: maximum number of submitted tasks not completed yet,
+            unlimited by default
+        shared_fs: the driver and the workers share the filesystem, paths
+            are passed as they are without shipping files
+    Returns:
+        list of outputs and list of errors, in the order of slices
+    """
+    import ray
+    n_slices = len(slice_dirs)
+    base = input.__class__({k: v for k, v in input.items()
+                            if k not in sliced_inputs})
+    lists = {name: list(input[name]) for name in sliced_inputs
+             if input[name] is not None}
+    input_names = _artifact_names(op_obj.get_input_sign())
+    files = None
+    if not shared_fs:
+        files = _pack(sum([_list_paths(base[name]) for name in input_names
+                           if base.get(name) is not None], []))
+    context = [ray.put((base, op_obj, output_sign, cwd, timeout, shared_fs,
+                        files))]
+    options = {}
+    if num_cpus is not None:
+        options["num_cpus"] = num_cpus
+    if num_gpus is not None:
+        options["num_gpus"] = num_gpus
+    if memory is not None:
+        options["memory"] = memory
+    if resources is not None:
+        options["resources"] = resources
+    # Retrying is left to the step, a slice raising is reported as an error
+    remote = ray.remote(execute_slice_on_ray).options(max_retries=0,
+                                                      **options)
+
+    def submit(i):
+        sliced_input = {name: lists[name][i] if name in lists else None
+                        for name in sliced_inputs}
+        if not shared_fs:
+            paths = sum([_list_paths(sliced_input[name]) for name in
+                         input_names if sliced_input.get(name) is not None],
+                        [])
+            sliced_input = (sliced_input, _pack(paths))
+        return remote.remote(context, sliced_input, slice_dirs[i])
+
+    output_list = [None] * n_slices
+    error_list = [None] * n_slices
+
+    def complete(i, output, error):
+        output_list[i] = output
+        error_list[i] = error
+        if callback is not None:
+            callback(i, output, error)
+
+    start = time.monotonic()
+    pending = iter(range(n_slices))
+    running = {}
+    while True:
+        while max_in_flight is None or len(running) < max_in_flight:
+            i = next(pending, None)
+            if i is None:
+                break
+            running[submit(i)] = (i, time.monotonic())
+        if not running:
+            break
+        now = time.monotonic()
+        wait_time = None
+        if timeout is not None:
+            wait_time = min(t + timeout for _, t in running.values()) - now
+        if deadline is not None:
+            wait_time = min(start + deadline - now, wait_time
+                            if wait_time is not None else deadline)
+        ready, _ = ray.wait(list(running), num_returns=1, timeout=max(
+            wait_time, 0) if wait_time is not None else None)
+        for ref in ready:
+            i, _ = running.pop(ref)
+            try:
+                output, error, results = ray.get(ref)
+                _unpack(results, "/")
+            except Exception as e:
+                output, error = None, e
+            complete(i, output, error)
+        now = time.monotonic()
+        if deadline is not None and now - start >= deadline:
+            cancelled = [i for i, _ in running.values()] + list(pending)
+            for ref in running:
+                ray.cancel(ref, force=True)
+            for i in cancelled:
+                complete(i, None, TimeoutError(
+                    "Slice %s cancelled by the deadline %ss" % (
+                        i, deadline)))
+            break
+        if timeout is not None:
+            for ref, (i, t) in list(running.items()):
+                if now - t < timeout:
+                    continue
+                logger.warning("Slice %s timed out after %ss, cancel its "
+                               "task" % (i, timeout))
+                ray.cancel(ref, force=True)
+                del running[ref]
+                complete(i, None, TimeoutError(
+                    "Slice %s timed out after %ss" % (i, timeout)))
+    return output_list, error_list
+
+
 class RayClusterExecutor(Executor):
 
     def __init__(
@@ -55,6 +330,13 @@ class RayClusterExecutor(Executor):
             workdir: str = '~/dflow/workflows/{{workflow.name}}/{{pod.name}}',
             ray_install_mirror=None,
             ray_dependencies: Optional[List[Any]] = None,
+            ray_slices: bool = False,
+            num_cpus: Optional[float] = None,
+            num_gpus: Optional[float] = None,
+            memory: Optional[int] = None,
+            resources: Optional[Dict[str, float]] = None,
+            max_in_flight: Optional[int] = None,
+            shared_fs: bool = False,
     ) -> None:
         """Ray cluster executor.
 
@@ -64,6 +346,18 @@ class RayClusterExecutor(Executor):
             workdir:
             ray_install_mirror:
             ray_dependencies: `py_modules` of ray.init(runtime_env={})
+            ray_slices: for a PythonOPTemplate with multiple slices per
+                step (Slices with pool_size), execute the slices as Ray
+                tasks dispatched by the pod instead of a local process
+                pool, dflow must be importable on the Ray workers
+            num_cpus: CPUs required by each slice task
+            num_gpus: GPUs required by each slice task
+            memory: memory in bytes required by each slice task
+            resources: custom resources required by each slice task
+            max_in_flight: maximum number of slice tasks submitted and not
+                completed yet, unlimited by default
+            shared_fs: the pod and the Ray workers share the filesystem,
+                slice files are not shipped through the object store
         """
         if ray_dependencies is None:
             ray_dependencies = []
@@ -72,6 +366,15 @@ class RayClusterExecutor(Executor):
         self.workdir = workdir
         self.ray_install_mirror = ray_install_mirror
         self.ray_dependencies = ray_dependencies
+        self.ray_slices = ray_slices
+        self.slice_options = {
+            "num_cpus": num_cpus,
+            "num_gpus": num_gpus,
+            "memory": memory,
+            "resources": resources,
+            "max_in_flight": max_in_flight,
+            "shared_fs": shared_fs,
+        }
 
     def render(self, template: ScriptOPTemplate):
         new_template = deepcopy(template)
@@ -106,7 +409,13 @@ class RayClusterExecutor(Executor):
                               "\n" \
                               + template.script
         # To locate the initialization of package path in `python_op_template`.
-        insert_index = new_template.script.find('from dflow import config')
+        insert_index = new_template.script.find(
+            'try:\n    from dflow.runtime import config')
+        if insert_index == -1:
+            insert_index = new_template.script.find(
+                'from dflow.runtime import config')
+        if insert_index == -1:
+            insert_index = new_template.script.find('from dflow import config')
         new_script = list(new_template.script)
         _dependencies_str = ','.join(item.__name__
                                      for item in self.ray_dependencies)
@@ -122,6 +431,13 @@ class RayClusterExecutor(Executor):
             f"{','.join(item.__name__ for item in self.ray_dependencies)}"
             ']})\n')
         new_template.script = ''.join(new_script)
+        if self.ray_slices:
+            new_template.script = new_template.script.replace(
+                "    from dflow.python.utils import run_slices\n",
+                "    from functools import partial\n"
+                "    from dflow.plugins.ray import run_slices_on_ray\n"
+                "    run_slices = partial(run_slices_on_ray, **%r)\n" %
+                self.slice_options)
         new_template.volumes.append(V1Volume(
             name='ray-python-packages', empty_dir=V1EmptyDirVolumeSource()))
         new_template.mounts.append(V1VolumeMount(
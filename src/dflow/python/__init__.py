@@ -1,8 +1,31 @@
-from .op import OP
+import importlib
+
+from .op import OP, FatalError, TransientError
 from .opio import (OPIO, Artifact, BigParameter, HDF5Datasets, NestedDict,
                    OPIOSign, Parameter)
-from .python_op_template import (FatalError, PythonOPTemplate, Slices,
-                                 TransientError, upload_packages)
+
+# OP templates are only needed when building workflows, import them on
+# first access (PEP 562)
+lazy_attributes = {
+    "PythonOPTemplate": "python_op_template",
+    "Slices": "python_op_template",
+    "upload_packages": "python_op_template",
+}
+
+
+def __getattr__(name):
+    if name in lazy_attributes:
+        module = importlib.import_module(".%s" % lazy_attributes[name],
+                                         __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(lazy_attributes))
+
 
 __all__ = ["OP", "OPIO", "Artifact", "BigParameter", "OPIOSign", "Parameter",
            "FatalError", "PythonOPTemplate", "Slices", "TransientError",
@@ -13,7 +13,6 @@ from importlib import import_module
 from pathlib import Path
 from typing import Any, Dict, List, Set, Union
 
-from ..argo_objects import ArgoObjectDict
 from ..config import config
 from ..context_syntax import GLOBAL_CONTEXT
 from ..io import (InputArtifact, InputParameter, OutputArtifact,
@@ -37,6 +36,14 @@ def get_source_code(o):
     return "".join(pre_lines + source_lines) + "\n"
 
 
+class TransientError(Exception):
+    pass
+
+
+class FatalError(Exception):
+    pass
+
+
 class OP(ABC):
     """
     Python class OP
@@ -89,6 +96,7 @@ class OP(ABC):
             s3_config["console"], s3_config["bucket_name"], encoded_key)
 
     def get_input_artifact_storage_key(self, name: str) -> str:
+        from ..argo_objects import ArgoObjectDict
         templ = json.loads(os.environ.get("ARGO_TEMPLATE"))
         art = next(filter(lambda x: x["name"] == name,
                           templ["inputs"]["artifacts"]))
@@ -99,6 +107,7 @@ class OP(ABC):
         return self._get_s3_link(key)
 
     def get_output_artifact_storage_key(self, name: str) -> str:
+        from ..argo_objects import ArgoObjectDict
         templ = json.loads(os.environ.get("ARGO_TEMPLATE"))
         art = next(filter(lambda x: x["name"] == name,
                           templ["outputs"]["artifacts"]))
@@ -1,4 +1,6 @@
+import io
 import json
+import shutil
 import tarfile
 from collections.abc import MutableMapping
 from pathlib import Path
@@ -34,45 +36,176 @@ class HDF5Dataset:
         return self
 
     def is_none(self):
-        return self.dataset.attrs.get("type") == "null"
+        return self.attrs.get("type") == "null"
 
-    def get_data(self):
+    def get_data(self, index=()):
+        """
+        Read the data, or only a part of it (e.g. index=slice(a, b)) for
+        array datasets
+        """
         if self.is_none():
             return None
-        data = self.dataset[()]
-        if self.dataset.attrs.get("dtype") == "utf-8":
+        data = self.dataset[index]
+        if self.attrs.get("dtype") == "utf-8":
+            if not isinstance(data, bytes):
+                # streamed text file
+                data = data.tobytes()
             data = data.decode("utf-8")
-        elif self.dataset.attrs.get("dtype") == "binary":
+        elif self.attrs.get("dtype") == "binary":
             data = data.tobytes()
         return data
 
+    def __getitem__(self, index):
+        return self.get_data(index)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def memmap(self):
+        """
+        Map a contiguous (neither chunked nor compressed) array dataset into
+        memory without reading it, return None if it cannot be mapped
+        """
+        dataset = self.dataset
+        offset = dataset.id.get_offset()
+        if offset is None or dataset.chunks is not None or \
+                dataset.dtype.hasobject or dataset.shape in [None, ()]:
+            return None
+        import numpy as np
+        return np.memmap(self.file.filename, dtype=dataset.dtype, mode="r",
+                         offset=offset, shape=dataset.shape)
+
+    @property
+    def attrs(self):
+        return self.dataset.attrs
+
+    def open(self):
+        """
+        Open a binary dataset as a file object, a streamed dataset (1-D
+        uint8 array) is read chunk by chunk
+        """
+        dataset = self.dataset
+        if dataset.shape is not None and len(dataset.shape) == 1 and \
+                dataset.dtype == "uint8":
+            return HDF5DatasetReader(dataset)
+        return io.BytesIO(self.get_data())
+
     def recover(self):
-        if self.dataset.attrs["type"] == "file":
-            path = Path(self.dataset.attrs["path"])
+        if self.attrs["type"] == "file":
+            path = Path(self.attrs["path"])
             if path.is_absolute():
                 path = path.relative_to(path.root)
             path.parent.mkdir(parents=True, exist_ok=True)
+            if self.attrs.get("dtype") == "binary":
+                with self.open() as src, open(path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                return path
             data = self.get_data()
             if isinstance(data, str):
                 path.write_text(data)
             elif isinstance(data, bytes):
                 path.write_bytes(data)
             return path
-        elif self.dataset.attrs["type"] == "dir":
-            path = Path(self.dataset.attrs["path"])
+        elif self.attrs["type"] == "dir":
+            path = Path(self.attrs["path"])
             if path.is_absolute():
                 path = path.relative_to(path.root)
             path.parent.mkdir(parents=True, exist_ok=True)
-            tgz_path = path.parent / (path.name + ".tgz")
-            tgz_path.write_bytes(self.get_data())
-            tf = tarfile.open(tgz_path, "r:gz")
-            tf.extractall(".")
-            tf.close()
+            with self.open() as f:
+                tf = tarfile.open(fileobj=f, mode="r|gz")
+                tf.extractall(".")
+                tf.close()
             return path
         else:
             return self.get_data()
 
 
+class HDF5DatasetReader(io.RawIOBase):
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self.dataset) - self.pos)
+        if n <= 0:
+            return 0
+        b[:n] = self.dataset[self.pos:self.pos+n].tobytes()
+        self.pos += n
+        return n
+
+
+class PackedHDF5Dataset(HDF5Dataset):
+    """
+    An item packed in the shared data of a HDF5 file with many small items
+    """
+
+    def __init__(self, file, key, start, end, attrs):
+        super().__init__(file, key)
+        self.start = start
+        self.end = end
+        self._attrs = attrs
+
+    @property
+    def dataset(self):
+        return self.file[packed_data_name]
+
+    @property
+    def attrs(self):
+        return self._attrs
+
+    def get_data(self, index=()):
+        if self.is_none():
+            return None
+        data = self.file[packed_data_name][self.start:self.end].tobytes()
+        if self.attrs.get("dtype") == "utf-8":
+            data = data.decode("utf-8")
+        if index != ():
+            data = data[index]
+        return data
+
+    def __len__(self):
+        return self.end - self.start
+
+    def open(self):
+        return io.BytesIO(self.file[packed_data_name][
+            self.start:self.end].tobytes())
+
+    def memmap(self):
+        return None
+
+
+packed_data_name = "dflow_packed_data"
+packed_keys_name = "dflow_packed_keys"
+packed_offsets_name = "dflow_packed_offsets"
+packed_attrs_name = "dflow_packed_attrs"
+packed_names = [packed_data_name, packed_keys_name, packed_offsets_name,
+                packed_attrs_name]
+
+
+def load_hdf5_datasets(f):
+    """
+    Index the datasets of a HDF5 file, including packed items
+
+    Args:
+        f: h5py.File object
+    Returns:
+        a dict from key to dataset
+    """
+    datasets = {k: HDF5Dataset(f, k) for k in f.keys()
+                if k not in packed_names}
+    if packed_keys_name in f:
+        keys = f[packed_keys_name].asstr()[()]
+        offsets = f[packed_offsets_name][()]
+        attrs = f[packed_attrs_name].asstr()[()]
+        for i, k in enumerate(keys):
+            datasets[k] = PackedHDF5Dataset(
+                f, k, int(offsets[i]), int(offsets[i+1]), json.loads(attrs[i]))
+    return datasets
+
+
 class HDF5Datasets:
     pass
 
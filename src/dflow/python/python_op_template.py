@@ -11,7 +11,7 @@ from ..io import (PVC, InputArtifact, InputParameter, Inputs, OutputArtifact,
                   OutputParameter, Outputs)
 from ..op_template import PythonScriptOPTemplate
 from ..utils import evalable_repr, randstr, s3_config
-from .op import OP, get_source_code
+from .op import OP, FatalError, TransientError, get_source_code  # noqa: F401
 from .opio import Artifact, BigParameter, Parameter
 
 try:
@@ -42,6 +42,13 @@ class Slices:
         pool_size: for multi slices per task/step, use a multiprocessing pool
             to handle each slice, 1 for serial, -1 for infinity (i.e. equals to
             the number of slices)
+        pool_timeout: timeout in seconds of each slice in the pool, a slice
+            exceeding it is killed and fails with TimeoutError
+        pool_deadline: timeout in seconds of all slices in the pool, slices
+            not completed by then fail with TimeoutError, and the step
+            completes with partial outputs
+        pool_start_method: start method of the pool processes, e.g. "fork",
+            "spawn" or "forkserver", default to the platform default
         register_first_only: only register first slice when lineage used
         create_dir: create a separate dir for each slice for saving output
             artifacts
@@ -61,6 +68,8 @@ class Slices:
             random_seed: int = 0,
             pool_size: Optional[int] = None,
             pool_timeout: Optional[int] = None,
+            pool_deadline: Optional[int] = None,
+            pool_start_method: Optional[str] = None,
             register_first_only: bool = False,
             create_dir: bool = False,
             raise_for_group: bool = False,
@@ -85,6 +94,8 @@ class Slices:
         self.random_seed = random_seed
         self.pool_size = pool_size
         self.pool_timeout = pool_timeout
+        self.pool_deadline = pool_deadline
+        self.pool_start_method = pool_start_method
         self.register_first_only = register_first_only
         self.create_dir = create_dir
         self.raise_for_group = raise_for_group
@@ -468,7 +479,12 @@ class PythonOPTemplate(PythonScriptOPTemplate):
                 "%s/inputs/artifacts/dflow_python_packages" % self.tmp_root)
 
         script += "import json\n"
-        script += "from dflow import config, jsonpickle, s3_config\n"
+        # images with an older dflow do not have dflow.runtime
+        script += "try:\n"
+        script += "    from dflow.runtime import config, jsonpickle, "\
+            "s3_config\n"
+        script += "except ImportError:\n"
+        script += "    from dflow import config, jsonpickle, s3_config\n"
         script += "config.update(jsonpickle.loads(r'''%s'''))\n" % \
             jsonpickle.dumps(config)
         script += "s3_config.update(jsonpickle.loads(r'''%s'''))\n" % \
@@ -502,11 +518,20 @@ class PythonOPTemplate(PythonScriptOPTemplate):
                         (class_name, cloudpickle.dumps(op_class))
 
         script += "\nimport os, sys, traceback\n"
-        script += "from dflow.python import OPIO, TransientError, FatalError\n"
-        script += "from dflow.python.utils import handle_input_artifact," \
-                  " handle_input_parameter\n"
-        script += "from dflow.python.utils import handle_output_artifact," \
-                  " handle_output_parameter, handle_lineage\n"
+        script += "try:\n"
+        script += "    from dflow.runtime import OPIO, TransientError, "\
+            "FatalError\n"
+        script += "    from dflow.runtime import handle_input_artifact, "\
+            "handle_input_parameter\n"
+        script += "    from dflow.runtime import handle_output_artifact, "\
+            "handle_output_parameter, handle_lineage\n"
+        script += "except ImportError:\n"
+        script += "    from dflow.python import OPIO, TransientError, "\
+            "FatalError\n"
+        script += "    from dflow.python.utils import handle_input_artifact, "\
+            "handle_input_parameter\n"
+        script += "    from dflow.python.utils import handle_output_artifact,"\
+            " handle_output_parameter, handle_lineage\n"
         if mod not in ["__main__", "__mp_main__"]:
             script += f"from {mod} import {class_name}\n\n"
         if hasattr(op_class, "func"):
@@ -524,11 +549,7 @@ class PythonOPTemplate(PythonScriptOPTemplate):
         script += "    input_sign = %s.get_input_sign()\n" % class_name
         script += "    output_sign = %s.get_output_sign()\n" % class_name
         if self.slices is not None and self.slices.pool_size is not None:
-            script += "    from dflow.python.utils import try_to_execute\n"
-            script += "    from functools import partial\n"
-            script += "    try_to_execute = partial(try_to_execute, "\
-                "op_obj=op_obj, output_sign=output_sign, cwd=os.getcwd(), "\
-                "timeout=%s)\n" % self.slices.pool_timeout
+            script += "    from dflow.python.utils import run_slices\n"
             script += "    from typing import List\n"
             script += "    from pathlib import Path\n"
             for name in self.slices.input_artifact:
@@ -626,14 +647,6 @@ class PythonOPTemplate(PythonScriptOPTemplate):
                 script += "            assert len(input['%s']) == n_slices\n" \
                     % name
             script += "    assert n_slices is not None\n"
-            script += "    input_list = []\n"
-            script += "    from copy import deepcopy\n"
-            script += "    for i in range(n_slices):\n"
-            script += "        input1 = deepcopy(input)\n"
-            for name in sliced_inputs:
-                script += "        input1['%s'] = list(input['%s'])[i] if "\
-                    "input['%s'] is not None else None\n" % (name, name, name)
-            script += "        input_list.append(input1)\n"
             if self.create_slice_dir:
                 if self.slices.sub_path and self.slices.group_size is not None:
                     slices = "input_slices"
@@ -644,26 +657,12 @@ class PythonOPTemplate(PythonScriptOPTemplate):
                     slices
             else:
                 script += "    slice_dirs = [None] * n_slices\n"
-            if self.slices.pool_size == 1:
-                script += "    output_list = []\n"
-                script += "    error_list = []\n"
-                script += "    for input, slice_dir in zip(input_list, "\
-                    "slice_dirs):\n"
-                script += "        output, error = try_to_execute(input, "\
-                    "slice_dir)\n"
-                script += "        output_list.append(output)\n"
-                script += "        error_list.append(error)\n"
-            else:
-                script += "    from multiprocessing import Pool\n"
-                if self.slices.pool_size == -1:
-                    script += "    pool = Pool(n_slices)\n"
-                else:
-                    script += "    pool = Pool(%s)\n" % \
-                        self.slices.pool_size
-                script += "    oe_list = pool.starmap(try_to_execute, "\
-                    "zip(input_list, slice_dirs))\n"
-                script += "    output_list = [oe[0] for oe in oe_list]\n"
-                script += "    error_list = [oe[1] for oe in oe_list]\n"
+            script += "    output_list, error_list = run_slices(input, %s, "\
+                "slice_dirs, op_obj, output_sign, os.getcwd(), pool_size=%s, "\
+                "timeout=%s, deadline=%s, start_method=%s)\n" % (
+                    sliced_inputs, self.slices.pool_size,
+                    self.slices.pool_timeout, self.slices.pool_deadline,
+                    repr(self.slices.pool_start_method))
             sliced_outputs = self.slices.output_artifact + \
                 self.slices.output_parameter
             script += "    output = OPIO()\n"
@@ -826,14 +825,6 @@ class PythonOPTemplate(PythonScriptOPTemplate):
         return cls(**graph)
 
 
-class TransientError(Exception):
-    pass
-
-
-class FatalError(Exception):
-    pass
-
-
 class PicklableFunctionOP:
     def __init__(self, op_class):
         self.__module__ = op_class.__module__
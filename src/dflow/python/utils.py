@@ -1,19 +1,28 @@
+import codecs
+import json
+import logging
 import os
 import shutil
 import signal
 import tarfile
+import time
 import traceback
 import uuid
+from copy import deepcopy
 from pathlib import Path
 from typing import Dict, List, Set, Union
 
 from ..common import jsonpickle
 from ..config import config
-from ..utils import (artifact_classes, assemble_path_object,
-                     catalog_of_local_artifact, convert_dflow_list, copy_file,
-                     expand, flatten, randstr, remove_empty_dir_tag)
+from ..utils import (PathList, artifact_classes, assemble_path_object,
+                     catalog_of_local_artifact, convert_dflow_list, expand,
+                     flatten, link, randstr, remove_empty_dir_tag, try_link)
 from .opio import (Artifact, BigParameter, HDF5Dataset, HDF5Datasets,
-                   NestedDict, Parameter)
+                   NestedDict, PackedHDF5Dataset, Parameter,
+                   load_hdf5_datasets, packed_attrs_name, packed_data_name,
+                   packed_keys_name, packed_offsets_name)
+
+logger = logging.getLogger(__name__)
 
 
 def get_slices(path_object, slices):
@@ -24,7 +33,7 @@ def get_slices(path_object, slices):
         for f in slices.split("."):
             if isinstance(tmp, dict):
                 tmp = tmp[f]
-            elif isinstance(tmp, list):
+            elif isinstance(tmp, (list, PathList)):
                 tmp = tmp[int(f)]
         return tmp
     elif isinstance(slices, list):
@@ -38,13 +47,8 @@ def handle_input_artifact(name, sign, slices=None, data_root="/tmp",
     root = None
     if n_parts is not None:
         path_object = []
-        for i in range(n_parts):
-            art_path = '%s/inputs/artifacts/dflow_%s_%s' % (data_root, name, i)
-            if config["detect_empty_dir"]:
-                remove_empty_dir_tag(art_path)
-            po = assemble_path_object(art_path)
-            if prefix is not None:
-                po = get_slices(po, prefix[i])
+        parts = assemble_parts(name, range(n_parts), data_root, prefix)
+        for art_path, po in parts:
             if not po:
                 path_object.append(art_path)
             elif isinstance(po, list):
@@ -53,13 +57,8 @@ def handle_input_artifact(name, sign, slices=None, data_root="/tmp",
                 path_object.append(po)
     elif keys_of_parts is not None:
         path_object = {}
-        for i in keys_of_parts:
-            art_path = '%s/inputs/artifacts/dflow_%s_%s' % (data_root, name, i)
-            if config["detect_empty_dir"]:
-                remove_empty_dir_tag(art_path)
-            po = assemble_path_object(art_path)
-            if prefix is not None:
-                po = get_slices(po, prefix[i])
+        parts = assemble_parts(name, keys_of_parts, data_root, prefix)
+        for i, (art_path, po) in zip(keys_of_parts, parts):
             if not po:
                 path_object[i] = art_path
             else:
@@ -75,16 +74,17 @@ def handle_input_artifact(name, sign, slices=None, data_root="/tmp",
             return None
         if config["detect_empty_dir"]:
             remove_empty_dir_tag(art_path)
-        path_object = assemble_path_object(art_path)
+        path_object = assemble_path_object(art_path, lazy=True)
         path_object = get_slices(path_object, prefix)
 
     sign_type = sign.type
     if getattr(sign_type, "__origin__", None) == Union:
         args = sign_type.__args__
         if HDF5Datasets in args:
-            if isinstance(path_object, list) and len(path_object) > 0 and all([
-                isinstance(p, str) and p.endswith(".h5")
-                    for p in path_object]):
+            if isinstance(path_object, (list, PathList)) and \
+                    len(path_object) > 0 and all([
+                        isinstance(p, str) and p.endswith(".h5")
+                        for p in path_object]):
                 sign_type = HDF5Datasets
             elif art_path.endswith(".h5"):
                 sign_type = HDF5Datasets
@@ -97,14 +97,14 @@ def handle_input_artifact(name, sign, slices=None, data_root="/tmp",
         import h5py
         if os.path.isfile(art_path):
             path_object = [art_path]
+        if isinstance(path_object, PathList):
+            path_object = path_object.tolist()
         assert isinstance(path_object, list)
         res = []
         for path in path_object:
             f = h5py.File(path, "r")
-            datasets = {}
-            for k in f.keys():
-                d = HDF5Dataset(f, k)
-                datasets[k] = None if d.is_none() else d
+            # only index keys here, datasets are read after slicing
+            datasets = load_hdf5_datasets(f)
             if set(datasets.keys()) == {str(i) for i in range(len(datasets))} \
                     and isinstance(res, list):
                 # concat when all datasets are lists
@@ -117,9 +117,12 @@ def handle_input_artifact(name, sign, slices=None, data_root="/tmp",
 
         if isinstance(res, dict):
             res = expand(res)
-        res = get_slices(res, slices)
+        res = resolve_hdf5_none(get_slices(res, slices))
     else:
         path_object = get_slices(path_object, slices)
+        if isinstance(path_object, PathList):
+            # only the sliced paths are joined
+            path_object = path_object.tolist()
 
     if sign_type in [str, Path]:
         if path_object is None or isinstance(path_object, str):
@@ -164,6 +167,41 @@ def handle_input_artifact(name, sign, slices=None, data_root="/tmp",
     return res
 
 
+def assemble_parts(name, parts, data_root="/tmp", prefix=None):
+    """
+    Assemble path objects of the parts of an input artifact concurrently
+
+    Returns:
+        list of (path, path object) of parts in order
+    """
+    def assemble(i):
+        art_path = '%s/inputs/artifacts/dflow_%s_%s' % (data_root, name, i)
+        if config["detect_empty_dir"]:
+            remove_empty_dir_tag(art_path)
+        po = assemble_path_object(art_path)
+        if prefix is not None:
+            po = get_slices(po, prefix[i])
+        return art_path, po
+
+    parts = list(parts)
+    if len(parts) <= 1:
+        return list(map(assemble, parts))
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(min(
+            config["catalog_pool_workers"], len(parts))) as executor:
+        return list(executor.map(assemble, parts))
+
+
+def resolve_hdf5_none(obj):
+    if isinstance(obj, HDF5Dataset):
+        return None if obj.is_none() else obj
+    elif isinstance(obj, list):
+        return [resolve_hdf5_none(v) for v in obj]
+    elif isinstance(obj, dict):
+        return {k: resolve_hdf5_none(v) for k, v in obj.items()}
+    return obj
+
+
 def path_or_none(p):
     if p is None:
         return None
@@ -209,9 +247,208 @@ def slice_to_dir(slice):
     return str(slice).replace(".", "/")
 
 
+class HDF5StreamWriter:
+    """
+    File object appending to a resizable uint8 dataset chunk by chunk
+    """
+
+    def __init__(self, f, key, chunk_size, compression=None):
+        self.chunk_size = chunk_size
+        self.dataset = f.create_dataset(
+            key, shape=(0,), maxshape=(None,), dtype="uint8",
+            chunks=(chunk_size,), compression=compression)
+        self.buffer = bytearray()
+        self.size = 0
+
+    def write(self, b):
+        self.buffer += b
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+        return len(b)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        import numpy as np
+        n = len(self.buffer)
+        self.dataset.resize((self.size + n,))
+        self.dataset[self.size:] = np.frombuffer(self.buffer, dtype="uint8")
+        self.size += n
+        self.buffer = bytearray()
+
+    def tell(self):
+        return self.size + len(self.buffer)
+
+    def close(self):
+        self.flush()
+
+
+class HDF5Writer:
+    """
+    Write items of HDF5Datasets outputs into a HDF5 file
+
+    Directories (as tgz) and, if enabled, files larger than the chunk size
+    are streamed into chunked datasets. Small files, strings and None values
+    not larger than the pack size are packed into a shared dataset with an
+    offset index instead of one dataset for each.
+
+    Args:
+        f: h5py.File object opened for writing
+        compression: compression filter, default to config["hdf5_compression"]
+        chunk_size: chunk size in bytes, default to config["hdf5_chunk_size"]
+        pack_size: maximum size in bytes of packed items, default to
+            config["hdf5_pack_size"]
+        stream_files: stream files larger than the chunk size, default to
+            config["hdf5_stream_files"]
+    """
+
+    def __init__(self, f, compression=None, chunk_size=None, pack_size=None,
+                 stream_files=None):
+        self.f = f
+        if compression is None:
+            compression = config["hdf5_compression"]
+        self.compression = compression
+        if chunk_size is None:
+            chunk_size = config["hdf5_chunk_size"]
+        self.chunk_size = chunk_size
+        if pack_size is None:
+            pack_size = config["hdf5_pack_size"]
+        self.pack_size = pack_size
+        if stream_files is None:
+            stream_files = config["hdf5_stream_files"]
+        self.stream_files = stream_files
+        self.packed = None
+        self.packed_keys = []
+        self.packed_offsets = [0]
+        self.packed_attrs = []
+
+    def pack(self, key, data, attrs):
+        if self.packed is None:
+            self.packed = HDF5StreamWriter(
+                self.f, packed_data_name, self.chunk_size, self.compression)
+        self.packed.write(data)
+        self.packed_keys.append(key)
+        self.packed_offsets.append(self.packed.tell())
+        self.packed_attrs.append(json.dumps(attrs))
+
+    def stream(self, key, path):
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        dtype = "utf-8"
+        with open(path, "rb") as src:
+            w = HDF5StreamWriter(self.f, key, self.chunk_size,
+                                 self.compression)
+            while True:
+                b = src.read(self.chunk_size)
+                if dtype == "utf-8":
+                    try:
+                        decoder.decode(b, final=not b)
+                    except UnicodeDecodeError:
+                        dtype = "binary"
+                if not b:
+                    break
+                w.write(b)
+            w.close()
+        return w.dataset, dtype
+
+    def write(self, key, value):
+        f = self.f
+        v = value
+        if isinstance(v, Path):
+            if v.is_file():
+                size = v.stat().st_size
+                if self.stream_files and size > self.chunk_size:
+                    d, dtype = self.stream(key, v)
+                elif self.pack_size > 0 and size <= self.pack_size:
+                    data = v.read_bytes()
+                    try:
+                        data.decode("utf-8")
+                        dtype = "utf-8"
+                    except UnicodeDecodeError:
+                        dtype = "binary"
+                    self.pack(key, data, {"type": "file", "path": str(v),
+                                          "dtype": dtype})
+                    return
+                else:
+                    try:
+                        data = v.read_text(encoding="utf-8")
+                        dtype = "utf-8"
+                    except Exception:
+                        import numpy as np
+                        data = np.void(v.read_bytes())
+                        dtype = "binary"
+                    d = f.create_dataset(key, data=data)
+                d.attrs["type"] = "file"
+                d.attrs["path"] = str(v)
+                d.attrs["dtype"] = dtype
+            elif v.is_dir():
+                w = HDF5StreamWriter(f, key, self.chunk_size,
+                                     self.compression)
+                tf = tarfile.open(fileobj=w, mode="w|gz", dereference=True)
+                tf.add(v)
+                tf.close()
+                w.close()
+                d = w.dataset
+                d.attrs["type"] = "dir"
+                d.attrs["path"] = str(v)
+                d.attrs["dtype"] = "binary"
+        elif isinstance(v, PackedHDF5Dataset) and self.pack_size > 0:
+            self.pack(key, v.open().read(), dict(v.attrs))
+        elif isinstance(v, PackedHDF5Dataset):
+            data = v.open().read()
+            if v.is_none():
+                d = f.create_dataset(key, data="")
+            elif v.attrs.get("dtype") == "utf-8":
+                d = f.create_dataset(key, data=data.decode("utf-8"))
+            else:
+                import numpy as np
+                d = f.create_dataset(key, data=np.void(data))
+            d.attrs.update(v.attrs)
+        elif isinstance(v, HDF5Dataset):
+            f.copy(v.dataset, key)
+        elif v is None:
+            if self.pack_size > 0:
+                self.pack(key, b"", {"type": "null"})
+                return
+            d = f.create_dataset(key, data="")
+            d.attrs["type"] = "null"
+        elif isinstance(v, str) and self.pack_size > 0 and \
+                len(v) <= self.pack_size:
+            self.pack(key, v.encode("utf-8"), {"type": "data",
+                                               "dtype": "utf-8"})
+        else:
+            kwargs = {}
+            if self.compression is not None and hasattr(v, "ndim") and \
+                    v.ndim > 0 and v.dtype.kind in "biufc":
+                kwargs["compression"] = self.compression
+            d = f.create_dataset(key, data=v, **kwargs)
+            d.attrs["type"] = "data"
+            if isinstance(v, str):
+                d.attrs["dtype"] = "utf-8"
+
+    def close(self):
+        """
+        Flush packed items and write the index of them
+        """
+        if self.packed is None:
+            return
+        self.packed.close()
+        import h5py
+        import numpy as np
+        str_dtype = h5py.string_dtype()
+        self.f.create_dataset(packed_keys_name, data=np.array(
+            self.packed_keys, dtype=object), dtype=str_dtype)
+        self.f.create_dataset(packed_offsets_name, data=np.array(
+            self.packed_offsets, dtype="int64"))
+        self.f.create_dataset(packed_attrs_name, data=np.array(
+            self.packed_attrs, dtype=object), dtype=str_dtype)
+        self.packed = None
+
+
 def handle_output_artifact(name, value, sign, slices=None, data_root="/tmp",
                            create_dir=False, symlink=False):
+    t = time.time()
     path_list = []
+    stager = OutputStager()
     if sign.type == HDF5Datasets:
         import h5py
         os.makedirs(data_root + '/outputs/artifacts/' + name, exist_ok=True)
@@ -225,42 +462,10 @@ def handle_output_artifact(name, value, sign, slices=None, data_root="/tmp",
         else:
             items = flatten(value).items()
         with h5py.File(h5_path, "w") as f:
+            writer = HDF5Writer(f)
             for s, v in items:
-                if isinstance(v, Path):
-                    if v.is_file():
-                        try:
-                            data = v.read_text(encoding="utf-8")
-                            dtype = "utf-8"
-                        except Exception:
-                            import numpy as np
-                            data = np.void(v.read_bytes())
-                            dtype = "binary"
-                        d = f.create_dataset(s, data=data)
-                        d.attrs["type"] = "file"
-                        d.attrs["path"] = str(v)
-                        d.attrs["dtype"] = dtype
-                    elif v.is_dir():
-                        tgz_path = Path("%s.tgz" % v)
-                        tf = tarfile.open(tgz_path, "w:gz", dereference=True)
-                        tf.add(v)
-                        tf.close()
-                        import numpy as np
-                        d = f.create_dataset(s, data=np.void(
-                            tgz_path.read_bytes()))
-                        d.attrs["type"] = "dir"
-                        d.attrs["path"] = str(v)
-                        d.attrs["dtype"] = "binary"
-                elif isinstance(v, HDF5Dataset):
-                    d = f.create_dataset(s, data=v.dataset[()])
-                    d.attrs.update(v.dataset.attrs)
-                elif v is None:
-                    d = f.create_dataset(s, data="")
-                    d.attrs["type"] = "null"
-                else:
-                    d = f.create_dataset(s, data=v)
-                    d.attrs["type"] = "data"
-                    if isinstance(v, str):
-                        d.attrs["dtype"] = "utf-8"
+                writer.write(s, v)
+            writer.close()
         path_list.append({"dflow_list_item": h5_name, "order": slices or 0})
     if sign.type in [str, Path]:
         os.makedirs(data_root + '/outputs/artifacts/' + name, exist_ok=True)
@@ -268,7 +473,8 @@ def handle_output_artifact(name, value, sign, slices=None, data_root="/tmp",
             slices = 0
         path_list.append(copy_results_and_return_path_item(
             value, name, slices, data_root,
-            slice_to_dir(slices) if create_dir else None, symlink=symlink))
+            slice_to_dir(slices) if create_dir else None, symlink=symlink,
+            stager=stager))
     elif sign.type in [List[str], List[Path], Set[str], Set[Path]]:
         os.makedirs(data_root + '/outputs/artifacts/' + name, exist_ok=True)
         if slices is not None:
@@ -277,7 +483,7 @@ def handle_output_artifact(name, value, sign, slices=None, data_root="/tmp",
                     path_list.append(copy_results_and_return_path_item(
                         path, name, slices, data_root,
                         slice_to_dir(slices) if create_dir else None,
-                        symlink=symlink))
+                        symlink=symlink, stager=stager))
             else:
                 assert len(slices) == len(value)
                 for path, s in zip(value, slices):
@@ -287,33 +493,35 @@ def handle_output_artifact(name, value, sign, slices=None, data_root="/tmp",
                                 copy_results_and_return_path_item(
                                     p, name, s, data_root, slice_to_dir(
                                         s) if create_dir else None,
-                                    symlink=symlink))
+                                    symlink=symlink, stager=stager))
                     else:
                         path_list.append(copy_results_and_return_path_item(
                             path, name, s, data_root, slice_to_dir(
-                                s) if create_dir else None, symlink=symlink))
+                                s) if create_dir else None, symlink=symlink,
+                            stager=stager))
         else:
             for s, path in enumerate(value):
                 path_list.append(copy_results_and_return_path_item(
-                    path, name, s, data_root, symlink=symlink))
+                    path, name, s, data_root, symlink=symlink, stager=stager))
     elif sign.type in [Dict[str, str], Dict[str, Path]]:
         os.makedirs(data_root + '/outputs/artifacts/' + name, exist_ok=True)
         for s, path in value.items():
             path_list.append(copy_results_and_return_path_item(
-                path, name, s, data_root, symlink=symlink))
+                path, name, s, data_root, symlink=symlink, stager=stager))
     elif sign.type in [NestedDict[str], NestedDict[Path]]:
         os.makedirs(data_root + '/outputs/artifacts/' + name, exist_ok=True)
         for s, path in flatten(value).items():
             path_list.append(copy_results_and_return_path_item(
-                path, name, s, data_root, symlink=symlink))
+                path, name, s, data_root, symlink=symlink, stager=stager))
 
+    stats = stager.run()
+    stats["time"] = time.time() - t
     os.makedirs(data_root + "/outputs/artifacts/%s/%s" % (name, config[
         "catalog_dir_name"]), exist_ok=True)
     with open(data_root + "/outputs/artifacts/%s/%s/%s" % (name, config[
             "catalog_dir_name"], uuid.uuid4()), "w") as f:
-        f.write(jsonpickle.dumps({"path_list": path_list}))
-    if config["detect_empty_dir"]:
-        handle_empty_dir(data_root + "/outputs/artifacts/%s" % name)
+        # staging statistics are recorded along with the catalog fragment
+        f.write(jsonpickle.dumps({"path_list": path_list, "staging": stats}))
     if config["save_path_as_parameter"]:
         with open(data_root + '/outputs/parameters/dflow_%s_path_list'
                   % name, 'w') as f:
@@ -345,16 +553,24 @@ def handle_output_parameter(name, value, sign, slices=None, data_root="/tmp"):
 
 
 def copy_results_and_return_path_item(path, name, order, data_root="/tmp",
-                                      slice_dir=None, symlink=False):
+                                      slice_dir=None, symlink=False,
+                                      stager=None):
     if (path and os.path.exists(str(path))) or symlink:
         return {"dflow_list_item": copy_results(
-                    path, name, data_root, slice_dir, symlink), "order": order}
+                    path, name, data_root, slice_dir, symlink, stager),
+                "order": order}
     else:
         return {"dflow_list_item": None, "order": order}
 
 
 def copy_results(source, name, data_root="/tmp", slice_dir=None,
-                 symlink=False):
+                 symlink=False, stager=None):
+    if stager is None:
+        stager = OutputStager()
+        rel_path = copy_results(source, name, data_root, slice_dir, symlink,
+                                stager)
+        stager.run()
+        return rel_path
     source = str(source)
     # if refer to input artifact
     if source.find(data_root + "/inputs/artifacts/") == 0:
@@ -368,11 +584,9 @@ def copy_results(source, name, data_root="/tmp", slice_dir=None,
             rel_path = "%s/%s" % (slice_dir, rel_path)
         target = data_root + "/outputs/artifacts/%s/%s" % (name, rel_path)
         if symlink:
-            os.makedirs(os.path.abspath(os.path.dirname(target)),
-                        exist_ok=True)
-            os.symlink(os.path.abspath(source), target)
+            stager.add_symlink(source, target)
         else:
-            copy_file(source, target, shutil.copy)
+            stager.add(source, target, shutil.copy)
         if rel_path[:1] == "/":
             rel_path = rel_path[1:]
         return rel_path
@@ -387,14 +601,112 @@ def copy_results(source, name, data_root="/tmp", slice_dir=None,
             rel_path = "%s/%s" % (slice_dir, rel_path)
         target = data_root + "/outputs/artifacts/%s/%s" % (name, rel_path)
         if symlink:
-            os.makedirs(os.path.abspath(os.path.dirname(target)),
-                        exist_ok=True)
-            os.symlink(os.path.abspath(source), target)
+            stager.add_symlink(source, target)
         else:
-            copy_file(source, target)
+            stager.add(source, target)
         return rel_path
 
 
+class OutputStager:
+    """
+    Stage output files into an artifact directory in batch
+
+    Directories are walked once when added, creating the target directories
+    and recording the empty ones, and files are then linked (or copied) by a
+    thread pool. Hardlinks are used for files on the same filesystem unless
+    another function (e.g. shutil.copy for input artifacts) is specified.
+
+    Args:
+        max_workers: maximum number of concurrent file operations, default
+            to config["stage_pool_workers"]
+    """
+
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = config["stage_pool_workers"]
+        self.max_workers = max_workers
+        self.files = []
+        self.empty_dirs = []
+        self.symlinks = []
+        self.time = 0.0
+
+    def add(self, source, target, func=try_link):
+        os.makedirs(os.path.abspath(os.path.dirname(target)), exist_ok=True)
+        if os.path.isdir(source):
+            # same as shutil.copytree which fails for an existing target
+            if os.path.exists(target):
+                return
+            for dn, ds, fs in os.walk(source, followlinks=True):
+                rel = os.path.relpath(dn, source)
+                tdn = target if rel == "." else os.path.join(target, rel)
+                os.makedirs(tdn, exist_ok=True)
+                if len(ds) == 0 and len(fs) == 0:
+                    self.empty_dirs.append(tdn)
+                for f in fs:
+                    self.files.append((func, os.path.join(dn, f),
+                                       os.path.join(tdn, f)))
+        elif os.path.isfile(source):
+            self.files.append((func, source, target))
+        else:
+            raise FileNotFoundError("File %s not found" % source)
+
+    def add_symlink(self, source, target):
+        os.makedirs(os.path.abspath(os.path.dirname(target)), exist_ok=True)
+        os.symlink(os.path.abspath(source), target)
+        self.symlinks.append(target)
+
+    def run(self):
+        """
+        Link or copy the files added, and tag empty directories if
+        config["detect_empty_dir"] is set
+
+        Returns:
+            staging statistics: number of files and time in seconds
+        """
+        t = time.time()
+        # the last one wins for duplicate targets as in serial copying
+        self.files = list({dst: (func, src, dst)
+                           for func, src, dst in self.files}.values())
+        # hardlinks are cheap metadata operations, make them serially and
+        # leave copies (e.g. across filesystems) to the thread pool
+        copies = []
+        for func, src, dst in self.files:
+            if func is try_link:
+                try:
+                    if os.path.isfile(dst):
+                        os.remove(dst)
+                    link(src, dst)
+                    continue
+                except Exception:
+                    func = shutil.copy
+            copies.append((func, src, dst))
+        if self.max_workers > 1 and len(copies) > 1:
+            import concurrent.futures
+            with concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers) as executor:
+                futures = [executor.submit(func, src, dst)
+                           for func, src, dst in copies]
+                for future in futures:
+                    future.result()
+        else:
+            for func, src, dst in copies:
+                func(src, dst)
+        if config["detect_empty_dir"]:
+            for dn in self.empty_dirs:
+                with open(os.path.join(dn, ".empty_dir"), "w"):
+                    pass
+            for target in self.symlinks:
+                if os.path.isdir(target):
+                    handle_empty_dir(target)
+        self.time += time.time() - t
+        stats = {"files": len(self.files) + len(self.symlinks),
+                 "time": self.time}
+        self.files = []
+        self.empty_dirs = []
+        self.symlinks = []
+        return stats
+
+
 def handle_empty_dir(path):
     # touch an empty file in each empty dir, as object storage will ignore
     # empty dirs
@@ -478,6 +790,269 @@ def try_to_execute(input, slice_dir, op_obj, output_sign, cwd, timeout=None):
             signal.alarm(0)
 
 
+slice_context = None
+
+
+def init_slice_worker(context):
+    global slice_context
+    slice_context = context
+
+
+def execute_slice(task):
+    i, sliced_input, slice_dir = task
+    input, op_obj, output_sign, cwd, timeout = slice_context
+    input = deepcopy(input)
+    input.update(sliced_input)
+    output, error = try_to_execute(input, slice_dir, op_obj, output_sign,
+                                   cwd, timeout)
+    return i, output, error
+
+
+def slice_worker(context, conn):
+    init_slice_worker(context)
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        # notify the start of the slice, the worker may be slow to start
+        conn.send(task[0])
+        i, output, error = execute_slice(task)
+        try:
+            conn.send((i, output, error))
+        except Exception as e:
+            conn.send((i, None, RuntimeError(
+                "Failed to send the result of slice %s: %s" % (i, e))))
+
+
+class SliceSupervisor:
+    """
+    Execute slices in worker processes with deadlines enforced by the
+    parent process
+
+    A slice running longer than the timeout is cancelled by killing its
+    worker, which is then replaced. After the global deadline, running and
+    remaining slices are all cancelled. Cancelled slices fail with
+    TimeoutError.
+
+    Args:
+        context: shared context of slices, see execute_slice
+        pool_size: number of worker processes
+        timeout: timeout in seconds of each slice
+        deadline: timeout in seconds of all slices
+        start_method: start method of the worker processes
+    """
+
+    def __init__(self, context, pool_size, timeout=None, deadline=None,
+                 start_method=None):
+        import multiprocessing
+        self.ctx = multiprocessing.get_context(start_method)
+        self.context = context
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.deadline = deadline
+        self.workers = []
+        # current task and its start time of each worker
+        self.running = {}
+
+    def start_worker(self):
+        conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(target=slice_worker, args=(
+            self.context, child_conn), daemon=True)
+        process.start()
+        child_conn.close()
+        worker = (process, conn)
+        self.workers.append(worker)
+        return worker
+
+    def stop_worker(self, worker, kill=False):
+        process, conn = worker
+        if kill:
+            process.kill()
+        else:
+            try:
+                conn.send(None)
+            except Exception:
+                process.kill()
+        process.join()
+        conn.close()
+        self.workers.remove(worker)
+        self.running.pop(worker, None)
+
+    def dispatch(self, worker, tasks):
+        task = next(tasks, None)
+        if task is None:
+            return False
+        worker[1].send(task)
+        # the start time is set when the worker notifies
+        self.running[worker] = (task[0], None)
+        return True
+
+    def run(self, tasks):
+        """
+        Execute the tasks, yield (index, output, error) once a slice
+        completes or is cancelled
+        """
+        from multiprocessing.connection import wait
+        tasks = iter(tasks)
+        start = time.monotonic()
+        try:
+            for _ in range(self.pool_size):
+                worker = self.start_worker()
+                if not self.dispatch(worker, tasks):
+                    break
+            while self.running:
+                now = time.monotonic()
+                if self.deadline is not None and \
+                        now - start >= self.deadline:
+                    for worker in list(self.running):
+                        i = self.running[worker][0]
+                        self.stop_worker(worker, kill=True)
+                        yield i, None, TimeoutError(
+                            "Slice %s cancelled by the deadline %ss" % (
+                                i, self.deadline))
+                    for task in tasks:
+                        yield task[0], None, TimeoutError(
+                            "Slice %s cancelled by the deadline %ss" % (
+                                task[0], self.deadline))
+                    return
+                wait_time = None
+                if self.timeout is not None:
+                    wait_time = min([t + self.timeout - now for _, t in
+                                     self.running.values() if t is not None],
+                                    default=None)
+                if self.deadline is not None:
+                    wait_time = min(start + self.deadline - now,
+                                    wait_time if wait_time is not None
+                                    else self.deadline)
+                objs = {}
+                for worker in self.running:
+                    objs[worker[1]] = worker
+                    objs[worker[0].sentinel] = worker
+                ready = wait(list(objs), max(wait_time, 0)
+                             if wait_time is not None else None)
+                done = []
+                for obj in ready:
+                    worker = objs[obj]
+                    if worker in done or worker not in self.running:
+                        continue
+                    i = self.running[worker][0]
+                    try:
+                        msg = worker[1].recv()
+                        if not isinstance(msg, tuple):
+                            self.running[worker] = (i, time.monotonic())
+                            continue
+                        _, output, error = msg
+                    except (EOFError, OSError):
+                        # the worker exited unexpectedly, the exit code
+                        # is only set once it is joined
+                        worker[0].join(1)
+                        code = worker[0].exitcode
+                        self.stop_worker(worker, kill=True)
+                        yield i, None, RuntimeError(
+                            "Worker of slice %s exited with code %s" % (
+                                i, code))
+                        worker = self.start_worker()
+                        if not self.dispatch(worker, tasks):
+                            self.stop_worker(worker)
+                        continue
+                    done.append(worker)
+                    del self.running[worker]
+                    yield i, output, error
+                    if not self.dispatch(worker, tasks):
+                        self.stop_worker(worker)
+                if self.timeout is not None:
+                    now = time.monotonic()
+                    for worker, (i, t) in list(self.running.items()):
+                        if t is None or now - t < self.timeout:
+                            continue
+                        logger.warning("Slice %s timed out after %ss, kill "
+                                       "its worker" % (i, self.timeout))
+                        self.stop_worker(worker, kill=True)
+                        yield i, None, TimeoutError(
+                            "Slice %s timed out after %ss" % (
+                                i, self.timeout))
+                        worker = self.start_worker()
+                        if not self.dispatch(worker, tasks):
+                            self.stop_worker(worker)
+        finally:
+            for worker in list(self.workers):
+                self.stop_worker(worker, kill=worker in self.running)
+
+
+def run_slices(input, sliced_inputs, slice_dirs, op_obj, output_sign, cwd,
+               pool_size=None, timeout=None, start_method=None,
+               chunksize=None, callback=None, deadline=None):
+    """
+    Execute an OP on each slice of the inputs, in a process pool if
+    pool_size is not 1
+
+    The unsliced inputs are shared once per worker (inherited when forked),
+    only the sliced fields are sent for each slice, and results are received
+    as soon as they complete. With timeout or deadline, slices are executed
+    under a SliceSupervisor.
+
+    Args:
+        input: the OPIO of the whole inputs
+        sliced_inputs: names of sliced inputs
+        slice_dirs: working directory of each slice, or None
+        op_obj: the OP object
+        output_sign: output sign of the OP
+        cwd: current working directory
+        pool_size: number of worker processes, -1 for the number of slices
+        timeout: timeout in seconds of each slice
+        start_method: start method of the worker processes, e.g. "fork",
+            "spawn" or "forkserver", default to the platform default
+        chunksize: number of slices sent to a worker at once, adaptive by
+            default
+        callback: called with (index, output, error) once a slice completes
+        deadline: timeout in seconds of all slices, slices not completed by
+            then fail with TimeoutError
+    Returns:
+        list of outputs and list of errors, in the order of slices
+    """
+    n_slices = len(slice_dirs)
+    base = input.__class__({k: v for k, v in input.items()
+                            if k not in sliced_inputs})
+    # sliced inputs may be iterables, convert them to lists only once
+    lists = {name: list(input[name]) for name in sliced_inputs
+             if input[name] is not None}
+    tasks = ((i, {name: lists[name][i] if name in lists else None
+                  for name in sliced_inputs}, slice_dirs[i])
+             for i in range(n_slices))
+    context = (base, op_obj, output_sign, cwd, None)
+    output_list = [None] * n_slices
+    error_list = [None] * n_slices
+    if pool_size == -1:
+        pool_size = n_slices
+    pool_size = max(1, min(pool_size or os.cpu_count(), n_slices))
+    pool = None
+    if timeout is not None or deadline is not None:
+        results = SliceSupervisor(context, pool_size, timeout, deadline,
+                                  start_method).run(tasks)
+    elif pool_size == 1:
+        init_slice_worker(context)
+        results = map(execute_slice, tasks)
+    else:
+        import multiprocessing
+        ctx = multiprocessing.get_context(start_method)
+        if chunksize is None:
+            chunksize = max(1, n_slices // (pool_size * 4))
+        pool = ctx.Pool(pool_size, initializer=init_slice_worker,
+                        initargs=(context,))
+        results = pool.imap_unordered(execute_slice, tasks, chunksize)
+    try:
+        for i, output, error in results:
+            output_list[i] = output
+            error_list[i] = error
+            if callback is not None:
+                callback(i, output, error)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return output_list, error_list
+
+
 def get_input_slices(name, data_root="/tmp"):
     art_path = '%s/inputs/artifacts/%s' % (data_root, name)
     catalog = catalog_of_local_artifact(art_path)
@@ -0,0 +1,185 @@
+import concurrent.futures
+import json
+import logging
+import re
+from typing import Dict, Iterable, List, Optional
+
+from .config import config
+
+try:
+    import kubernetes
+    from kubernetes.client.exceptions import ApiException
+except Exception:
+    pass
+
+logger = logging.getLogger(__name__)
+
+CACHE_LABEL = "workflows.argoproj.io/configmap-type"
+WORKFLOW_LABEL = "workflow.dp.tech/reused-by"
+input_parameter_pattern = re.compile(r"{{inputs\.parameters\.(.*?)}}")
+
+
+def resolve_memoize_key(key: str, step) -> Optional[str]:
+    """
+    Resolve the memoize key of a template for an Argo step (or DAG task),
+    None if it is only known at runtime
+    """
+    if getattr(step, "with_param", None) is not None or \
+            getattr(step, "with_items", None) is not None or \
+            getattr(step, "with_sequence", None) is not None:
+        return None
+    arguments = getattr(step, "arguments", None)
+    parameters = {par.name: par.value for par in
+                  getattr(arguments, "parameters", None) or []}
+    if any(name not in parameters for name in
+           input_parameter_pattern.findall(key)):
+        return None
+    key = input_parameter_pattern.sub(
+        lambda m: str(parameters[m.group(1)]), key)
+    return None if "{{" in key else key
+
+
+class ReusePlanner:
+    """
+    Plan and create the memoization cache entries of reused steps
+
+    The planner packs the cache entries of a workflow into a single ConfigMap
+    when they fit in the size limit, otherwise it falls back to one ConfigMap
+    per entry. Entries which may not be packed (e.g. those of a template
+    also used by new steps) always have their own ConfigMaps. ConfigMaps are
+    created concurrently with a bounded pool. The planner remembers completed
+    work (created ConfigMaps and copied artifacts), so resubmitting the same
+    workflow does not redo it.
+
+    Args:
+        workflow_id: ID of the workflow to be submitted
+        namespace: k8s namespace
+        max_workers: maximum number of concurrent API calls
+        size_limit: maximum size in bytes of the data of a packed ConfigMap
+    """
+
+    def __init__(
+            self,
+            workflow_id: str,
+            namespace: str,
+            max_workers: Optional[int] = None,
+            size_limit: Optional[int] = None,
+    ) -> None:
+        self.workflow_id = workflow_id
+        self.namespace = namespace
+        if max_workers is None:
+            max_workers = config["reuse_pool_workers"]
+        self.max_workers = max_workers
+        if size_limit is None:
+            size_limit = config["reuse_configmap_size_limit"]
+        self.size_limit = size_limit
+        self.created = set()
+        self.copied = {}
+
+    @property
+    def packed_name(self) -> str:
+        return "dflow-%s" % self.workflow_id
+
+    def plan(
+            self,
+            memoize_map: Dict[str, dict],
+            packable_keys: Optional[Iterable[str]] = None,
+    ) -> Dict[str, Dict[str, str]]:
+        """
+        Compute the ConfigMaps needed for the memoization map
+
+        Args:
+            memoize_map: memoization entries indexed by memoize key
+            packable_keys: keys of the entries which may be packed, all by
+                default
+        Returns:
+            a dict from ConfigMap name to its data
+        """
+        data = {key: json.dumps(entry) for key, entry in memoize_map.items()}
+        if packable_keys is None:
+            packable_keys = data
+        packable_keys = set(packable_keys)
+        packed = {k: v for k, v in data.items() if k in packable_keys}
+        if sum(len(k) + len(v) for k, v in packed.items()) > self.size_limit:
+            logger.debug("memoization entries exceed %s bytes, use one "
+                         "ConfigMap per entry" % self.size_limit)
+            packed = {}
+        plan = {self.packed_name: packed} if packed else {}
+        plan.update({"dflow-%s" % key: {key: value}
+                     for key, value in data.items() if key not in packed})
+        return plan
+
+    def is_packed(self, plan: Dict[str, Dict[str, str]]) -> bool:
+        return self.packed_name in plan
+
+    def copy(self, src: str, dst: str) -> None:
+        """
+        Copy an artifact in the storage unless it has been copied
+        """
+        if self.copied.get(src) == dst:
+            return
+        from .utils import copy_s3
+        logger.debug("copying artifact: %s -> %s" % (src, dst))
+        copy_s3(src, dst)
+        self.copied[src] = dst
+
+    def list_existing(self, core_v1_api) -> List[str]:
+        res = core_v1_api.api_client.call_api(
+            '/api/v1/namespaces/%s/configmaps' % self.namespace, 'GET',
+            query_params=[("labelSelector", "%s=%s" % (
+                WORKFLOW_LABEL, self.workflow_id))],
+            response_type='V1ConfigMapList',
+            header_params=config["http_headers"],
+            _return_http_data_only=True)
+        return [cm.metadata.name for cm in res.items]
+
+    def apply(
+            self,
+            plan: Dict[str, Dict[str, str]],
+            core_v1_api,
+    ) -> None:
+        """
+        Create the planned ConfigMaps which do not exist yet
+
+        Args:
+            plan: the result of plan()
+            core_v1_api: kubernetes CoreV1Api
+        """
+        todo = {name: data for name, data in plan.items()
+                if name not in self.created}
+        if len(todo) > 1:
+            try:
+                self.created.update(self.list_existing(core_v1_api))
+            except Exception as e:
+                logger.warning("Failed to list existing ConfigMaps: %s" % e)
+            todo = {name: data for name, data in todo.items()
+                    if name not in self.created}
+        if not todo:
+            return
+
+        def create(name, data):
+            config_map = kubernetes.client.V1ConfigMap(
+                data=data, metadata=kubernetes.client.V1ObjectMeta(
+                    name=name, labels={
+                        CACHE_LABEL: "Cache",
+                        WORKFLOW_LABEL: self.workflow_id,
+                    }))
+            logger.debug("creating configmap: %s" % name)
+            try:
+                core_v1_api.api_client.call_api(
+                    '/api/v1/namespaces/%s/configmaps' % self.namespace,
+                    'POST', body=config_map, response_type='V1ConfigMap',
+                    header_params=config["http_headers"],
+                    _return_http_data_only=True)
+            except ApiException as e:
+                if e.status != 409:
+                    raise e
+                logger.debug("configmap %s already exists" % name)
+            return name
+
+        with concurrent.futures.ThreadPoolExecutor(
+                min(self.max_workers, len(todo))) as executor:
+            futures = [executor.submit(create, name, data)
+                       for name, data in todo.items()]
+            for future in concurrent.futures.as_completed(futures):
+                self.created.add(future.result())
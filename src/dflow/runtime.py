@@ -0,0 +1,20 @@
+"""
+Lightweight entry point for OP scripts running in pods, which only imports
+the configurations, OPIO and the handlers of inputs and outputs, without
+the modules for building and submitting workflows
+"""
+from .common import jsonpickle
+from .config import config, s3_config
+from .python.op import OP, FatalError, TransientError
+from .python.opio import (OPIO, Artifact, BigParameter, HDF5Datasets,
+                          NestedDict, OPIOSign, Parameter)
+from .python.utils import (handle_input_artifact, handle_input_parameter,
+                           handle_lineage, handle_output_artifact,
+                           handle_output_parameter)
+
+__all__ = ["jsonpickle", "config", "s3_config", "OP", "FatalError",
+           "TransientError", "OPIO", "Artifact", "BigParameter",
+           "HDF5Datasets", "NestedDict", "OPIOSign", "Parameter",
+           "handle_input_artifact", "handle_input_parameter",
+           "handle_lineage", "handle_output_artifact",
+           "handle_output_parameter"]
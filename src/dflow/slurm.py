@@ -26,7 +26,8 @@ class SlurmJob(Resource):
     def __init__(self, header="", node_selector=None, prepare=None,
                  results=None, map_tmp_dir=True, workdir=".",
                  remote_command=None, docker_executable=None,
-                 singularity_executable=None, podman_executable=None):
+                 singularity_executable=None, podman_executable=None,
+                 links=None):
         self.header = header
         self.action = "create"
         self.success_condition = "status.status == Succeeded"
@@ -42,12 +43,22 @@ class SlurmJob(Resource):
         self.docker_executable = docker_executable
         self.singularity_executable = singularity_executable
         self.podman_executable = podman_executable
+        # destination -> cluster-resident source, relative to the directory
+        # where the job starts, an empty source means nothing to link
+        self.links = links if links is not None else {}
 
     def get_manifest(self, template):
         remote_command = template.command if self.remote_command is None else \
             self.remote_command
         batch = self.header + "\n"
-        batch += "mkdir -p %s\ncd %s\n" % (self.workdir, self.workdir)
+        batch += "mkdir -p %s\n" % self.workdir
+        # the job fails rather than running without a linked input
+        for dst, src in self.links.items():
+            batch += "if [ -n \"%s\" ]; then mkdir -p `dirname %s` && "\
+                "rm -rf %s && (cp -al %s %s 2>/dev/null || cp -r %s %s) || "\
+                "{ echo \"Failed to link %s\" >&2; exit 1; }; fi\n" % (
+                    src, dst, dst, src, dst, src, dst, src)
+        batch += "cd %s\n" % self.workdir
         if self.map_tmp_dir:
             remote_script = render_script_with_tmp_root(
                 template, "%s/tmp" % self.workdir)
@@ -93,6 +104,14 @@ class SlurmJobTemplate(Executor):
         docker_executable: docker executable to run remotely
         singularity_executable: singularity executable to run remotely
         podman_executable: podman executable to run remotely
+        cluster_artifacts: keep artifacts on the cluster filesystem between
+            Slurm job steps: output artifacts are also exposed as
+            cluster-resident paths, and input artifacts produced by another
+            step with this option are linked from the cluster instead of
+            being downloaded and shipped again
+        upload_artifacts: names of output artifacts still uploaded to the
+            artifact repository when cluster_artifacts is set, e.g. for
+            non-Slurm consumers or global outputs, None for all
     """
 
     def __init__(
@@ -108,6 +127,8 @@ class SlurmJobTemplate(Executor):
             docker_executable: Optional[str] = None,
             singularity_executable: Optional[str] = None,
             podman_executable: Optional[str] = None,
+            cluster_artifacts: bool = False,
+            upload_artifacts: Optional[List[str]] = None,
     ) -> None:
         self.header = header
         self.node_selector = node_selector
@@ -130,15 +151,68 @@ class SlurmJobTemplate(Executor):
         self.docker_executable = docker_executable
         self.singularity_executable = singularity_executable
         self.podman_executable = podman_executable
+        self.cluster_artifacts = cluster_artifacts
+        self.upload_artifacts = upload_artifacts
+
+    def modify_step(self, step):
+        if not self.cluster_artifacts:
+            return
+        for name in step.template.outputs.artifacts:
+            par_name = "dflow_%s_cluster_path" % name
+            step.outputs.parameters[par_name] = OutputParameter(
+                name=par_name, step=step, type=str)
+        for name, art in step.inputs.artifacts.items():
+            source = art.source
+            if not isinstance(source, OutputArtifact) or source.step is None \
+                    or not self.shares_cluster_with(source.step.executor):
+                continue
+            cluster_path = source.step.outputs.parameters.get(
+                "dflow_%s_cluster_path" % source.name)
+            if cluster_path is None:
+                continue
+            # link the artifact on the cluster rather than downloading it
+            step.inputs.parameters["dflow_%s_cluster_path" % name] = \
+                InputParameter(name="dflow_%s_cluster_path" % name,
+                               value=cluster_path)
+            art.source = None
+            art.optional = True
+
+    def shares_cluster_with(self, executor):
+        """
+        Whether cluster paths of steps of another executor are reachable,
+        i.e. it keeps artifacts on the same cluster (selected by the node
+        selector) under the same root of working directories
+        """
+        return isinstance(executor, SlurmJobTemplate) and \
+            executor.cluster_artifacts and \
+            executor.node_selector == self.node_selector and \
+            executor.workdir.split("{{")[0] == self.workdir.split("{{")[0]
+
+    def cluster_path(self, path):
+        return "%s/workdir%s" % (self.workdir, path)
 
     def render(self, template):
         new_template = Steps(template.name + "-slurm")
         for art_name in template.inputs.artifacts:
             new_template.inputs.artifacts[art_name] = InputArtifact(
-                name=art_name)
+                name=art_name, optional=self.cluster_artifacts)
         for par_name in template.inputs.parameters:
             new_template.inputs.parameters[par_name] = InputParameter(
                 name=par_name)
+        links = {}
+        link_parameters = []
+        if self.cluster_artifacts:
+            for art_name, art in template.inputs.artifacts.items():
+                par_name = "dflow_%s_cluster_path" % art_name
+                new_template.inputs.parameters[par_name] = InputParameter(
+                    name=par_name, value="")
+                link_parameters.append(par_name)
+                links[self.cluster_path(art.path)] = \
+                    "{{inputs.parameters.%s}}" % par_name
+        upload_artifacts = [
+            name for name in template.outputs.artifacts
+            if not self.cluster_artifacts or self.upload_artifacts is None
+            or name in self.upload_artifacts]
         prepare = None
         results = None
 
@@ -150,8 +224,13 @@ class SlurmJobTemplate(Executor):
             mount = V1VolumeMount(name="workdir", mount_path="/workdir")
             script = ""
             for art in template.inputs.artifacts.values():
+                if self.cluster_artifacts:
+                    # absent when linked from the cluster
+                    script += "if [ -e %s ]; then\n" % art.path
                 script += "mkdir -p /workdir/%s\n" % os.path.dirname(art.path)
                 script += "cp -r %s /workdir/%s\n" % (art.path, art.path)
+                if self.cluster_artifacts:
+                    script += "fi\n"
             prepare_template = ShellOPTemplate(
                 name=new_template.name + "-prepare", image=self.prepare_image,
                 image_pull_policy=self.prepare_image_pull_policy,
@@ -163,6 +242,9 @@ class SlurmJobTemplate(Executor):
                         value="{{inputs.parameters.%s}}" % name)
             prepare_template.inputs.artifacts = deepcopy(
                 template.inputs.artifacts)
+            if self.cluster_artifacts:
+                for art in prepare_template.inputs.artifacts.values():
+                    art.optional = True
             prepare_template.outputs.parameters["dflow_vol_path"] = \
                 OutputParameter(value="/tmp/{{pod.name}}")
             artifacts = {}
@@ -184,7 +266,7 @@ class SlurmJobTemplate(Executor):
                 }
             }
 
-        if template.outputs.parameters or template.outputs.artifacts:
+        if template.outputs.parameters or upload_artifacts:
             results = {
                 "from": "%s/workdir" % self.workdir,
                 "mount": {
@@ -203,7 +285,7 @@ class SlurmJobTemplate(Executor):
             remote_command=self.remote_command,
             docker_executable=self.docker_executable,
             singularity_executable=self.singularity_executable,
-            podman_executable=self.podman_executable)
+            podman_executable=self.podman_executable, links=links)
         run_template = ScriptOPTemplate(
             name=new_template.name + "-run",
             resource=V1alpha1ResourceTemplate(
@@ -223,6 +305,18 @@ class SlurmJobTemplate(Executor):
         if results:
             run_template.outputs.parameters["dflow_vol_path"] = \
                 OutputParameter(value="/tmp/{{pod.name}}")
+        for par_name in link_parameters:
+            run_template.inputs.parameters[par_name] = InputParameter()
+            parameters[par_name] = "{{inputs.parameters.%s}}" % par_name
+        if self.cluster_artifacts:
+            for art_name, art in template.outputs.artifacts.items():
+                par_name = "dflow_%s_cluster_path" % art_name
+                run_template.outputs.parameters[par_name] = OutputParameter(
+                    value=self.cluster_path(art.path))
+                new_template.outputs.parameters[par_name] = OutputParameter(
+                    name=par_name,
+                    value_from_parameter="{{steps.slurm-run.outputs"
+                    ".parameters.%s}}" % par_name)
         run_step = Step("slurm-run", template=run_template,
                         parameters=parameters)
         new_template.add(run_step)
@@ -233,7 +327,8 @@ class SlurmJobTemplate(Executor):
                 type="DirectoryOrCreate"))
             mount = V1VolumeMount(name="mnt", mount_path="/mnt")
             script = ""
-            for art in template.outputs.artifacts.values():
+            for art_name in upload_artifacts:
+                art = template.outputs.artifacts[art_name]
                 script += "mkdir -p `dirname %s` && cp -r /mnt/workdir/%s"\
                     " %s\n" % (art.path, art.path, art.path)
             for par in template.outputs.parameters.values():
@@ -254,8 +349,9 @@ class SlurmJobTemplate(Executor):
                         value="{{inputs.parameters.%s}}" % name)
             collect_template.outputs.parameters = deepcopy(
                 template.outputs.parameters)
-            collect_template.outputs.artifacts = deepcopy(
-                template.outputs.artifacts)
+            for art_name in upload_artifacts:
+                collect_template.outputs.artifacts[art_name] = deepcopy(
+                    template.outputs.artifacts[art_name])
             collect_step = Step("slurm-collect", template=collect_template,
                                 parameters={
                                     "dflow_vol_path":
@@ -263,7 +359,7 @@ class SlurmJobTemplate(Executor):
                                         "dflow_vol_path"]})
             new_template.add(collect_step)
 
-            for art_name in template.outputs.artifacts:
+            for art_name in upload_artifacts:
                 new_template.outputs.artifacts[art_name] = OutputArtifact(
                     name=art_name,
                     _from="{{steps.slurm-collect.outputs.artifacts.%s}}" %
@@ -277,6 +373,193 @@ class SlurmJobTemplate(Executor):
         return new_template
 
 
+# prepare and collect the tasks of a Slurm job array, run on the cluster
+job_array_helper = r'''import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.abspath(__file__))
+
+
+def item_list():
+    with open(os.path.join(root, "dflow_with_param"), "r") as f:
+        with_param = f.read().strip()
+    if with_param:
+        return json.loads(with_param)
+    with open(os.path.join(root, "dflow_sequence"), "r") as f:
+        seq = json.load(f)
+    start, count, end = seq["start"], seq["count"], seq["end"]
+    if count is not None:
+        r = range(start, start + count)
+    elif end > start:
+        r = range(start, end + 1)
+    else:
+        r = range(start, end - 1, -1)
+    return [seq["format"] % i if seq["format"] else i for i in r]
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+
+def stage(src, dst):
+    if not os.path.exists(src):
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, copy_function=link_or_copy,
+                        dirs_exist_ok=True)
+    else:
+        link_or_copy(src, dst)
+
+
+def merge_dir(src, dst):
+    for dn, ds, fs in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(dn, src))
+        os.makedirs(target, exist_ok=True)
+        for f in fs:
+            shutil.move(os.path.join(dn, f), os.path.join(target, f))
+
+
+def prepare(index):
+    item = item_list()[index]
+    with open(os.path.join(root, "dflow_sub_paths"), "r") as f:
+        sub_paths = json.load(f)
+    with open(os.path.join(root, "script"), "r") as f:
+        script = f.read()
+    for var, key in item_vars.items():
+        value = item if key is None else item[key]
+        script = script.replace("<dflow_batch:%s>" % var, value if isinstance(
+            value, str) else json.dumps(value))
+    # shared inputs are staged once, link them into the task
+    for kind in ["artifacts", "parameters"]:
+        d = os.path.join(root, "tmp", "inputs", kind)
+        for name in os.listdir(d) if os.path.isdir(d) else []:
+            if kind == "artifacts" and name in sub_paths:
+                continue
+            stage(os.path.join(d, name), os.path.join("tmp", "inputs", kind,
+                                                      name))
+    for name, sub_path in sub_paths.items():
+        sub_path = re.sub(r"<item(\.[^>]*)?>", lambda m: str(
+            item[m.group(1)[1:]] if m.group(1) else item), sub_path)
+        dst = os.path.join("tmp", "inputs", "artifacts", name)
+        if name in sub_path_artifacts:
+            dst = os.path.join(dst, sub_path)
+            script = script.replace("<dflow_batch:dflow_%s_sub_path>" % name,
+                                    sub_path)
+        stage(os.path.join(root, "tmp", "inputs", "artifacts", name,
+                           sub_path), dst)
+    with open("script", "w") as f:
+        f.write(script.replace("$(pwd)", os.getcwd()))
+
+
+def get_max_array_size():
+    if max_array_size is not None:
+        return max_array_size
+    try:
+        out = subprocess.run(["scontrol", "show", "config"],
+                             stdout=subprocess.PIPE,
+                             universal_newlines=True).stdout
+        m = re.search(r"^MaxArraySize\s*=\s*(\d+)", out, re.M)
+        if m is not None:
+            return int(m.group(1))
+    except OSError:
+        pass
+    return 1001
+
+
+def submit():
+    # the maximum index of an array is one less than MaxArraySize, items
+    # beyond are submitted in more arrays with the offset as an argument
+    n = len(item_list())
+    size = get_max_array_size()
+    job_ids = []
+    try:
+        for offset in range(0, n, size):
+            out = subprocess.check_output([
+                "sbatch", "--parsable", "--array=0-%s" % (min(
+                    size, n - offset) - 1), "dflow_array.sh", str(offset)],
+                cwd=root, universal_newlines=True)
+            job_ids.append((out.strip().split(";")[0], offset))
+    except subprocess.CalledProcessError:
+        if job_ids:
+            subprocess.run(["scancel"] + [i for i, _ in job_ids])
+        raise
+    finally:
+        # all the arrays are tracked, offsets of their indices kept aside
+        with open(os.path.join(root, "dflow_job_id"), "w") as f:
+            f.write(",".join(i for i, _ in job_ids))
+        with open(os.path.join(root, "dflow_array_offsets"), "w") as f:
+            json.dump(dict(job_ids), f)
+
+
+def collect():
+    with open(os.path.join(root, "dflow_array_offsets"), "r") as f:
+        offsets = json.load(f)
+    states = {}
+    if os.path.isfile(os.path.join(root, "dflow_sacct")):
+        with open(os.path.join(root, "dflow_sacct"), "r") as f:
+            for line in f:
+                fields = line.strip().split("|")
+                if len(fields) >= 2 and "_" in fields[0]:
+                    job_id, index = fields[0].rsplit("_", 1)
+                    if job_id in offsets and index.isdigit():
+                        states[offsets[job_id] + int(index)] = fields[1]
+    results = []
+    values = {name: [] for name in sliced_output_parameters}
+    for i, item in enumerate(item_list()):
+        task_dir = os.path.join(root, "task.%s" % i)
+        exit_code = None
+        fname = os.path.join(task_dir, "dflow_exit_code")
+        if os.path.isfile(fname):
+            with open(fname, "r") as f:
+                exit_code = int(f.read())
+        results.append({"item": item, "exit_code": exit_code,
+                        "state": states.get(i)})
+        for name, path in sliced_output_parameters.items():
+            fname = os.path.join(task_dir, path)
+            if os.path.isfile(fname):
+                with open(fname, "r") as f:
+                    values[name].append(f.read())
+            else:
+                values[name].append(None)
+        merge_dir(os.path.join(task_dir, "tmp", "outputs"),
+                  os.path.join(root, "tmp", "outputs"))
+    os.makedirs(os.path.join(root, "tmp", "outputs", "parameters"),
+                exist_ok=True)
+    for name, path in sliced_output_parameters.items():
+        with open(os.path.join(root, path), "w") as f:
+            f.write(json.dumps(values[name]))
+    with open(os.path.join(root, "tmp", "outputs", "parameters",
+                           "dflow_batch_results"), "w") as f:
+        f.write(json.dumps(results))
+    failed = [r for r in results if r["exit_code"] != 0]
+    for r in failed:
+        print("Item %s failed with exit code %s (%s)" % (
+            r["item"], r["exit_code"], r["state"]))
+    with open(os.path.join(root, "tmp", "outputs", "dflow_batch_failed"),
+              "w") as f:
+        f.write(str(len(failed)))
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == "count":
+        print(len(item_list()))
+    elif sys.argv[1] == "submit":
+        submit()
+    elif sys.argv[1] == "prepare":
+        prepare(int(sys.argv[2]))
+    elif sys.argv[1] == "collect":
+        collect()
+'''
+
+
 class SlurmRemoteExecutor(RemoteExecutor):
     """
     Slurm remote executor
@@ -298,8 +581,20 @@ class SlurmRemoteExecutor(RemoteExecutor):
         podman_executable: podman executable to run remotely
         action_retries: retries for actions (upload, execute commands,
             download), -1 for infinity
+        max_retry_interval: maximum interval in seconds between retries of
+            an action, the interval doubles from 1 second
         header: header for Slurm job
         interval: query interval for Slurm
+        pvc: PVC to store the Slurm job ID
+        merge_sliced_step: submit the items of a sliced step as a single
+            Slurm job array, inputs are staged once and each array task runs
+            in its own directory, the exit code and state of each item are
+            reported in the output parameter `dflow_batch_results`
+        python_executable: python executable on the cluster for preparing
+            and collecting tasks of job arrays
+        max_array_size: maximum size of a Slurm job array, more items are
+            submitted in several arrays, queried from MaxArraySize of
+            `scontrol show config` by default
     """
 
     def __init__(
@@ -319,9 +614,13 @@ class SlurmRemoteExecutor(RemoteExecutor):
             singularity_executable: Optional[str] = None,
             podman_executable: Optional[str] = None,
             action_retries: int = -1,
+            max_retry_interval: int = 60,
             header: str = "",
             interval: int = 3,
             pvc: Optional[PVC] = None,
+            merge_sliced_step: bool = False,
+            python_executable: str = "python3",
+            max_array_size: Optional[int] = None,
     ) -> None:
         super().__init__(
             host=host, port=port, username=username, password=password,
@@ -330,10 +629,14 @@ class SlurmRemoteExecutor(RemoteExecutor):
             map_tmp_dir=map_tmp_dir, docker_executable=docker_executable,
             singularity_executable=singularity_executable,
             podman_executable=podman_executable, action_retries=action_retries,
+            max_retry_interval=max_retry_interval,
             image_pull_policy=image_pull_policy)
         self.header = re.sub(" *#", "#", header)
         self.interval = interval
         self.pvc = pvc
+        self.merge_sliced_step = merge_sliced_step
+        self.python_executable = python_executable
+        self.max_array_size = max_array_size
 
     def run(self, image, remote_command):
         script = "echo '%s\n%s' > slurm.sh\n" % (
@@ -360,8 +663,138 @@ class SlurmRemoteExecutor(RemoteExecutor):
         script += "./bin/slurm param.yaml || exit 1\n"
         return script
 
+    def is_array(self, template):
+        return self.merge_sliced_step and \
+            getattr(template, "slices", None) is not None
+
+    def get_script(self, template):
+        if not self.is_array(template):
+            return super().get_script(template)
+        if self.map_tmp_dir:
+            remote_script = render_script_with_tmp_root(template,
+                                                        "$(pwd)/tmp")
+        else:
+            remote_script = template.script
+        # item-dependent parameters are rendered for each array task
+        item_vars = {}
+        for k, v in getattr(template, "dflow_vars", {}).items():
+            if k == "{{item}}":
+                item_vars[v] = None
+            elif k.startswith("{{item."):
+                item_vars[v] = k[7:-2]
+            else:
+                continue
+            remote_script = remote_script.replace(
+                "{{inputs.parameters.%s}}" % v, "<dflow_batch:%s>" % v)
+        sub_path_artifacts = self.sub_path_artifacts(template)
+        for name in sub_path_artifacts:
+            remote_script = remote_script.replace(
+                "{{inputs.parameters.dflow_%s_sub_path}}" % name,
+                "<dflow_batch:dflow_%s_sub_path>" % name)
+        sliced_output_parameters = {}
+        for name in template.slices.output_parameter + ["dflow_success_tag"]:
+            if name in template.outputs.parameters:
+                sliced_output_parameters[name] = os.path.relpath(
+                    template.outputs.parameters[name].value_from_path, "/")
+        remote_command = template.command if self.remote_command is None \
+            else self.remote_command
+
+        script = self.get_functions()
+        script += "cat <<'EOF'> script\n" + remote_script + "\nEOF\n"
+        script += "cat <<'EOF'> dflow_array.py\n"
+        script += "item_vars = %s\n" % item_vars
+        script += "sub_path_artifacts = %s\n" % sub_path_artifacts
+        script += "sliced_output_parameters = %s\n" % \
+            sliced_output_parameters
+        script += "max_array_size = %s\n" % self.max_array_size
+        script += job_array_helper + "EOF\n"
+        script += "cat <<'EOF'> dflow_with_param\n{{inputs.parameters."\
+            "dflow_with_param}}\nEOF\n"
+        script += "cat <<'EOF'> dflow_sequence\n{\"start\": {{inputs."\
+            "parameters.dflow_sequence_start}}, \"end\": {{inputs.parameters."\
+            "dflow_sequence_end}}, \"count\": {{inputs.parameters."\
+            "dflow_sequence_count}}, \"format\": \"{{inputs.parameters."\
+            "dflow_sequence_format}}\"}\nEOF\n"
+        script += "cat <<'EOF'> dflow_sub_paths\n{{inputs.parameters."\
+            "dflow_batch_sub_paths}}\nEOF\n"
+        # the exit code is recorded per task instead of failing the job
+        script += "cat <<'EOF'> dflow_array.sh\n#!/bin/bash\n%s\n" % \
+            self.header
+        script += "i=$((${1:-0}+$SLURM_ARRAY_TASK_ID))\n"
+        script += "mkdir -p task.$i && cd task.$i && (%s ../dflow_array.py "\
+            "prepare $i && %s); echo $? > dflow_exit_code\nEOF\n" % (
+                self.python_executable, run_script(
+                    template.image, remote_command, self.docker_executable,
+                    self.singularity_executable, self.podman_executable))
+        inputs = [art.path for art in template.inputs.artifacts.values()]
+        for par in template.inputs.parameters.values():
+            if par.save_as_artifact:
+                inputs.append(par.path)
+        inputs += ["script", "dflow_array.py", "dflow_with_param",
+                   "dflow_sequence", "dflow_sub_paths", "dflow_array.sh"]
+        script += self.upload_all(inputs)
+        script += self.execute("cd %s && %s dflow_array.py submit" % (
+            self.workdir, self.python_executable)) + " || exit 1\n"
+        # poll all the arrays over the shared connection
+        script += "while true; do\n"
+        script += "    state=$($SSH -- \"cd %s && if [ -s dflow_job_id ] && "\
+            "squeue -h -j \\$(cat dflow_job_id) 2>/dev/null | grep -q .; "\
+            "then echo running; else echo done; fi\")\n" % self.workdir
+        script += "    if [ \"$state\" = done ]; then\n"
+        script += "        break\n"
+        script += "    fi\n"
+        script += "    sleep %s\n" % self.interval
+        script += "done\n"
+        script += self.execute(
+            "cd %s && if [ -s dflow_job_id ]; then sacct -n -P -X -j $(cat "
+            "dflow_job_id) --format=JobID,State,ExitCode > dflow_sacct; fi; "
+            "%s dflow_array.py collect" % (
+                self.workdir, self.python_executable)) + " || exit 1\n"
+        outputs = [art.path for art in template.outputs.artifacts.values()]
+        for par in template.outputs.parameters.values():
+            if par.save_as_artifact:
+                outputs.append(par.path)
+            elif par.value_from_path is not None:
+                outputs.append(par.value_from_path)
+        outputs += ["/tmp/outputs/parameters/dflow_batch_results",
+                    "/tmp/outputs/dflow_batch_failed"]
+        script += self.download_all(outputs)
+        script += "failed=$(cat /tmp/outputs/dflow_batch_failed)\n"
+        script += "if [ \"$failed\" != 0 ]; then\n"
+        script += "    echo \"$failed items failed\"\n"
+        if "dflow_success_tag" not in template.outputs.parameters:
+            script += "    exit 1\n"
+        script += "fi\n"
+        return script
+
+    def sub_path_artifacts(self, template):
+        return [name for name in template.slices.input_artifact
+                if "dflow_%s_sub_path" % name in template.inputs.parameters]
+
     def render(self, template):
+        if self.is_array(template):
+            # download the whole artifact, each task links its sub path
+            template = deepcopy(template)
+            for name in self.sub_path_artifacts(template):
+                template.inputs.artifacts[name].path = \
+                    "%s/inputs/artifacts/%s" % (template.tmp_root, name)
         new_template = super().render(template)
+        if self.is_array(template):
+            new_template.inputs.parameters["dflow_with_param"] = \
+                InputParameter(value="")
+            new_template.inputs.parameters["dflow_sequence_start"] = \
+                InputParameter(value=0)
+            new_template.inputs.parameters["dflow_sequence_end"] = \
+                InputParameter(value=None)
+            new_template.inputs.parameters["dflow_sequence_count"] = \
+                InputParameter(value=None)
+            new_template.inputs.parameters["dflow_sequence_format"] = \
+                InputParameter(value="")
+            new_template.inputs.parameters["dflow_batch_sub_paths"] = \
+                InputParameter(value="{}")
+            new_template.outputs.parameters["dflow_batch_results"] = \
+                OutputParameter(value_from_path="/tmp/outputs/parameters/"
+                                "dflow_batch_results", default="[]")
         if self.pvc is not None:
             new_template.pvcs.append(self.pvc)
             new_template.mounts.append(V1VolumeMount(
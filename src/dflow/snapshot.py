@@ -0,0 +1,104 @@
+import gzip
+import json
+import logging
+import os
+from typing import Optional
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+# failed workflows may be retried or resubmitted, only succeeded ones are
+# final
+snapshot_phases = ["Succeeded"]
+
+
+class SnapshotStore:
+    """
+    Local store of succeeded workflows, a snapshot is saved as
+    <root>/<namespace>/<name>/<uid>.json.gz and is only found by the UID
+    of the workflow, as a name may be reused by another workflow
+
+    Args:
+        root: root directory of the store, default to config["snapshot_dir"]
+    """
+
+    def __init__(
+            self,
+            root: Optional[str] = None,
+    ) -> None:
+        if root is None:
+            root = config["snapshot_dir"]
+        self.root = os.path.expanduser(root)
+
+    def path(self, namespace, name, uid, ext=".json.gz"):
+        return os.path.join(self.root, namespace, name, uid + ext)
+
+    def find(self, namespace, name, uid=None, ext=".json.gz"):
+        if uid is None:
+            return None
+        path = self.path(namespace, name, uid, ext)
+        return path if os.path.isfile(path) else None
+
+    def load(self, namespace, name, uid=None) -> Optional[dict]:
+        path = self.find(namespace, name, uid)
+        if path is None:
+            return None
+        try:
+            with gzip.open(path, "rt") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning("Failed to load snapshot %s: %s" % (path, e))
+            return None
+
+    def save(self, workflow: dict, namespace: Optional[str] = None) -> str:
+        metadata = workflow["metadata"]
+        if metadata.get("uid") is None:
+            raise ValueError("Workflow %s without UID can not be saved" %
+                             metadata["name"])
+        if namespace is None:
+            namespace = metadata.get("namespace", config["namespace"])
+        name = metadata["name"]
+        path = self.path(namespace, name, metadata["uid"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.%s.tmp" % (path, os.getpid())
+        with gzip.open(tmp, "wt") as f:
+            json.dump(workflow, f)
+        os.replace(tmp, path)
+        logger.debug("saved snapshot %s" % path)
+        return path
+
+    def remove(self, namespace, name, uid=None) -> None:
+        for ext in [".json.gz", ".archived"]:
+            path = self.find(namespace, name, uid, ext)
+            if path is not None:
+                os.remove(path)
+
+    def is_archived(self, namespace, name, uid=None) -> bool:
+        return self.find(namespace, name, uid, ".archived") is not None
+
+    def mark_archived(self, namespace, name, uid) -> None:
+        if uid is None:
+            return
+        path = self.path(namespace, name, uid, ".archived")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+
+    def export(self, namespace, name, uid, output) -> Optional[str]:
+        workflow = self.load(namespace, name, uid)
+        if workflow is None:
+            return None
+        with gzip.open(output, "wt") as f:
+            json.dump(workflow, f)
+        return output
+
+    def import_(self, input) -> str:
+        with gzip.open(input, "rt") as f:
+            workflow = json.load(f)
+        return self.save(workflow)
+
+
+def get_snapshot_store() -> Optional[SnapshotStore]:
+    if config["snapshot_dir"] is None:
+        return None
+    return SnapshotStore()
@@ -23,7 +23,8 @@ from .op_template import (OPTemplate, PythonScriptOPTemplate, ScriptOPTemplate,
                           ShellOPTemplate)
 from .python import Slices
 from .resource import Resource
-from .util_ops import CheckNumSuccess, CheckSuccessRatio, InitArtifactForSlices
+from .util_ops import (CheckNumSuccess, CheckSuccessRatio,
+                       InitArtifactForSlices, MergeCatalog)
 from .utils import (ProcessPoolExecutor, catalog_of_artifact, copy_file,
                     download_s3, evalable_repr, flatten, force_link, get_key,
                     merge_dir, randstr, upload_artifact)
@@ -378,6 +379,7 @@ class Step:
         self.continue_on_success_ratio = continue_on_success_ratio
         self.check_step = None
         self.prepare_step = None
+        self.merge_step = None
 
         if parameters is not None:
             self.set_parameters(parameters)
@@ -630,6 +632,19 @@ class Step:
                 self.outputs.artifacts[name].redirect = \
                     self.prepare_step.outputs.artifacts[name]
 
+            # artifacts are local in the debug mode
+            if sliced_output_artifact and config["merge_sliced_catalog"] and \
+                    config["mode"] != "debug":
+                self.merge_step = self.__class__(
+                    name="%s-merge-catalog" % self.name,
+                    template=MergeCatalog(
+                        self.template, self.util_image, self.util_command,
+                        self.util_image_pull_policy, sliced_output_artifact),
+                    parameters={"dflow_artifact_key": self.prepare_step.outputs
+                                .parameters["dflow_artifact_key"]},
+                    artifacts={name: self.outputs.artifacts[name]
+                               for name in sliced_output_artifact})
+
             if isinstance(self.with_param, ArgoRange) and \
                     isinstance(self.with_param.end, ArgoSum):
                 name = sum_var.name
@@ -975,7 +990,7 @@ class Step:
             self.executor.modify_step(self)
 
         if GLOBAL_CONTEXT.in_context:
-            if not self.name.endswith('init-artifact'):
+            if not self.name.endswith(('init-artifact', 'merge-catalog')):
                 GLOBAL_CONTEXT.current_workflow.add(self)
             else:
                 if self.name.endswith('init-artifact-init-artifact'):
@@ -1307,9 +1322,12 @@ class Step:
     def render_by_executor(self, context=None):
         if self.executor is not None:
             assert isinstance(self.executor, Executor)
+            # only sliced templates are batched by the executor, others keep
+            # their fan-out by Argo
+            merge = getattr(self.executor, "merge_sliced_step", False) and \
+                getattr(self.template, "slices", None) is not None
             self.template = self.executor.render(self.template)
-            if hasattr(self.executor, "merge_sliced_step") and \
-                    self.executor.merge_sliced_step:
+            if merge:
                 self.inputs.parameters["dflow_with_param"] = \
                     InputParameter(value="")
                 self.inputs.parameters["dflow_sequence_start"] = \
@@ -1345,6 +1363,29 @@ class Step:
                 if self.key is not None:
                     self.inputs.parameters["dflow_key"] = InputParameter(
                         value=str(self.key).replace("{{item}}", key))
+                # download whole artifacts sliced by item, the batched pod
+                # renders the sub path of each item from the path segment
+                # containing the item (e.g. group_{{item}})
+                sub_paths = {}
+                for name, art in self.inputs.artifacts.items():
+                    if art.sp is not None and "{{item" in art.sp:
+                        i = art.sp.rfind("/", 0, art.sp.find("{{item")) + 1
+                        sub_paths[name] = art.sp[i:]
+                        art.sp = art.sp[:i].rstrip("/") or None
+                    elif isinstance(art.source, S3Artifact) and \
+                            "{{item" in art.source.key:
+                        i = art.source.key.rfind(
+                            "/", 0, art.source.key.find("{{item")) + 1
+                        sub_paths[name] = art.source.key[i:]
+                        art.source = deepcopy(art.source)
+                        art.source.key = art.source.key[:i].rstrip("/")
+                    if "dflow_%s_sub_path" % name in self.inputs.parameters:
+                        self.inputs.parameters[
+                            "dflow_%s_sub_path" % name].value = "."
+                if "dflow_batch_sub_paths" in self.template.inputs.parameters:
+                    self.inputs.parameters["dflow_batch_sub_paths"] = \
+                        InputParameter(value=json.dumps(sub_paths).replace(
+                            "{{", "<").replace("}}", ">"))
         elif context is not None:
             self.template = context.render(self.template)
 
@@ -106,6 +106,14 @@ class Steps(OPTemplate):
                            if ps.check_step is not None]
             if check_steps:
                 self.steps.append(check_steps)
+        if isinstance(step, Step):
+            if step.merge_step is not None:
+                self.steps.append(step.merge_step)
+        elif isinstance(step, list):
+            merge_steps = [ps.merge_step for ps in step
+                           if ps.merge_step is not None]
+            if merge_steps:
+                self.steps.append(merge_steps)
 
     def convert_to_argo(self, memoize_prefix=None,
                         memoize_configmap="dflow", context=None):
@@ -147,7 +155,8 @@ class Steps(OPTemplate):
             for ps in step:
                 if not ps.name.endswith("-init-artifact") and \
                     not ps.name.endswith("-check-num-success") and \
-                        not ps.name.endswith("-check-success-ratio"):
+                        not ps.name.endswith("-check-success-ratio") and \
+                        not ps.name.endswith("-merge-catalog"):
                     graph_parallel_steps.append(ps.convert_to_graph())
                     templates.append(ps.template)
             if len(graph_parallel_steps) > 0:
@@ -4,6 +4,7 @@ from .config import config
 from .io import (InputArtifact, InputParameter, Inputs, OutputArtifact,
                  OutputParameter)
 from .op_template import PythonScriptOPTemplate, ShellOPTemplate
+from .utils import merged_catalog_name
 
 
 class InitArtifactForSlices(PythonScriptOPTemplate):
@@ -132,6 +133,7 @@ class InitArtifactForSlices(PythonScriptOPTemplate):
             required = []
             for i, name in enumerate(self.sliced_input_artifact):
                 script += "path_list_%s = []\n" % i
+                script += "seen = set()\n"
                 if self.group_size is not None:
                     script += "path = r'%s/inputs/artifacts/%s/%s'\n" % \
                         (self.tmp_root, name, config["catalog_dir_name"])
@@ -143,7 +145,9 @@ class InitArtifactForSlices(PythonScriptOPTemplate):
                 script += "        with open(os.path.join(path, f), 'r')"\
                     " as fd:\n"
                 script += "            for i in json.load(fd)['path_list']:\n"
-                script += "                if i not in path_list_%s:\n" % i
+                script += "                k = json.dumps(i, sort_keys=True)\n"
+                script += "                if k not in seen:\n"
+                script += "                    seen.add(k)\n"
                 script += "                    path_list_%s.append(i)\n" % i
                 script += "path_list_%s.sort(key=lambda x: x['order'])\n" \
                     % i
@@ -155,7 +159,27 @@ class InitArtifactForSlices(PythonScriptOPTemplate):
                     ["len(path_list_%s)" % i for i in required]) + "\n"
 
             if self.group_size is not None:
-                script += "import math, shutil\n"
+                script += "import concurrent.futures, math, shutil\n"
+                script += "def link_or_copy(src, dst):\n"
+                script += "    try:\n"
+                script += "        os.link(src, dst)\n"
+                script += "    except OSError:\n"
+                script += "        shutil.copy(src, dst)\n"
+                script += "def stage(src, dst):\n"
+                script += "    os.makedirs(os.path.dirname(dst), exist_ok="\
+                    "True)\n"
+                script += "    if os.path.isfile(src):\n"
+                script += "        link_or_copy(src, dst)\n"
+                script += "    elif os.path.isdir(src):\n"
+                script += "        shutil.copytree(src, dst, copy_function="\
+                    "link_or_copy)\n"
+                script += "def write_catalog(group_dir, path_list):\n"
+                script += "    cat = os.path.join(group_dir, '%s')\n" % \
+                    config["catalog_dir_name"]
+                script += "    os.makedirs(cat, exist_ok=True)\n"
+                script += "    with open(os.path.join(cat, 'catalog'), 'w')"\
+                    " as f:\n"
+                script += "        json.dump({'path_list': path_list}, f)\n"
                 script += "nslices = len(path_list_%s)\n" % required[0]
                 script += "ngroups = math.ceil(nslices/%s)\n" % self.group_size
                 if self.template.slices.shuffle:
@@ -165,39 +189,34 @@ class InitArtifactForSlices(PythonScriptOPTemplate):
                     script += "shuffled = list(range(nslices))\n"
                     script += "random.shuffle(shuffled)\n"
                     script += "random.seed()\n"  # unset seed
+                script += "staged = []\n"
+                script += "catalogs = []\n"
                 script += "for i in range(ngroups):\n"
                 for i, name in enumerate(self.sliced_input_artifact):
-                    script += "    if not path_list_%s:\n" % i
-                    script += "        continue\n"
-                    script += "    group_dir = r'%s/outputs/artifacts/%s/"\
+                    script += "    if path_list_%s:\n" % i
+                    script += "        group_dir = r'%s/outputs/artifacts/%s/"\
                         "group_' + ('%s' %% i)\n" % (
                             self.tmp_root, name, self.format or "%d")
-                    script += "    os.makedirs(group_dir, exist_ok=True)\n"
                     if self.template.slices.shuffle:
-                        script += "    path_list = [path_list_%s[j] for j in "\
-                            "shuffled[%s*i:%s*(i+1)]]\n" % (
+                        script += "        path_list = [path_list_%s[j] for j"\
+                            " in shuffled[%s*i:%s*(i+1)]]\n" % (
                                 i, self.group_size, self.group_size)
                     else:
-                        script += "    path_list = path_list_%s[%s*i:%s*(i+1)"\
-                            "]\n" % (i, self.group_size, self.group_size)
-                    script += "    for item in path_list:\n"
-                    script += "        src = r'%s/inputs/artifacts/%s/'+item"\
-                        "['dflow_list_item']\n" % (self.tmp_root, name)
-                    script += "        dst = group_dir+'/'+item['dflow_list"\
-                        "_item']\n"
-                    script += "        os.makedirs(os.path.dirname(dst),"\
-                        " exist_ok=True)\n"
-                    script += "        if os.path.isfile(src):\n"
-                    script += "            shutil.copy(src, dst)\n"
-                    script += "        elif os.path.isdir(src):\n"
-                    script += "            shutil.copytree(src, dst)\n"
-                    script += "    cat = os.path.join(group_dir, '%s')\n" % \
-                        config["catalog_dir_name"]
-                    script += "    os.makedirs(cat, exist_ok=True)\n"
-                    script += "    with open(os.path.join(cat, 'catalog'), "\
-                        "'w') as f:\n"
-                    script += "        json.dump({'path_list': path_list}, f)"\
-                        "\n"
+                        script += "        path_list = path_list_%s[%s*i:%s*"\
+                            "(i+1)]\n" % (i, self.group_size, self.group_size)
+                    script += "        for item in path_list:\n"
+                    script += "            staged.append((r'%s/inputs/"\
+                        "artifacts/%s/' + item['dflow_list_item'], group_dir"\
+                        " + '/' + item['dflow_list_item']))\n" % (
+                            self.tmp_root, name)
+                    script += "        catalogs.append((group_dir, path_list"\
+                        "))\n"
+                # hardlink (or copy across devices) files into groups
+                script += "with concurrent.futures.ThreadPoolExecutor() as "\
+                    "pool:\n"
+                script += "    list(pool.map(lambda x: stage(*x), staged))\n"
+                script += "    list(pool.map(lambda x: write_catalog(*x), "\
+                    "catalogs))\n"
                 script += "os.makedirs(r'%s/outputs/parameters', exist_ok="\
                     "True)\n" % self.tmp_root
                 script += "with open(r'%s/outputs/parameters/dflow_ngroups'"\
@@ -290,6 +309,61 @@ with open(r'%s/outputs/parameters/concat_%s', 'w') as f:
         self.script = script
 
 
+class MergeCatalog(PythonScriptOPTemplate):
+    """
+    Merge the catalog fragments written by the slices of a sliced step into
+    a single catalog object saved along with them
+    """
+
+    def __init__(self, template, image, command, image_pull_policy,
+                 sliced_output_artifact, tmp_root="/tmp"):
+        super().__init__(name="%s-merge-catalog" % template.name,
+                         image=image, command=command,
+                         image_pull_policy=image_pull_policy)
+        self.sliced_output_artifact = sliced_output_artifact
+        self.tmp_root = tmp_root
+        self.inputs.parameters["dflow_artifact_key"] = InputParameter()
+        for name in self.sliced_output_artifact:
+            # only the catalog fragments are downloaded
+            self.inputs.artifacts[name] = InputArtifact(
+                path="%s/inputs/artifacts/%s" % (self.tmp_root, name),
+                optional=True, sub_path=config["catalog_dir_name"])
+            self.outputs.artifacts[name] = OutputArtifact(
+                path="%s/outputs/artifacts/%s/%s" % (
+                    self.tmp_root, name, merged_catalog_name),
+                save=S3Artifact(
+                    key="{{inputs.parameters.dflow_artifact_key}}/%s/%s/%s"
+                    % (name, config["catalog_dir_name"], merged_catalog_name)),
+                archive=None)
+        self.render_script()
+
+    def render_script(self):
+        script = "import os, json\n"
+        script += "def merge(path, merged):\n"
+        script += "    path_list = []\n"
+        script += "    seen = set()\n"
+        script += "    fragments = []\n"
+        script += "    if os.path.exists(path):\n"
+        script += "        for f in sorted(os.listdir(path)):\n"
+        script += "            if f != '%s':\n" % merged_catalog_name
+        script += "                fragments.append(f)\n"
+        script += "            with open(os.path.join(path, f), 'r') as fd:\n"
+        script += "                for i in json.load(fd)['path_list']:\n"
+        script += "                    k = json.dumps(i, sort_keys=True)\n"
+        script += "                    if k not in seen:\n"
+        script += "                        seen.add(k)\n"
+        script += "                        path_list.append(i)\n"
+        script += "    os.makedirs(os.path.dirname(merged), exist_ok=True)\n"
+        script += "    with open(merged, 'w') as f:\n"
+        script += "        json.dump({'path_list': path_list, 'fragments': "\
+            "fragments}, f)\n"
+        for name in self.sliced_output_artifact:
+            script += "merge(r'%s/inputs/artifacts/%s', r'%s/outputs/"\
+                "artifacts/%s/%s')\n" % (self.tmp_root, name, self.tmp_root,
+                                         name, merged_catalog_name)
+        self.script = script
+
+
 class CheckNumSuccess(ShellOPTemplate):
     def __init__(self, name="check-num-success", image=None,
                  image_pull_policy=None):
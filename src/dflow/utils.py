@@ -3,7 +3,10 @@ import concurrent.futures
 import contextlib
 import hashlib
 import inspect
+import itertools
+import json
 import logging
+import numbers
 import os
 import pkgutil
 import random
@@ -15,21 +18,18 @@ import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
 import uuid
 from abc import ABC
+from collections import OrderedDict
+from collections.abc import Sequence
 from functools import partial
 from pathlib import Path, PosixPath, WindowsPath
-from typing import Dict, List, Optional, Set, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
 
 from .common import LocalArtifact, S3Artifact, jsonpickle
 from .config import config, s3_config
 
-try:
-    from minio import Minio
-    from minio.api import CopySource
-except Exception:
-    pass
-
 
 def get_key(artifact, raise_error=True):
     if hasattr(artifact, "s3") and hasattr(artifact.s3, "key"):
@@ -137,20 +137,13 @@ def download_artifact(
 
 def flatten(d: Union[list, dict]) -> dict:
     def handle(obj, prefix):
-        if isinstance(obj, dict):
-            for k, v in obj.items():
-                key = prefix + "." + k if prefix else k
-                if isinstance(v, (list, dict)):
-                    handle(v, key)
-                else:
-                    flat[key] = v
-        elif isinstance(obj, list):
-            for i, v in enumerate(obj):
-                key = prefix + "." + str(i) if prefix else str(i)
-                if isinstance(v, (list, dict)):
-                    handle(v, key)
-                else:
-                    flat[key] = v
+        items = obj.items() if isinstance(obj, dict) else enumerate(obj)
+        for k, v in items:
+            key = prefix + str(k) if prefix else str(k)
+            if isinstance(v, (list, dict)):
+                handle(v, key + ".")
+            else:
+                flat[key] = v
     flat = {}
     handle(d, "")
     return flat
@@ -160,32 +153,54 @@ def dict2list(d: dict):
     for k, v in d.items():
         if isinstance(v, dict):
             d[k] = dict2list(v)
+    return dict_to_list(d)
+
+
+def dict_to_list(d: dict):
+    """
+    Convert a dict with integer keys into a list, or return the dict
+    otherwise, without converting the values
+    """
     try:
-        lst = []
-        for k, v in d.items():
-            i = int(k)
+        indices = [int(k) for k in d]
+    except Exception:
+        return d
+    if not indices or min(indices) >= 0:
+        lst = [None] * (max(indices) + 1 if indices else 0)
+        for i, v in zip(indices, d.values()):
+            lst[i] = v
+        return lst
+    # negative indices count from the end of the list built so far
+    lst = []
+    try:
+        for i, v in zip(indices, d.values()):
             if i < len(lst):
                 lst[i] = v
             else:
                 lst += [None] * (i - len(lst)) + [v]
-        return lst
-    except Exception:
+    except IndexError:
         return d
+    return lst
 
 
 def expand(d: dict) -> Union[list, dict]:
     exp = {}
+    # nested dicts created, converted into lists bottom-up in the end
+    nested = []
     for k, v in d.items():
         fields = str(k).split(".")
         tmp = exp
         for field in fields[:-1]:
             if field not in tmp:
                 tmp[field] = {}
+                nested.append((tmp, field))
             tmp = tmp[field]
-        field = fields[-1]
-        tmp[field] = v
-    exp = dict2list(exp)
-    return exp
+        if isinstance(v, dict):
+            v = dict2list(v)
+        tmp[fields[-1]] = v
+    for parent, field in reversed(nested):
+        parent[field] = dict_to_list(parent[field])
+    return dict_to_list(exp)
 
 
 def upload_artifact(
@@ -333,6 +348,95 @@ def get_md5(f):
     return md5.hexdigest()
 
 
+def resolve_dir_key(client, key):
+    """
+    Resolve a key to the directory object under it, if it is the only
+    object listed (only the first two entries are listed)
+    """
+    objs = list(itertools.islice(client.iter_list(prefix=key), 2))
+    if len(objs) == 1 and objs[0][-1] == "/":
+        return objs[0]
+    return key
+
+
+def run_streaming(func, items, max_workers=None):
+    """
+    Call a function on items as they are produced (e.g. keys from a
+    listing) in a thread pool, so that the calls overlap with producing
+    the items, at most twice as many calls as workers are pending
+
+    Args:
+        func: the function
+        items: iterable of items
+        max_workers: number of threads, default to
+            config["transfer_pool_workers"]
+    """
+    if max_workers is None:
+        max_workers = config["transfer_pool_workers"]
+    with concurrent.futures.ThreadPoolExecutor(max(1, max_workers)) as pool:
+        pending = set()
+        for item in items:
+            pending.add(pool.submit(func, item))
+            if len(pending) >= 2 * max_workers:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+        for future in concurrent.futures.as_completed(pending):
+            future.result()
+
+
+def iter_list_sharded(iter_list, prefix, max_workers=None):
+    """
+    List keys under a prefix recursively, fanning out the listings of the
+    common prefixes at its first level to a thread pool, keys are yielded
+    shard by shard as the listings complete
+
+    Args:
+        iter_list: function (prefix, recursive) listing keys, with common
+            prefixes (ending with "/") when not recursive
+        prefix: the prefix
+        max_workers: number of threads, default to
+            config["list_shard_workers"]
+    """
+    if max_workers is None:
+        max_workers = config["list_shard_workers"]
+    if max_workers <= 1:
+        yield from iter_list(prefix, True)
+        return
+    shards = []
+    for key in iter_list(prefix, False):
+        if key[-1:] != "/":
+            yield key
+        elif key != prefix:
+            shards.append(key)
+    if len(shards) <= 1:
+        for shard in shards:
+            yield from iter_list(shard, True)
+        return
+
+    def list_shard(shard):
+        return list(iter_list(shard, True))
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+    pending = set()
+    try:
+        shards = iter(shards)
+        pending.update(pool.submit(list_shard, shard) for shard in
+                       itertools.islice(shards, 2 * max_workers))
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for shard in itertools.islice(shards, len(done)):
+                pending.add(pool.submit(list_shard, shard))
+            for future in done:
+                yield from future.result()
+    finally:
+        # cancel_futures of shutdown requires python 3.9
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
 def download_s3(
         key: str,
         path: os.PathLike = ".",
@@ -350,7 +454,8 @@ def download_s3(
         client = MinioClient(**kwargs)
     if recursive:
         from tqdm import tqdm
-        for obj in tqdm(client.list(prefix=key, recursive=True)):
+
+        def download(obj):
             rel_path = obj[len(key):]
             if rel_path[:1] == "/":
                 rel_path = rel_path[1:]
@@ -366,9 +471,11 @@ def download_s3(
                 local_md5 = get_md5(file_path)
                 if remote_md5 == local_md5:
                     logging.debug("skip object: %s" % obj)
-                    continue
+                    return
 
             client.download(key=obj, path=file_path)
+        run_streaming(download, tqdm(client.iter_list(prefix=key,
+                                                      recursive=True)))
     else:
         path = os.path.join(path, os.path.basename(key))
         client.download(key=key, path=path)
@@ -405,9 +512,7 @@ def upload_s3(
     elif prefix is not None:
         if prefix[-1] != "/":
             prefix += "/"
-        objs = client.list(prefix=prefix)
-        if len(objs) == 1 and objs[0][-1] == "/":
-            prefix = objs[0]
+        prefix = resolve_dir_key(client, prefix)
         key = "%s%s" % (prefix, os.path.basename(path))
     else:
         key = "%supload/%s/%s" % (s3_config["prefix"],
@@ -446,25 +551,47 @@ def copy_s3(
     if recursive:
         if src_key[-1] != "/":
             src_key += "/"
-        src_objs = client.list(prefix=src_key)
-        if len(src_objs) == 1 and src_objs[0][-1] == "/":
-            src_key = src_objs[0]
+        src_key = resolve_dir_key(client, src_key)
         if dst_key[-1] != "/":
             dst_key += "/"
-        dst_objs = client.list(prefix=dst_key)
-        if len(dst_objs) == 1 and dst_objs[0][-1] == "/":
-            dst_key = dst_objs[0]
-        for obj in client.list(prefix=src_key, recursive=True):
+        dst_key = resolve_dir_key(client, dst_key)
+
+        def copy(obj):
             if ignore_catalog:
                 fields = obj.split("/")
                 if len(fields) > 1 and fields[-2] == \
                         config["catalog_dir_name"]:
-                    continue
+                    return
             client.copy(obj, dst_key + obj[len(src_key):])
+        run_streaming(copy, client.iter_list(prefix=src_key, recursive=True))
     else:
         client.copy(src_key, dst_key)
 
 
+merged_catalog_name = "merged"
+# least recently used catalogs by the prefix of their fragments
+catalog_cache = OrderedDict()
+catalog_cache_lock = threading.Lock()
+
+
+def get_cached_catalog(prefix, fragments):
+    with catalog_cache_lock:
+        cached = catalog_cache.get(prefix)
+        # the catalog is immutable as long as its fragments do not change
+        if cached is None or cached[0] != set(fragments):
+            return None
+        catalog_cache.move_to_end(prefix)
+        return cached[1]
+
+
+def cache_catalog(prefix, fragments, items):
+    with catalog_cache_lock:
+        catalog_cache[prefix] = (set(fragments), items)
+        catalog_cache.move_to_end(prefix)
+        while len(catalog_cache) > max(config["catalog_cache_size"], 0):
+            catalog_cache.popitem(last=False)
+
+
 def catalog_of_artifact(art, storage_client=None, **kwargs) -> List[dict]:
     key = get_key(art, raise_error=False)
     if not key:
@@ -478,19 +605,107 @@ def catalog_of_artifact(art, storage_client=None, **kwargs) -> List[dict]:
         client = s3_config["storage_client"]
     else:
         client = MinioClient(**kwargs)
-    catalog = []
+    key = resolve_dir_key(client, key)
+    prefix = key + config["catalog_dir_name"] + "/"
+    fragments = [obj[len(prefix):] for obj in client.iter_list(prefix=prefix)]
+    cached = get_cached_catalog(prefix, fragments)
+    if cached is not None:
+        return [dict(item) for item in cached]
+
+    catalog = Catalog()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        def download(fname):
+            path = os.path.join(tmpdir, fname)
+            client.download(key=prefix + fname, path=path)
+            with open(path, "r") as f:
+                return loads_catalog(f.read())
+
+        if merged_catalog_name in fragments:
+            merged = download(merged_catalog_name)
+            catalog.extend(merged["path_list"])
+            covered = set(merged.get("fragments", [])) | {
+                merged_catalog_name}
+            fragments_to_load = [f for f in fragments if f not in covered]
+        else:
+            fragments_to_load = fragments
+        if fragments_to_load:
+            with concurrent.futures.ThreadPoolExecutor(
+                    config["catalog_pool_workers"]) as executor:
+                for content in executor.map(download, fragments_to_load):
+                    catalog.extend(content["path_list"])
+    cache_catalog(prefix, fragments, catalog.items)
+    return [dict(item) for item in catalog.items]
+
+
+def staging_stats_of_artifact(art, storage_client=None,
+                              **kwargs) -> List[dict]:
+    """
+    Get the staging statistics of an output artifact recorded by the pods
+    producing it, one for each catalog fragment
+
+    Args:
+        art: the artifact
+    Returns:
+        list of dicts with the number of files and the staging time in
+        seconds
+    """
+    key = get_key(art, raise_error=False)
+    if not key:
+        return []
+    if key[-1] != "/":
+        key += "/"
+    if storage_client is None:
+        storage_client = s3_config["storage_client"]
+    if storage_client is None:
+        storage_client = MinioClient(**kwargs)
+    key = resolve_dir_key(storage_client, key)
+    prefix = key + config["catalog_dir_name"] + "/"
+    stats = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for obj in storage_client.iter_list(prefix=prefix):
+            if obj[len(prefix):] == merged_catalog_name:
+                continue
+            path = os.path.join(tmpdir, obj[len(prefix):])
+            storage_client.download(key=obj, path=path)
+            with open(path, "r") as f:
+                content = loads_catalog(f.read())
+            if "staging" in content:
+                stats.append(content["staging"])
+    return stats
+
+
+def merge_catalog_of_artifact(art, storage_client=None, **kwargs) -> int:
+    """
+    Write a merged catalog object for an artifact (e.g. the output of a
+    sliced step), so that readers download one object instead of one
+    catalog fragment per slice
+
+    Args:
+        art: the artifact
+    Returns:
+        the number of items in the catalog
+    """
+    if storage_client is None:
+        storage_client = s3_config["storage_client"]
+    if storage_client is None:
+        storage_client = MinioClient(**kwargs)
+    key = get_key(art)
+    if key[-1] != "/":
+        key += "/"
+    key = resolve_dir_key(storage_client, key)
+    prefix = key + config["catalog_dir_name"] + "/"
+    # list fragments before reading, fragments written in between will be
+    # read but not recorded as covered
+    fragments = [obj[len(prefix):] for obj in storage_client.iter_list(
+        prefix=prefix) if obj[len(prefix):] != merged_catalog_name]
+    catalog = catalog_of_artifact(art, storage_client=storage_client)
     with tempfile.TemporaryDirectory() as tmpdir:
-        objs = client.list(prefix=key)
-        if len(objs) == 1 and objs[0][-1] == "/":
-            key = objs[0]
-        prefix = key + config["catalog_dir_name"] + "/"
-        for obj in client.list(prefix=prefix):
-            fname = obj[len(prefix):]
-            client.download(key=obj, path=os.path.join(tmpdir, fname))
-            with open(os.path.join(tmpdir, fname), "r") as f:
-                for item in jsonpickle.loads(f.read())['path_list']:
-                    append_item(catalog, item)
-    return catalog
+        path = os.path.join(tmpdir, merged_catalog_name)
+        with open(path, "w") as f:
+            f.write(jsonpickle.dumps({"path_list": catalog,
+                                      "fragments": fragments}))
+        storage_client.upload(key=prefix + merged_catalog_name, path=path)
+    return len(catalog)
 
 
 def path_list_of_artifact(art, **kwargs) -> List[str]:
@@ -571,25 +786,142 @@ def append_item(catalog, item):
         catalog.append(item)
 
 
+def loads_catalog(s: str) -> dict:
+    """
+    Load a catalog, with the plain JSON parser unless it contains
+    jsonpickle tags which are much slower to restore
+    """
+    if "py/" in s or "json://" in s:
+        return jsonpickle.loads(s)
+    return json.loads(s)
+
+
+class Catalog:
+    """
+    Catalog of an artifact, items are indexed by order so that merging n
+    items takes O(n) with the same semantics as append_item
+    """
+
+    def __init__(self, items=None):
+        self.items = []
+        self.index = {}
+        if items is not None:
+            self.extend(items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def add(self, item):
+        order = item["order"]
+        try:
+            citems = self.index.setdefault(order, [])
+        except TypeError:
+            citems = self.index.setdefault(repr(order), [])
+        for citem in citems:
+            # remove duplicate
+            if citem == item:
+                return
+            # override None
+            if citem["dflow_list_item"] is None:
+                citem["dflow_list_item"] = item["dflow_list_item"]
+                return
+            if item["dflow_list_item"] is None:
+                return
+        citems.append(item)
+        self.items.append(item)
+
+    def extend(self, items):
+        for item in items:
+            self.add(item)
+
+    def load(self, path):
+        with open(path, "r") as f:
+            self.extend(loads_catalog(f.read())["path_list"])
+
+
 def catalog_of_local_artifact(art_path, remove=False):
-    catalog = []
+    catalog = Catalog()
     if os.path.isdir(art_path):
         catalog_dir = os.path.join(art_path, config["catalog_dir_name"])
         if os.path.exists(catalog_dir):
             for f in os.listdir(catalog_dir):
-                with open(os.path.join(catalog_dir, f), 'r') as fd:
-                    for item in jsonpickle.loads(fd.read())['path_list']:
-                        append_item(catalog, item)
+                catalog.load(os.path.join(catalog_dir, f))
             if remove:
                 shutil.rmtree(catalog_dir)
-    return catalog
+    return catalog.items
+
+
+class PathList(Sequence):
+    """
+    Compact list of paths in an artifact, i.e. a prefix and the relative
+    paths, the full paths are joined only when accessed
+
+    Indexing by int, slice, range or list of ints does not copy the paths.
+
+    Args:
+        prefix: local path of the artifact, or None
+        items: relative paths (None for absent items)
+        indices: indices of the items in this view, all by default
+    """
+
+    def __init__(self, prefix, items, indices=None):
+        self.prefix = prefix
+        self.items = items
+        self.indices = range(len(items)) if indices is None else indices
+        if prefix and not prefix.endswith(os.sep):
+            prefix += os.sep
+        self.base = prefix
+
+    def join(self, item):
+        if item is None or self.base is None or os.path.isabs(item):
+            return item
+        return self.base + item
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        # also numpy integers
+        if isinstance(index, numbers.Integral):
+            return self.join(self.items[self.indices[index]])
+        if isinstance(index, (slice, range)):
+            if isinstance(index, range):
+                index = slice(index.start, index.stop, index.step)
+            indices = self.indices[index]
+        else:
+            indices = [self.indices[i] for i in index]
+        return PathList(self.prefix, self.items, indices)
+
+    def __iter__(self):
+        join = self.join
+        items = self.items
+        return (join(items[i]) for i in self.indices)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, PathList)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return "PathList(%r)" % self.tolist()
 
+    def tolist(self) -> List[Optional[str]]:
+        return list(self)
 
-def assemble_path_object_from_catalog(catalog, art_path=None):
+    def to_paths(self) -> List[Optional[Path]]:
+        return [None if p is None else Path(p) for p in self]
+
+
+def assemble_path_object_from_catalog(catalog, art_path=None, lazy=False):
     if len(catalog) == 0:
         return catalog
     elif all([isinstance(x["order"], int) for x in catalog]):
         # old fashion
+        if lazy:
+            return PathList(art_path, convert_dflow_list(catalog))
         return [os.path.join(art_path, x) if art_path is not None and
                 x is not None else x for x in convert_dflow_list(catalog)]
     else:
@@ -600,9 +932,18 @@ def assemble_path_object_from_catalog(catalog, art_path=None):
                        v is not None else v for k, v in path_dict.items()})
 
 
-def assemble_path_object(art_path, remove=False):
+def assemble_path_object(art_path, remove=False, lazy=False):
+    """
+    Assemble the path object of a local artifact from its catalog
+
+    Args:
+        art_path: local path of the artifact
+        remove: remove the catalog after assembling
+        lazy: return a PathList instead of a list for list artifacts
+    """
     catalog = catalog_of_local_artifact(art_path, remove=remove)
-    return assemble_path_object_from_catalog(catalog, art_path=art_path)
+    return assemble_path_object_from_catalog(catalog, art_path=art_path,
+                                             lazy=lazy)
 
 
 def convert_dflow_list(dflow_list):
@@ -832,6 +1173,13 @@ class StorageClient(ABC):
     def list(self, prefix: str, recursive: bool = False) -> List[str]:
         pass
 
+    def iter_list(self, prefix: str, recursive: bool = False) -> Iterator[str]:
+        """
+        List keys under a prefix as they are fetched, override it in clients
+        listing page by page
+        """
+        yield from self.list(prefix=prefix, recursive=recursive)
+
     @abc.abstractmethod
     def copy(self, src: str, dst: str) -> None:
         pass
@@ -848,8 +1196,10 @@ class MinioClient(StorageClient):
                  secret_key: Optional[str] = None,
                  secure: Optional[bool] = None,
                  bucket_name: Optional[str] = None,
+                 list_shard_workers: Optional[int] = None,
                  **kwargs,
                  ) -> None:
+        from minio import Minio
         self.client = Minio(
             endpoint=endpoint if endpoint is not None else
             s3_config["endpoint"],
@@ -861,6 +1211,7 @@ class MinioClient(StorageClient):
         )
         self.bucket_name = bucket_name if bucket_name is not None else \
             s3_config["bucket_name"]
+        self.list_shard_workers = list_shard_workers
 
     def upload(self, key: str, path: str) -> None:
         self.client.fput_object(bucket_name=self.bucket_name,
@@ -871,10 +1222,22 @@ class MinioClient(StorageClient):
                                 object_name=key, file_path=path)
 
     def list(self, prefix: str, recursive: bool = False) -> List[str]:
-        return [obj.object_name for obj in self.client.list_objects(
-            bucket_name=self.bucket_name, prefix=prefix, recursive=recursive)]
+        return list(self.iter_list(prefix=prefix, recursive=recursive))
+
+    def _iter_list(self, prefix, recursive):
+        for obj in self.client.list_objects(
+                bucket_name=self.bucket_name, prefix=prefix,
+                recursive=recursive):
+            yield obj.object_name
+
+    def iter_list(self, prefix: str, recursive: bool = False) -> Iterator[str]:
+        if recursive:
+            return iter_list_sharded(self._iter_list, prefix,
+                                     self.list_shard_workers)
+        return self._iter_list(prefix, recursive)
 
     def copy(self, src: str, dst: str) -> None:
+        from minio.api import CopySource
         self.client.copy_object(self.bucket_name, dst,
                                 CopySource(self.bucket_name, src))
 
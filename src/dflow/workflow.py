@@ -6,7 +6,7 @@ import time
 from copy import deepcopy
 from typing import Any, Dict, List, Optional, Union
 
-from .argo_objects import ArgoStep, ArgoWorkflow, get_hash
+from .argo_objects import ArgoStep, ArgoWorkflow, get_hashes, get_pod_names
 from .common import jsonpickle, subdomain_errmsg, subdomain_regex
 from .config import config, s3_config
 from .context import Context
@@ -16,10 +16,12 @@ from .executor import Executor
 from .io import type_to_str
 from .op_template import (ContainerOPTemplate, OPTemplate, ScriptOPTemplate,
                           get_k8s_client)
+from .reuse import ReusePlanner, resolve_memoize_key
+from .snapshot import get_snapshot_store, snapshot_phases
 from .step import Step, upload_python_packages
 from .steps import Steps
 from .task import Task
-from .utils import copy_s3, get_key, linktree, randstr, set_key
+from .utils import get_key, linktree, randstr, set_key
 
 try:
     import urllib3
@@ -90,6 +92,11 @@ class Workflow:
         image_pull_secrets: secrets for image registies
         artifact_repo_key: use artifact repository reference by key
         parameters: global input parameters
+        on_exit: template executed on exit of the workflow
+        query_cache_ttl: cache the full workflow returned by query for the
+            time-to-live in seconds, after which it is revalidated by the
+            resource version. Queries with fields are served from the cached
+            full workflow when it is fresh. None for no cache
     """
 
     def __init__(
@@ -114,6 +121,7 @@ class Workflow:
             artifact_repo_key: Optional[str] = None,
             parameters: Optional[Dict[str, Any]] = None,
             on_exit: Optional[OPTemplate] = None,
+            query_cache_ttl: Optional[float] = None,
     ) -> None:
         self.host = host if host is not None else config["host"]
         self.token = token if token is not None else config["token"]
@@ -169,6 +177,11 @@ class Workflow:
                    k8s_api_server=self.k8s_api_server, token=self.token,
                    k8s_config_file=self.k8s_config_file)
         self.on_exit = on_exit
+        self.query_cache_ttl = query_cache_ttl
+        self.query_cache = None
+        self.query_cache_time = 0.0
+        self.query_cache_stats = {"hits": 0, "misses": 0, "revalidations": 0}
+        self.archived = False
 
     def get_k8s_core_v1_api(self):
         if self.k8s_client is None:
@@ -441,8 +454,7 @@ class Workflow:
         art_key = get_key(art, raise_error=False)
         if hasattr(art, "modified"):
             key = art.modified["old_key"]
-            logger.debug("copying artifact: %s -> %s" % (art_key, key))
-            copy_s3(art_key, key)
+            self.reuse_planner.copy(art_key, key)
             set_key(art, key)
             art_key = key
 
@@ -517,10 +529,52 @@ class Workflow:
         if old_key and old_key not in self.copied_keys:
             key = "%s%s/%s/%s" % (
                 s3_config["prefix"], self.id, group_key, name)
-            logger.debug("copying artifact: %s -> %s" % (old_key, key))
-            copy_s3(old_key, key)
+            self.reuse_planner.copy(old_key, key)
             set_key(art, key)
-            self.copied_keys.append(old_key)
+            self.copied_keys.add(old_key)
+
+    def memoized_steps(self):
+        """
+        Memoized templates and the Argo steps (or DAG tasks) using them
+        """
+        steps_of_template = {}
+        for template in self.argo_templates.values():
+            if getattr(template, "steps", None):
+                steps = [s for ps in template.steps for s in ps]
+            elif getattr(template, "dag", None) is not None:
+                steps = template.dag.tasks
+            else:
+                continue
+            for step in steps:
+                steps_of_template.setdefault(step.template, []).append(step)
+        return {name: (template.memoize, steps_of_template[name])
+                for name, template in self.argo_templates.items()
+                if getattr(template, "memoize", None) is not None and
+                name in steps_of_template}
+
+    def packable_keys(self, keys):
+        # Argo saves new cache entries in the ConfigMap of the template, so
+        # only templates whose steps all resolve to packed keys can use the
+        # packed ConfigMap, entries of other templates keep one ConfigMap
+        # per entry
+        memoized_steps = self.memoized_steps()
+        keys = set(keys)
+        while True:
+            mixed = set()
+            for memoize, steps in memoized_steps.values():
+                resolved = [resolve_memoize_key(memoize.key, step)
+                            for step in steps]
+                if not all(key in keys for key in resolved):
+                    mixed.update(resolved)
+            if not keys & mixed:
+                return keys
+            keys -= mixed
+
+    def use_packed_configmap(self, name, packed_keys):
+        for memoize, steps in self.memoized_steps().values():
+            if all(resolve_memoize_key(memoize.key, step) in packed_keys
+                   for step in steps):
+                memoize.cache.config_map.name = name
 
     def convert_to_argo(self, reuse_step=None):
         self.parents = {}
@@ -535,39 +589,28 @@ class Workflow:
                                 if step.key is not None]
             if self.id is None:
                 self.id = self.name + "-" + randstr()
-            self.copied_keys = []
+            if getattr(self, "reuse_planner", None) is None or \
+                    self.reuse_planner.workflow_id != self.id:
+                self.reuse_planner = ReusePlanner(self.id, self.namespace)
+            self.copied_keys = set()
             self.memoize_map = {}
+            reuse_step = [step for step in reuse_step if step.key is not None]
+            hashes = get_hashes([self.id + step.name[len(step.workflow):]
+                                 for step in reuse_step])
             key2id = {}
-            for step in reuse_step:
-                data = {}
-                if step.key is None:
-                    continue
-                node_name = self.id + step.name[len(step.workflow):]
-                hash_val = get_hash(node_name)
-                new_id = "%s-%s" % (self.id, hash_val)
-                key2id[step.key] = new_id
+            for step, hash_val in zip(reuse_step, hashes):
+                key2id[step.key] = "%s-%s" % (self.id, hash_val)
                 self.handle_reused_step(step, global_parameters,
                                         global_artifacts)
 
-            for key, step in self.memoize_map.items():
-                data = {key: json.dumps(step)}
-                config_map = kubernetes.client.V1ConfigMap(
-                    data=data, metadata=kubernetes.client.V1ObjectMeta(
-                        name="dflow-%s" % key,
-                        labels={
-                            "workflows.argoproj.io/configmap-type": "Cache",
-                        }))
-                core_v1_api = self.get_k8s_core_v1_api()
-                logger.debug("creating configmap: %s" %
-                             config_map.metadata.name)
-                core_v1_api.api_client.call_api(
-                    '/api/v1/namespaces/%s/configmaps' % self.namespace,
-                    'POST', body=config_map, response_type='V1ConfigMap',
-                    header_params=config["http_headers"],
-                    _return_http_data_only=True)
-
             self.handle_template(self.entrypoint, memoize_prefix=self.id,
                                  memoize_configmap="dflow")
+            plan = self.reuse_planner.plan(
+                self.memoize_map, self.packable_keys(self.memoize_map))
+            self.reuse_planner.apply(plan, self.get_k8s_core_v1_api())
+            if self.reuse_planner.is_packed(plan):
+                packed_name = self.reuse_planner.packed_name
+                self.use_packed_configmap(packed_name, plan[packed_name])
             if config["save_keys_in_global_outputs"]:
                 for key, id in key2id.items():
                     name = "dflow_key_" + key
@@ -977,31 +1020,102 @@ class Workflow:
                 }
             }
             return ArgoWorkflow(response)
+        if self.query_cache_ttl is None:
+            return ArgoWorkflow(self.request_workflow(fields, retry))
+
+        if self.query_cache is not None and time.time() - \
+                self.query_cache_time > self.query_cache_ttl:
+            self.query_cache_stats["revalidations"] += 1
+            latest = self.request_workflow(["metadata.resourceVersion"],
+                                           retry)
+            version = latest.get("metadata", {}).get("resourceVersion")
+            if version is not None and version == self.query_cache.get(
+                    "metadata", {}).get("resourceVersion"):
+                self.query_cache_time = time.time()
+            else:
+                self.query_cache = None
+
+        if self.query_cache is not None:
+            self.query_cache_stats["hits"] += 1
+            response = self.query_cache
+            if fields is not None:
+                response = project_fields(response, fields)
+            return ArgoWorkflow(response)
+
+        self.query_cache_stats["misses"] += 1
+        response = self.request_workflow(fields, retry)
+        if fields is None:
+            self.query_cache = response
+            self.query_cache_time = time.time()
+        return ArgoWorkflow(response)
+
+    def request_workflow(self, fields=None, retry=3):
+        store = get_snapshot_store()
+        if store is not None:
+            response = store.load(self.namespace, self.id, self.uid)
+            if response is not None:
+                logger.debug("load workflow %s from snapshot" % self.id)
+                if fields is not None:
+                    response = project_fields(response, fields)
+                return response
+            if not self.archived and store.is_archived(
+                    self.namespace, self.id, self.uid):
+                self.archived = True
+
         query_params = None
         if fields is not None:
             query_params = [('fields', ",".join(fields))]
         try:
-            response = self.api_instance.api_client.call_api(
-                '/api/v1/workflows/%s/%s' % (self.namespace, self.id),
-                'GET', response_type=object, _return_http_data_only=True,
-                header_params=config["http_headers"],
-                query_params=query_params)
-        except ApiException as e:
-            if e.status == 404:
+            if self.archived:
+                response = self.request_archived_workflow(query_params)
+            else:
                 response = self.api_instance.api_client.call_api(
-                    '/api/v1/archived-workflows/%s' % self.uid,
-                    'GET', response_type=object, _return_http_data_only=True,
+                    '/api/v1/workflows/%s/%s' % (self.namespace, self.id),
+                    'GET', response_type=object,
+                    _return_http_data_only=True,
                     header_params=config["http_headers"],
                     query_params=query_params)
+        except ApiException as e:
+            if e.status == 404 and not self.archived:
+                response = self.request_archived_workflow(query_params)
+                self.archived = True
+                if store is not None:
+                    store.mark_archived(self.namespace, self.id, self.uid)
             elif e.status >= 500 and e.status < 600 and retry > 0:
                 logger.error("API Exception: %s" % e)
                 logger.error("Remaining retry: %s" % retry)
                 time.sleep(1)
-                return self.query(fields=fields, retry=retry-1)
+                return self.request_workflow(fields=fields, retry=retry-1)
             else:
                 raise e
-        workflow = ArgoWorkflow(response)
-        return workflow
+        if store is not None and fields is None and response.get(
+                "status", {}).get("phase") in snapshot_phases and \
+                response.get("metadata", {}).get("uid") is not None:
+            store.save(response, self.namespace)
+        return response
+
+    def request_archived_workflow(self, query_params=None):
+        return self.api_instance.api_client.call_api(
+            '/api/v1/archived-workflows/%s' % self.uid,
+            'GET', response_type=object, _return_http_data_only=True,
+            header_params=config["http_headers"],
+            query_params=query_params)
+
+    def invalidate_cache(self) -> None:
+        """
+        Invalidate the query cache and the local snapshot of the workflow
+        """
+        self.query_cache = None
+        self.archived = False
+        store = get_snapshot_store()
+        if store is not None and self.id is not None:
+            store.remove(self.namespace, self.id, self.uid)
+
+    @property
+    def query_cache_hit_rate(self) -> float:
+        total = self.query_cache_stats["hits"] + \
+            self.query_cache_stats["misses"]
+        return self.query_cache_stats["hits"] / total if total else 0.0
 
     def query_status(
             self,
@@ -1033,11 +1147,13 @@ class Workflow:
             type: Union[str, List[str]] = None,
             parent_id: Optional[str] = None,
             sort_by_generation: bool = False,
+            lite: bool = False,
     ) -> List[ArgoStep]:
         """
         Query the existing steps of the workflow from Argo
-        This function will query full steps from server [O(n)], then filter
-        with conditions given in the arguments
+        This function will query steps from server [O(n)] with only the
+        fields required by the conditions given in the arguments, then filter
+        with these conditions
         If you want to call this function multiple times successively,
         it is recommended to call query once and call get_step repeatedly, e.g.
         info = wf.query()
@@ -1053,6 +1169,8 @@ class Workflow:
             parent_id: get sub steps of a specific step
             sort_by_generation: sort results by the number of generation from
                 the root node
+            lite: return compact summaries of steps without inputs and
+                outputs (except the key)
         Returns:
             a list of steps
         """
@@ -1142,9 +1260,12 @@ class Workflow:
             step_list.sort(key=lambda x: x["startedAt"])
             return step_list
 
-        return self.query().get_step(
+        fields = query_step_fields(id=id, parent_id=parent_id,
+                                   sort_by_generation=sort_by_generation)
+        return self.query(fields=fields).get_step(
             name=name, key=key, phase=phase, id=id, type=type,
-            parent_id=parent_id, sort_by_generation=sort_by_generation)
+            parent_id=parent_id, sort_by_generation=sort_by_generation,
+            lite=lite)
 
     def query_keys_of_steps(
             self,
@@ -1212,6 +1333,54 @@ class Workflow:
             return self.query_step(key=key, name=name, phase=phase, id=id,
                                    type=type)
 
+    def pod_names_for_keys(
+            self,
+            keys: Union[str, List[str]],
+    ) -> Dict[str, str]:
+        """
+        Resolve pod names of steps by keys in bulk
+        This function will try to get pod names from the global outputs,
+        which is O(1). For the keys not found there, it will query the nodes
+        of the workflow only and compute pod names of the matched steps at
+        once. Keys of no step are omitted in the result
+
+        Args:
+            keys: keys of steps
+        Returns:
+            a dict from key to pod name (node ID for steps without a pod if
+            keys are saved in global outputs)
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        keys = set(keys)
+        pod_names = {}
+        outputs = self.query_global_outputs()
+        if hasattr(outputs, "parameters"):
+            pod_names = {par[10:]: outputs.parameters[par]["value"]
+                         for par in outputs.parameters
+                         if par.startswith("dflow_key_") and
+                         par[10:] in keys}
+        keys -= set(pod_names)
+        if not keys:
+            return pod_names
+
+        logger.debug("Keys not found in the global outputs, downgrade to "
+                     "query nodes: %s" % sorted(keys))
+        workflow = self.query(fields=["metadata.name", "status.nodes"])
+        wf_name = workflow.metadata.name
+        matched = []
+        for node in workflow.get("status", {}).get("nodes", {}).values():
+            if node.get("type") != "Pod":
+                continue
+            for par in node.get("inputs", {}).get("parameters", []):
+                if par["name"] == "dflow_key" and par.get("value") in keys:
+                    matched.append((par["value"], node["name"],
+                                    node["templateName"]))
+                    break
+        pod_names.update(zip([m[0] for m in matched], get_pod_names(
+            wf_name, [m[1:] for m in matched])))
+        return pod_names
+
     def query_global_outputs(self) -> ArgoWorkflow:
         """
         Query the global outputs of the workflow from Argo
@@ -1278,6 +1447,7 @@ class Workflow:
         self.api_instance.api_client.call_api(
             '/api/v1/workflows/%s/%s/terminate' % (self.namespace, self.id),
             'PUT', header_params=config["http_headers"])
+        self.invalidate_cache()
 
     def delete(self) -> None:
         """
@@ -1288,6 +1458,7 @@ class Workflow:
         self.api_instance.api_client.call_api(
             '/api/v1/workflows/%s/%s' % (self.namespace, self.id), 'DELETE',
             header_params=config["http_headers"])
+        self.invalidate_cache()
 
     def resubmit(self) -> None:
         """
@@ -1298,6 +1469,7 @@ class Workflow:
         self.api_instance.api_client.call_api(
             '/api/v1/workflows/%s/%s/resubmit' % (self.namespace, self.id),
             'PUT', header_params=config["http_headers"])
+        self.invalidate_cache()
 
     def resume(self) -> None:
         """
@@ -1308,6 +1480,7 @@ class Workflow:
         self.api_instance.api_client.call_api(
             '/api/v1/workflows/%s/%s/resume' % (self.namespace, self.id),
             'PUT', header_params=config["http_headers"])
+        self.invalidate_cache()
 
     def retry(self) -> None:
         """
@@ -1318,6 +1491,7 @@ class Workflow:
         self.api_instance.api_client.call_api(
             '/api/v1/workflows/%s/%s/retry' % (self.namespace, self.id),
             'PUT', header_params=config["http_headers"])
+        self.invalidate_cache()
 
     def stop(self) -> None:
         """
@@ -1328,6 +1502,7 @@ class Workflow:
         self.api_instance.api_client.call_api(
             '/api/v1/workflows/%s/%s/stop' % (self.namespace, self.id),
             'PUT', header_params=config["http_headers"])
+        self.invalidate_cache()
 
     def suspend(self) -> None:
         """
@@ -1338,6 +1513,7 @@ class Workflow:
         self.api_instance.api_client.call_api(
             '/api/v1/workflows/%s/%s/suspend' % (self.namespace, self.id),
             'PUT', header_params=config["http_headers"])
+        self.invalidate_cache()
 
     def retry_steps(self, step_ids):
         assert self.query_status() == "Running"
@@ -1374,6 +1550,41 @@ class Workflow:
         self.resume()
 
 
+def project_fields(obj, fields, path="", prefixes=None):
+    """
+    Select fields of a workflow locally the same way as Argo server
+    """
+    if prefixes is None:
+        fields = set(fields)
+        prefixes = {f[:i] for f in fields for i in range(len(f))
+                    if f[i] == "."}
+    if isinstance(obj, dict):
+        res = {}
+        for k, v in obj.items():
+            p = path + "." + k if path else k
+            if p in fields:
+                res[k] = v
+            elif p in prefixes:
+                res[k] = project_fields(v, fields, p, prefixes)
+        return res
+    elif isinstance(obj, list):
+        return [project_fields(v, fields, path, prefixes) for v in obj]
+    return obj
+
+
+def query_step_fields(id=None, parent_id=None, sort_by_generation=False):
+    """
+    Minimal fields of the workflow required to get steps with the filters,
+    the spec and stored templates are never needed. Argo matches the keys of
+    nodes literally, so nodes can be narrowed only when filtered by ID
+    """
+    if id is not None and parent_id is None and not sort_by_generation:
+        if not isinstance(id, list):
+            id = [id]
+        return ["metadata.name"] + ["status.nodes." + i for i in id]
+    return ["metadata.name", "status.nodes"]
+
+
 def get_argo_api_client(host=None, token=None):
     if host is None:
         host = config["host"]
@@ -0,0 +1,123 @@
+import base64
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+
+def make_token(n, exp):
+    payload = base64.urlsafe_b64encode(json.dumps(
+        {"n": n, "exp": exp}).encode()).decode().rstrip("=")
+    return "header.%s.signature" % payload
+
+
+class FakeBohrium(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # set by the server
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        state = self.state
+        with state["lock"]:
+            state["connections"].add(self.client_address)
+        if self.path.startswith("/brm/v1/storage/token"):
+            assert self.headers["Brm-Ticket"] == "ticket"
+            with state["lock"]:
+                state["tokens"] += 1
+                token = make_token(state["tokens"],
+                                   time.time() + state["ttl"])
+                state["valid"] = token
+            self.reply(200, {"code": 0, "data": {
+                "token": token, "path": "prefix/", "sharePath": None,
+                "userSharePath": None}})
+        elif self.path.startswith("/api/meta/"):
+            auth = self.headers["Authorization"]
+            if auth != "Bearer %s" % state["valid"]:
+                with state["lock"]:
+                    state["expired"] += 1
+                self.reply(401, {"code": 190001, "error": {
+                    "title": "expired", "msg": "token expired"}})
+            else:
+                self.reply(200, {"code": 0, "data": {
+                    "entityTag": self.path[len("/api/meta/"):]}})
+        else:
+            self.reply(404, {"code": 404})
+
+
+@pytest.fixture
+def server():
+    state = {"lock": threading.Lock(), "tokens": 0, "expired": 0,
+             "valid": None, "ttl": 3600, "connections": set()}
+    handler = type("Handler", (FakeBohrium,), {"state": state})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = "http://127.0.0.1:%s" % httpd.server_port
+    yield state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_client(url, monkeypatch):
+    from dflow.plugins.bohrium import TiefblueClient, config
+    from dflow.utils import s3_config
+    monkeypatch.setitem(config, "ticket", "ticket")
+    # the client sets the storage of the S3 configurations
+    for key in ["repo_type", "prefix"]:
+        monkeypatch.setitem(s3_config, key, s3_config[key])
+    monkeypatch.setitem(s3_config, "storage_client", None)
+    monkeypatch.setitem(s3_config, "extra_prefixes",
+                        list(s3_config["extra_prefixes"]))
+    return TiefblueClient(bohrium_url=url, tiefblue_url=url,
+                          ticket="ticket", project_id=1)
+
+
+def test_pooled_session(server, monkeypatch):
+    pytest.importorskip("tiefblue")
+    from dflow.plugins.bohrium import get_session
+    get_session().reset_stats()
+    client = make_client(server["url"], monkeypatch)
+    for i in range(20):
+        assert client.get_md5("key%s" % i) == "key%s" % i
+    stats = get_session().stats()
+    assert stats["count"] == 21
+    assert stats["errors"] == 0
+    assert stats["endpoints"]["GET /api/meta"]["count"] == 20
+    assert stats["max_time"] >= stats["mean_time"] > 0
+    # connections are reused across requests and clients
+    assert len(server["connections"]) == 1
+    assert server["tokens"] == 1
+
+
+def test_token_refresh(server, monkeypatch):
+    pytest.importorskip("tiefblue")
+    client = make_client(server["url"], monkeypatch)
+    assert server["tokens"] == 1
+    # refreshed ahead of its expiry, without hitting an expired token error
+    client.token_expiry = time.time()
+    assert client.get_md5("key") == "key"
+    assert server["tokens"] == 2
+    assert server["expired"] == 0
+    # revoked on the server, refreshed once by all threads
+    server["valid"] = None
+    with ThreadPoolExecutor(8) as pool:
+        md5s = list(pool.map(client.get_md5,
+                             ["key%s" % i for i in range(32)]))
+    assert md5s == ["key%s" % i for i in range(32)]
+    assert server["tokens"] == 3
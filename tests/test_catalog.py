@@ -0,0 +1,200 @@
+import os
+import random
+import tempfile
+import time
+import uuid
+
+import pytest
+from dflow import Step, config
+from dflow.common import S3Artifact, jsonpickle
+from dflow.io import InputParameter, OutputArtifact
+from dflow.op_template import ShellOPTemplate
+from dflow.python import Slices
+from dflow.util_ops import MergeCatalog
+from dflow.utils import (Catalog, PathList, StorageClient, append_item,
+                         catalog_cache, catalog_of_artifact, expand, flatten,
+                         merge_catalog_of_artifact, merged_catalog_name)
+
+
+def random_items(n, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for _ in range(n):
+        order = rng.randrange(n // 2 + 1)
+        value = rng.choice([None, "a%s" % order, "b%s" % order])
+        items.append({"dflow_list_item": value, "order": order})
+    return items
+
+
+def test_catalog_same_as_append_item():
+    for seed in range(10):
+        items = random_items(200, seed)
+        expected = []
+        for item in items:
+            append_item(expected, dict(item))
+        assert Catalog(dict(item) for item in items).items == expected
+
+
+class MemoryClient(StorageClient):
+    """In-memory storage counting downloads"""
+
+    def __init__(self):
+        self.objects = {}
+        self.downloads = []
+
+    def upload(self, key, path):
+        with open(path, "r") as f:
+            self.objects[key] = f.read()
+
+    def download(self, key, path):
+        self.downloads.append(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.objects[key])
+
+    def list(self, prefix, recursive=False):
+        return sorted(k for k in self.objects if k.startswith(prefix))
+
+    def copy(self, src, dst):
+        self.objects[dst] = self.objects[src]
+
+    def get_md5(self, key):
+        return ""
+
+
+def add_fragment(client, key, items):
+    client.objects["%s/%s/%s" % (key, config["catalog_dir_name"],
+                                 uuid.uuid4())] = jsonpickle.dumps(
+        {"path_list": items})
+
+
+def test_merged_catalog(monkeypatch):
+    monkeypatch.setitem(config, "catalog_cache_size", 0)
+    client = MemoryClient()
+    art = S3Artifact(key="wf/pod/out")
+    for i in range(10):
+        add_fragment(client, art.key, [{"dflow_list_item": "%s.txt" % i,
+                                        "order": i}])
+    expected = catalog_of_artifact(art, storage_client=client)
+    assert len(client.downloads) == 10
+    assert merge_catalog_of_artifact(art, storage_client=client) == 10
+    # only the merged object is downloaded
+    client.downloads.clear()
+    assert catalog_of_artifact(art, storage_client=client) == expected
+    assert [os.path.basename(k) for k in client.downloads] == \
+        [merged_catalog_name]
+    # fragments written after merging are downloaded along with it
+    add_fragment(client, art.key, [{"dflow_list_item": "10.txt",
+                                    "order": 10}])
+    client.downloads.clear()
+    assert catalog_of_artifact(art, storage_client=client) == expected + [
+        {"dflow_list_item": "10.txt", "order": 10}]
+    assert len(client.downloads) == 2
+
+
+def test_catalog_cache(monkeypatch):
+    monkeypatch.setitem(config, "catalog_cache_size", 2)
+    monkeypatch.setattr("dflow.utils.catalog_cache", catalog_cache.__class__())
+    client = MemoryClient()
+    arts = [S3Artifact(key="wf/pod/out%s" % i) for i in range(3)]
+    for i, art in enumerate(arts):
+        add_fragment(client, art.key, [{"dflow_list_item": "a", "order": i}])
+    catalogs = [catalog_of_artifact(art, storage_client=client)
+                for art in arts]
+    assert len(client.downloads) == 3
+    # the least recently used catalog is evicted
+    client.downloads.clear()
+    assert catalog_of_artifact(arts[2], storage_client=client) == catalogs[2]
+    assert catalog_of_artifact(arts[1], storage_client=client) == catalogs[1]
+    assert client.downloads == []
+    assert catalog_of_artifact(arts[0], storage_client=client) == catalogs[0]
+    assert len(client.downloads) == 1
+    # revalidated by the fragments listed
+    add_fragment(client, arts[0].key, [{"dflow_list_item": "b", "order": 1}])
+    assert len(catalog_of_artifact(arts[0], storage_client=client)) == 2
+    assert len(client.downloads) == 3
+
+
+def test_merge_step(monkeypatch):
+    template = ShellOPTemplate(name="sliced", image="alpine", script="ls")
+    template.inputs.parameters = {"i": InputParameter()}
+    template.outputs.artifacts = {"out": OutputArtifact(path="/tmp/out")}
+    template.slices = Slices("{{item}}", input_parameter=["i"],
+                             output_artifact=["out"])
+    step = Step("sliced", template, parameters={"i": [0, 1, 2]},
+                with_param=[0, 1, 2])
+    assert step.merge_step is None
+    monkeypatch.setitem(config, "merge_sliced_catalog", True)
+    step = Step("sliced", template, parameters={"i": [0, 1, 2]},
+                with_param=[0, 1, 2])
+    assert step.merge_step.template.outputs.artifacts["out"].save[0].key == \
+        "{{inputs.parameters.dflow_artifact_key}}/out/%s/%s" % (
+            config["catalog_dir_name"], merged_catalog_name)
+    # the merged object written by the script is read as the fragments
+    client = MemoryClient()
+    art = S3Artifact(key="wf/pod/out")
+    for i in range(5):
+        add_fragment(client, art.key, [{"dflow_list_item": "%s.txt" % i,
+                                        "order": i}])
+    add_fragment(client, art.key, [{"dflow_list_item": "0.txt", "order": 0}])
+    expected = catalog_of_artifact(art, storage_client=client)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        catalog_dir = os.path.join(tmpdir, "inputs", "artifacts", "out")
+        os.makedirs(catalog_dir)
+        prefix = "%s/%s/" % (art.key, config["catalog_dir_name"])
+        for key, content in client.objects.items():
+            with open(os.path.join(catalog_dir, key[len(prefix):]),
+                      "w") as f:
+                f.write(content)
+        template = MergeCatalog(template, "python:3.8", ["python3"], None,
+                                ["out"], tmp_root=tmpdir)
+        exec(template.script, {})
+        with open(os.path.join(tmpdir, "outputs", "artifacts", "out",
+                               merged_catalog_name)) as f:
+            client.objects[prefix + merged_catalog_name] = f.read()
+    client.downloads.clear()
+    monkeypatch.setitem(config, "catalog_cache_size", 0)
+    assert catalog_of_artifact(art, storage_client=client) == expected
+    assert len(client.downloads) == 1
+
+
+def test_path_list():
+    items = ["%s.txt" % i if i % 3 else None for i in range(10)]
+    paths = [os.path.join("art", p) if p is not None else None
+             for p in items]
+    path_list = PathList("art", items)
+    assert len(path_list) == 10
+    assert path_list == paths
+    assert path_list[4] == paths[4]
+    assert path_list[2:8:2] == paths[2:8:2]
+    assert path_list[range(1, 9)][1:3] == paths[1:9][1:3]
+    assert path_list[[5, 1, 7]][1] == paths[1]
+    assert PathList(None, items) == items
+
+
+def test_path_list_numpy_index():
+    np = pytest.importorskip("numpy")
+    path_list = PathList("art", ["%s.txt" % i for i in range(10)])
+    assert path_list[np.int64(3)] == os.path.join("art", "3.txt")
+    assert path_list[np.arange(2, 4)] == [os.path.join("art", "2.txt"),
+                                          os.path.join("art", "3.txt")]
+
+
+def test_expand_flatten():
+    obj = {"a": [1, None, {"b": "c"}], "d": {"0": "e", "1": "f"}}
+    assert expand(flatten(obj)) == {"a": [1, None, {"b": "c"}],
+                                    "d": ["e", "f"]}
+    assert expand({"3": "x", "1": "y"}) == [None, "y", None, "x"]
+
+
+def benchmark(sizes=(10**4, 10**5, 10**6)):
+    for n in sizes:
+        items = [{"dflow_list_item": "%s.txt" % i, "order": i}
+                 for i in range(n)]
+        t = time.time()
+        catalog = Catalog(items)
+        print("merge %s items: %.3fs" % (len(catalog), time.time() - t))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import pytest
+from dflow.plugins import datasets
+from dflow.plugins.datasets import DatasetsArtifact, wait_for_mount
+from dflow.python import OP, OPIO, Artifact, OPIOSign, PythonOPTemplate
+
+# a fake rclone copying slowly and counting the copies
+fake_rclone = """#!/bin/sh
+if [ "$1" = "copy" ]; then
+    sleep 0.5
+    mkdir -p $3
+    echo data > $3/file
+    echo copy >> %s/copies
+fi
+"""
+
+
+class Read(OP):
+    @classmethod
+    def get_input_sign(cls):
+        return OPIOSign({"data": Artifact(str)})
+
+    @classmethod
+    def get_output_sign(cls):
+        return OPIOSign()
+
+    @OP.exec_sign_check
+    def execute(self, op_in: OPIO) -> OPIO:
+        return OPIO()
+
+
+def test_wait_for_mount():
+    wait_for_mount("/", timeout=1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            wait_for_mount(tmpdir, timeout=0.3)
+        assert time.monotonic() - start < 2
+
+
+@pytest.mark.skipif(shutil.which("flock") is None, reason="no flock")
+def test_cache_populated_once():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bin_dir = os.path.join(tmpdir, "bin")
+        os.makedirs(bin_dir)
+        with open(os.path.join(bin_dir, "rclone"), "w") as f:
+            f.write(fake_rclone % tmpdir)
+        os.chmod(os.path.join(bin_dir, "rclone"), 0o755)
+        env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ["PATH"])
+        art = DatasetsArtifact("water", "v1", cache_dir=tmpdir + "/cache")
+        script = art.get_cache_script(art.cache_dir)
+        procs = [subprocess.Popen(["sh", "-c", script], env=env)
+                 for _ in range(4)]
+        assert [p.wait() for p in procs] == [0] * 4
+        cached = os.path.join(tmpdir, "cache", "datasets", "water@v1")
+        with open(os.path.join(cached, "file")) as f:
+            assert f.read() == "data\n"
+        assert os.path.exists(os.path.join(cached, ".dflow-complete"))
+        with open(os.path.join(tmpdir, "copies")) as f:
+            assert len(f.readlines()) == 1
+
+
+def test_render_cache():
+    template = PythonOPTemplate(Read, image="python:3.8")
+    art = DatasetsArtifact("water", "v1", cache_dir="/var/cache/datasets")
+    template = art.render(template, "data")
+    assert not template.sidecars
+    assert [c.name for c in template.init_containers] == [
+        "rclone-cache-data"]
+    assert [v.host_path.path for v in template.volumes
+            if v.name == "datasets-cache"] == ["/var/cache/datasets"]
+    assert [m.read_only for m in template.mounts
+            if m.name == "datasets-cache"] == [True]
+    # a draft version may change, mount it instead
+    template = PythonOPTemplate(Read, image="python:3.8")
+    art = DatasetsArtifact("water", "draft", cache_dir="/var/cache/datasets")
+    template = art.render(template, "data")
+    assert [s.name for s in template.sidecars] == ["rclone-data"]
+
+
+def test_download_from_cache(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cached = os.path.join(tmpdir, "datasets", "water@v1")
+        os.makedirs(os.path.join(cached, "sub"))
+        open(os.path.join(cached, ".dflow-complete"), "w").close()
+        monkeypatch.setattr(datasets, "cache_mount_path", tmpdir)
+        art = DatasetsArtifact.from_urn("launching+datasets://water@v1/sub")
+        path = os.path.join(tmpdir, "data")
+        art.download("data", path)
+        assert os.path.realpath(path) == os.path.join(cached, "sub")
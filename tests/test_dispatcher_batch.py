@@ -0,0 +1,223 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from dflow import S3Artifact, Step
+from dflow.plugins.dispatcher import DispatcherExecutor
+from dflow.python import (OP, OPIO, Artifact, FatalError, OPIOSign,
+                          PythonOPTemplate, Slices, TransientError)
+
+# a local submission running the tasks in place, for the rendered script
+# to run without dpdispatcher
+FAKE_DPDISPATCHER = """
+import os
+import subprocess
+
+
+class Machine:
+    @classmethod
+    def load_from_dict(cls, machine_dict):
+        return cls()
+
+
+class Resources:
+    def __init__(self):
+        self.envs = {}
+
+    @classmethod
+    def load_from_dict(cls, resources_dict):
+        return cls()
+
+
+class Task:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    @classmethod
+    def load_from_dict(cls, task_dict):
+        return cls(**task_dict)
+
+    def serialize(self):
+        return dict(self.__dict__)
+
+
+class Submission:
+    def __init__(self, work_base, machine, resources, task_list,
+                 forward_common_files=()):
+        self.work_base = work_base
+        self.resources = resources
+        self.task_list = task_list
+
+    def run_submission(self, clean=True):
+        for task in self.task_list:
+            subprocess.run(["bash", "-c", task.command], check=True,
+                           cwd=os.path.join(self.work_base,
+                                            task.task_work_path),
+                           env=dict(os.environ, **self.resources.envs))
+
+    def remove_unfinished_tasks(self):
+        pass
+"""
+
+
+class Hello(OP):
+    @classmethod
+    def get_input_sign(cls):
+        return OPIOSign({"x": int, "f": Artifact(Path)})
+
+    @classmethod
+    def get_output_sign(cls):
+        return OPIOSign({"y": int, "out": Artifact(Path)})
+
+    @OP.exec_sign_check
+    def execute(self, op_in):
+        if op_in["x"] == 6:
+            raise TransientError("boom")
+        if op_in["x"] == 8:
+            raise FatalError("boom")
+        p = Path("out%s.txt" % op_in["x"])
+        p.write_text((op_in["f"] / "a.txt").read_text())
+        return OPIO({"y": op_in["x"] * 10, "out": p})
+
+
+def run_batch(template, executor, params, workdir, pythonpath=()):
+    """
+    Run the rendered dispatcher script locally in place of the Argo pod
+    """
+    new_template = executor.render(template)
+    for name, par in new_template.inputs.parameters.items():
+        if name not in params:
+            params[name] = "" if par.value is None else par.value \
+                if isinstance(par.value, str) else json.dumps(par.value)
+    script = re.sub(r"\{\{inputs\.parameters\.([\w-]+)\}\}",
+                    lambda m: params[m.group(1)], new_template.script)
+    script = script.replace("{{workflow.name}}", "test").replace(
+        "{{pod.name}}", "test")
+    (workdir / "main.py").write_text(script)
+    # the OP is imported from this module by the tasks
+    env = dict(os.environ, ARGO_TEMPLATE="{}", PYTHONPATH=os.pathsep.join(
+        list(pythonpath) + [os.path.dirname(os.path.abspath(__file__))] +
+        sys.path))
+    return subprocess.run([sys.executable, "main.py"], cwd=workdir, env=env)
+
+
+def run_sliced(tmpdir, xs, pythonpath=()):
+    # the dispatcher script only stays in a directory named workdir
+    workdir = Path(tmpdir) / "workdir"
+    items = []
+    for i in range(len(xs)):
+        d = workdir / ("tmp/inputs/artifacts/f/d%s" % i)
+        d.mkdir(parents=True)
+        (d / "a.txt").write_text("hello%s" % i)
+        items.append({"order": i, "f": "d%s" % i})
+    template = PythonOPTemplate(
+        Hello, image="python", slices=Slices(
+            sub_path=True, input_parameter=["x"], input_artifact=["f"],
+            output_parameter=["y"], output_artifact=["out"]))
+    executor = DispatcherExecutor(
+        merge_sliced_step=True, machine_dict={
+            "batch_type": "Shell", "context_type": "LocalContext",
+            "remote_root": os.path.join(tmpdir, "remote")})
+    res = run_batch(template, executor, {
+        "x": json.dumps(xs),
+        "dflow_with_param": json.dumps(items),
+        "dflow_batch_sub_paths": json.dumps({"f": "<item.f>"})}, workdir,
+        pythonpath=pythonpath)
+    return res, workdir
+
+
+def fake_dpdispatcher(tmpdir):
+    path = os.path.join(tmpdir, "fake")
+    os.makedirs(os.path.join(path, "dpdispatcher"))
+    with open(os.path.join(path, "dpdispatcher", "__init__.py"), "w") as f:
+        f.write(FAKE_DPDISPATCHER)
+    return path
+
+
+def test_batched_exit_codes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = fake_dpdispatcher(tmpdir)
+        res, workdir = run_sliced(tmpdir, [5, 6, 7], pythonpath=[path])
+        # a transient error of an item is retried with the step
+        assert res.returncode == 1
+        outputs = workdir / "tmp/outputs"
+        results = json.loads((outputs / "parameters/dflow_batch_results")
+                             .read_text())
+        assert [r["exit_code"] for r in results] == [0, 1, 0]
+        y = json.loads((outputs / "parameters/y").read_text())
+        assert y[1] is None
+        assert (outputs / "artifacts/out/out7.txt").read_text() == "hello2"
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = fake_dpdispatcher(tmpdir)
+        res, workdir = run_sliced(tmpdir, [6, 7, 8], pythonpath=[path])
+        # a fatal error of any item is not
+        assert res.returncode == 2
+        results = json.loads((workdir / "tmp/outputs/parameters/"
+                              "dflow_batch_results").read_text())
+        assert [r["exit_code"] for r in results] == [1, 0, 2]
+
+
+def test_batched_groups():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # groups of two slices staged by the init-artifact step
+        workdir = Path(tmpdir) / "workdir"
+        for g, orders in enumerate([[0, 1], [2]]):
+            d = workdir / ("tmp/inputs/artifacts/f/group_%s" % g)
+            path_list = []
+            for i in orders:
+                (d / ("d%s" % i)).mkdir(parents=True)
+                (d / ("d%s" % i) / "a.txt").write_text("hello%s" % i)
+                path_list.append({"dflow_list_item": "d%s" % i, "order": i})
+            (d / ".dflow").mkdir()
+            (d / ".dflow/catalog").write_text(json.dumps(
+                {"path_list": path_list}))
+        template = PythonOPTemplate(
+            Hello, image="python", upload_dflow=False, slices=Slices(
+                sub_path=True, group_size=2, pool_size=1,
+                input_parameter=["x"], input_artifact=["f"],
+                output_parameter=["y"], output_artifact=["out"]))
+        executor = DispatcherExecutor(
+            merge_sliced_step=True, machine_dict={
+                "batch_type": "Shell", "context_type": "LocalContext",
+                "remote_root": os.path.join(tmpdir, "remote")})
+        step = Step("grouped", template, parameters={"x": [5, 6, 7]},
+                    artifacts={"f": S3Artifact(key="foo")}, executor=executor)
+        step.prepare_argo_arguments()
+        # the whole group directory is the sub path of each item
+        assert step.inputs.artifacts["f"].sp is None
+        sub_paths = step.inputs.parameters["dflow_batch_sub_paths"].value
+        assert json.loads(sub_paths) == {"f": "group_<item>"}
+        res = run_batch(template, executor, {
+            "x": json.dumps([5, 6, 7]), "dflow_ngroups": "2",
+            "dflow_with_param": json.dumps([0, 1]),
+            "dflow_batch_sub_paths": sub_paths}, workdir,
+            pythonpath=[fake_dpdispatcher(tmpdir)])
+        assert res.returncode == 1
+        outputs = workdir / "tmp/outputs"
+        results = json.loads((outputs / "parameters/dflow_batch_results")
+                             .read_text())
+        assert [r["exit_code"] for r in results] == [1, 0]
+        assert (outputs / "artifacts/out/out5.txt").read_text() == "hello0"
+        assert (outputs / "artifacts/out/out7.txt").read_text() == "hello2"
+
+
+def test_batched_sub_path_slices():
+    pytest.importorskip("dpdispatcher")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        res, workdir = run_sliced(tmpdir, [5, 6, 7])
+        # the failed item fails the step after the outputs are collected
+        assert res.returncode == 1
+        outputs = workdir / "tmp/outputs"
+        results = json.loads((outputs / "parameters/dflow_batch_results")
+                             .read_text())
+        assert [r["exit_code"] for r in results] == [0, 1, 0]
+        y = json.loads((outputs / "parameters/y").read_text())
+        assert y[1] is None
+        assert (outputs / "artifacts/out/out5.txt").read_text() == "hello0"
+        assert (outputs / "artifacts/out/out7.txt").read_text() == "hello2"
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+
+from dflow.config import config
+from dflow.io import InputArtifact
+from dflow.op_template import ShellOPTemplate
+from dflow.python import Slices
+from dflow.python.utils import assemble_parts
+from dflow.util_ops import InitArtifactForSlices
+
+
+def write_artifact(art_path, n, start=0):
+    # files for even slices and directories for odd ones
+    catalog_dir = os.path.join(art_path, config["catalog_dir_name"])
+    os.makedirs(catalog_dir, exist_ok=True)
+    path_list = []
+    for i in range(start, start + n):
+        if i % 2:
+            item = "dir%s" % i
+            os.makedirs(os.path.join(art_path, item))
+            path = os.path.join(art_path, item, "data.txt")
+        else:
+            item = "%s.txt" % i
+            path = os.path.join(art_path, item)
+        with open(path, "w") as f:
+            f.write(str(i))
+        path_list.append({"dflow_list_item": item, "order": i})
+    with open(os.path.join(catalog_dir, "catalog"), "w") as f:
+        json.dump({"path_list": path_list}, f)
+
+
+def test_stage_groups():
+    template = ShellOPTemplate(name="grouped", image="alpine", script="ls")
+    template.inputs.artifacts = {"foo": InputArtifact(path="/tmp/foo")}
+    template.slices = Slices(sub_path=True, group_size=2,
+                             input_artifact=["foo"])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        art_path = os.path.join(tmpdir, "inputs", "artifacts", "foo")
+        write_artifact(art_path, 5)
+        init = InitArtifactForSlices(
+            template, "python:3.8", ["python3"], None, None,
+            sliced_input_artifact=["foo"], group_size=2, tmp_root=tmpdir)
+        exec(init.script, {})
+        with open(os.path.join(tmpdir, "outputs", "parameters",
+                               "dflow_ngroups")) as f:
+            assert f.read() == "3"
+        for i in range(5):
+            group_dir = os.path.join(tmpdir, "outputs", "artifacts", "foo",
+                                     "group_%s" % (i // 2))
+            # files are hardlinked, also in directories
+            path = "dir%s/data.txt" % i if i % 2 else "%s.txt" % i
+            src = os.path.join(art_path, path)
+            dst = os.path.join(group_dir, path)
+            assert os.path.samefile(src, dst)
+            assert os.stat(dst).st_nlink == 2
+        with open(os.path.join(tmpdir, "outputs", "artifacts", "foo",
+                               "group_2", config["catalog_dir_name"],
+                               "catalog")) as f:
+            assert json.load(f)["path_list"] == [
+                {"dflow_list_item": "4.txt", "order": 4}]
+
+
+def test_assemble_parts(monkeypatch):
+    monkeypatch.setitem(config, "catalog_pool_workers", 4)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i in range(5):
+            write_artifact(os.path.join(tmpdir, "inputs", "artifacts",
+                                        "dflow_foo_%s" % i), 1, start=i)
+        parts = assemble_parts("foo", range(5), tmpdir)
+        assert [os.path.basename(p) for p, _ in parts] == \
+            ["dflow_foo_%s" % i for i in range(5)]
+        for i, (art_path, po) in enumerate(parts):
+            assert po == [os.path.join(
+                art_path, "dir%s" % i if i % 2 else "%s.txt" % i)]
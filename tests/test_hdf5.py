@@ -0,0 +1,112 @@
+import glob
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from dflow.config import config
+from dflow.python.opio import Artifact, HDF5Datasets
+from dflow.python.utils import handle_input_artifact, handle_output_artifact
+
+h5py = pytest.importorskip("h5py")
+
+
+def write_and_read(name, value, data_root):
+    sign = Artifact(HDF5Datasets)
+    handle_output_artifact(name, value, sign, data_root=data_root)
+    path = glob.glob("%s/outputs/artifacts/%s/*.h5" % (data_root, name))[0]
+    return handle_input_artifact(name, sign, path=path), path
+
+
+def test_packed_round_trip():
+    pack_size = config["hdf5_pack_size"]
+    chunk_size = config["hdf5_chunk_size"]
+    config["hdf5_pack_size"] = 1024
+    config["hdf5_chunk_size"] = 4096
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            big = Path(tmpdir) / "big.bin"
+            big.write_bytes(os.urandom(10000))
+            small = Path(tmpdir) / "small.txt"
+            small.write_text("small")
+            value = [{"big": big, "small": small, "str": "foo%s" % i,
+                      "none": None} for i in range(10)]
+            res, path = write_and_read("foo", value, tmpdir)
+            with h5py.File(path, "r") as f:
+                assert len(f.keys()) == 14
+            assert len(res) == 10
+            for i, item in enumerate(res):
+                assert item["big"].get_data() == big.read_bytes()
+                assert item["small"].get_data() == "small"
+                assert item["str"].get_data() == "foo%s" % i
+                assert item["none"] is None
+    finally:
+        config["hdf5_pack_size"] = pack_size
+        config["hdf5_chunk_size"] = chunk_size
+
+
+def test_lazy_indexing(monkeypatch):
+    import numpy as np
+    from dflow.python import opio
+    with tempfile.TemporaryDirectory() as tmpdir:
+        value = [np.arange(100) * i if i % 2 else None for i in range(10)]
+        sign = Artifact(HDF5Datasets)
+        handle_output_artifact("foo", value, sign, data_root=tmpdir)
+        path = glob.glob("%s/outputs/artifacts/foo/*.h5" % tmpdir)[0]
+        # only the datasets of the slices are read
+        checked = []
+        is_none = opio.HDF5Dataset.is_none
+        monkeypatch.setattr(opio.HDF5Dataset, "is_none", lambda self: (
+            checked.append(self.key), is_none(self))[1])
+        res = handle_input_artifact("foo", sign, slices=[2, 3], path=path)
+        assert sorted(checked) == ["2", "3"]
+        assert res[0] is None
+        dataset = res[1]
+        assert len(dataset) == 100
+        assert list(dataset[10:13]) == [30, 33, 36]
+        assert dataset.get_data(slice(0, 2)).tolist() == [0, 3]
+        assert np.array_equal(dataset.get_data(), np.arange(100) * 3)
+        mapped = dataset.memmap()
+        assert mapped is not None and np.array_equal(mapped,
+                                                     np.arange(100) * 3)
+
+
+def test_pack_size_zero(monkeypatch):
+    monkeypatch.setitem(config, "hdf5_pack_size", 0)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        empty = Path(tmpdir) / "empty.txt"
+        empty.write_text("")
+        res, path = write_and_read("foo", [empty, "", None], tmpdir)
+        with h5py.File(path, "r") as f:
+            assert sorted(f.keys()) == ["0", "1", "2"]
+        assert res[0].get_data() == ""
+        assert res[1].get_data() == ""
+        assert res[2] is None
+        # packed inputs are unpacked in outputs
+        monkeypatch.setitem(config, "hdf5_pack_size", 1024)
+        res, _ = write_and_read("bar", ["foo", None], tmpdir)
+        monkeypatch.setitem(config, "hdf5_pack_size", 0)
+        res, path = write_and_read("baz", res, tmpdir)
+        with h5py.File(path, "r") as f:
+            assert sorted(f.keys()) == ["0", "1"]
+        assert res[0].get_data() == "foo"
+        assert res[1] is None
+
+
+def test_stream_files(monkeypatch):
+    monkeypatch.setitem(config, "hdf5_chunk_size", 4096)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        text = Path(tmpdir) / "big.txt"
+        text.write_text("x" * 10000)
+        # not streamed by default, readable as before
+        res, path = write_and_read("foo", [text], tmpdir)
+        with h5py.File(path, "r") as f:
+            assert f["0"].chunks is None
+            assert f["0"][()].decode("utf-8") == "x" * 10000
+        assert res[0].get_data() == "x" * 10000
+        monkeypatch.setitem(config, "hdf5_stream_files", True)
+        res, path = write_and_read("bar", [text], tmpdir)
+        with h5py.File(path, "r") as f:
+            assert f["0"].chunks == (4096,)
+        assert res[0].get_data() == "x" * 10000
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+from dflow.python import OP, OPIO, OPIOSign, PythonOPTemplate
+
+heavy_modules = ["dflow.workflow", "dflow.step", "dflow.argo_objects",
+                 "dflow.op_template", "dflow.python.python_op_template",
+                 "kubernetes", "minio"]
+
+
+def import_time(module):
+    """
+    Measure cumulative import time (in microseconds) of each module with
+    python -X importtime
+    """
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                          "import %s" % module], capture_output=True,
+                         text=True, check=True)
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_runtime_imports():
+    times = import_time("dflow.runtime")
+    assert "dflow.runtime" in times
+    for module in heavy_modules:
+        assert module not in times, "%s is imported by dflow.runtime" % module
+
+
+class Hello(OP):
+    @classmethod
+    def get_input_sign(cls):
+        return OPIOSign({"msg": str})
+
+    @classmethod
+    def get_output_sign(cls):
+        return OPIOSign({"msg": str})
+
+    @OP.exec_sign_check
+    def execute(self, op_in: OPIO) -> OPIO:
+        return OPIO({"msg": op_in["msg"]})
+
+
+def test_runtime_fallback():
+    script = PythonOPTemplate(Hello, image="python:3.8").script
+    # imports of the script in an image with an older dflow
+    script = "import sys; sys.modules['dflow.runtime'] = None\n" + \
+        script[:script.index("op_obj = ")] + \
+        "print(handle_output_artifact.__module__)"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__))] + sys.path))
+    res = subprocess.run([sys.executable, "-c", script], env=env,
+                         capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    assert "dflow.python.utils" in res.stdout
+
+
+def benchmark():
+    for module in ["dflow", "dflow.runtime", "dflow.python"]:
+        times = import_time(module)
+        print("import %s: %.3fs" % (module, times[module] / 1e6))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,203 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from dflow import ShellOPTemplate
+from dflow.plugins.launching import (OP_template_to_parser, OPServer,
+                                     python_OP_to_parser, run_python_OP)
+from dflow.python import OP, OPIO, Artifact, OPIOSign, Parameter
+
+# serve the OP of this module
+serve_script = "import sys; sys.path.insert(0, %r); " \
+    "from test_launching_serve import Duplicate; " \
+    "from dflow.plugins.launching import OP_to_server; " \
+    "OP_to_server(Duplicate)(sys.argv[1:])" % os.path.dirname(
+        os.path.abspath(__file__))
+
+
+class Duplicate(OP):
+    @classmethod
+    def get_input_sign(cls):
+        return OPIOSign({
+            "foo": Artifact(Path, description="input file"),
+            "num": Parameter(int, default=2, description="number"),
+        })
+
+    @classmethod
+    def get_output_sign(cls):
+        return OPIOSign({
+            "bar": Artifact(Path),
+            "length": int,
+        })
+
+    @OP.exec_sign_check
+    def execute(self, op_in: OPIO) -> OPIO:
+        with open(op_in["foo"], "r") as f:
+            content = f.read()
+        # not mixed with the responses
+        print("duplicating %s" % op_in["foo"])
+        with open("bar.txt", "w") as f:
+            f.write(content * op_in["num"])
+        return OPIO({"bar": Path("bar.txt"),
+                     "length": len(content) * op_in["num"]})
+
+
+def make_request(tmpdir, i, **options):
+    workdir = os.path.join(tmpdir, "req%s" % i)
+    os.makedirs(workdir, exist_ok=True)
+    with open(os.path.join(workdir, "foo.txt"), "w") as f:
+        f.write("x" * i)
+    return {"id": i, "workdir": workdir,
+            "options": dict({"foo": "foo.txt"}, **options)}
+
+
+def check_response(response, tmpdir, i, num=2):
+    workdir = os.path.join(tmpdir, "req%s" % i)
+    assert response["code"] == 0, response.get("error")
+    assert response["outputs"]["parameters"] == {"length": str(i * num)}
+    bar = os.path.join(workdir, "outputs", "artifacts", "bar")
+    assert response["outputs"]["artifacts"] == {"bar": bar}
+    with open(os.path.join(bar, "bar.txt")) as f:
+        assert f.read() == "x" * i * num
+
+
+def test_parser_without_launching():
+    try:
+        import dp.launching  # noqa: F401
+        pytest.skip("dp.launching is installed")
+    except ImportError:
+        pass
+    with pytest.raises(ImportError, match="dp.launching is required"):
+        python_OP_to_parser(Duplicate)
+    with pytest.raises(ImportError, match="dp.launching is required"):
+        OP_template_to_parser(ShellOPTemplate(name="hello", image="alpine",
+                                              script="echo hello"))
+
+
+def test_handle_as_one_shot():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        server = OPServer(Duplicate())
+        response = server.handle(make_request(tmpdir, 1, num=3))
+        check_response(response, tmpdir, 1, 3)
+        # the same outputs as the one-shot runner
+        cwd = os.getcwd()
+        os.chdir(make_request(tmpdir, 2)["workdir"])
+        try:
+            assert run_python_OP(Duplicate(), {"foo": "foo.txt", "num": 3}) \
+                == 0
+        finally:
+            os.chdir(cwd)
+        for root in ["req1", "req2"]:
+            with open(os.path.join(tmpdir, root, "outputs", "parameters",
+                                   "length")) as f:
+                assert f.read() == ("3" if root == "req1" else "6")
+        response = server.handle({"id": 3, "workdir": tmpdir,
+                                  "options": {}})
+        assert response["code"] == 1
+        assert "Missing option foo" in response["error"]
+
+
+def test_serve_stdio():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        requests = [make_request(tmpdir, i) for i in range(1, 5)]
+        requests.append({"id": 5, "workdir": tmpdir,
+                         "options": {"foo": "missing.txt"}})
+        proc = subprocess.run(
+            [sys.executable, "-c", serve_script, "--workers", "2"],
+            input="".join(json.dumps(r) + "\n" for r in requests),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            timeout=60)
+        assert proc.returncode == 0, proc.stderr
+        responses = {r["id"]: r for r in map(
+            json.loads, proc.stdout.splitlines())}
+        assert sorted(responses) == [1, 2, 3, 4, 5]
+        for i in range(1, 5):
+            check_response(responses[i], tmpdir, i)
+        assert responses[5]["code"] == 1
+        assert "duplicating" in proc.stderr
+
+
+def test_serve_malformed_requests():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        lines = ["not json", "[1, 2]",
+                 json.dumps({"id": 2, "options": ["foo"]}),
+                 json.dumps(make_request(tmpdir, 1))]
+        proc = subprocess.run(
+            [sys.executable, "-c", serve_script],
+            input="".join(line + "\n" for line in lines),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            timeout=60)
+        # the server keeps serving after malformed requests
+        assert proc.returncode == 0, proc.stderr
+        responses = list(map(json.loads, proc.stdout.splitlines()))
+        assert [(r["id"], r["code"]) for r in responses[:3]] == \
+            [(None, 1), (None, 1), (2, 1)]
+        assert "JSONDecodeError" in responses[0]["error"]
+        assert "JSON object" in responses[1]["error"]
+        check_response(responses[3], tmpdir, 1)
+
+
+def test_serve_socket():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "op.sock")
+        proc = subprocess.Popen(
+            [sys.executable, "-c", serve_script, "--socket", path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 30
+            while not os.path.exists(path):
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+            with socket.socket(socket.AF_UNIX) as sock:
+                sock.connect(path)
+                f = sock.makefile("rw")
+                f.write("not json\n")
+                f.flush()
+                assert json.loads(f.readline())["code"] == 1
+                for i in range(1, 3):
+                    f.write(json.dumps(make_request(tmpdir, i)) + "\n")
+                    f.flush()
+                    check_response(json.loads(f.readline()), tmpdir, i)
+        finally:
+            proc.send_signal(signal.SIGINT)
+            proc.wait(10)
+        assert not os.path.exists(path)
+
+
+def benchmark(n=20):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        requests = [make_request(tmpdir, i) for i in range(n)]
+        t = time.time()
+        for request in requests:
+            subprocess.run([sys.executable, "-c", serve_script],
+                           input=json.dumps(request) + "\n", text=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                           check=True)
+        print("one-shot: %.1fms per request" % (
+            (time.time() - t) * 1000 / n))
+        proc = subprocess.Popen([sys.executable, "-c", serve_script],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True)
+        proc.stdin.write(json.dumps(requests[0]) + "\n")
+        proc.stdin.flush()
+        proc.stdout.readline()
+        t = time.time()
+        for request in requests:
+            proc.stdin.write(json.dumps(request) + "\n")
+            proc.stdin.flush()
+            proc.stdout.readline()
+        print("warm: %.1fms per request" % ((time.time() - t) * 1000 / n))
+        proc.stdin.close()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,292 @@
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from dflow import LineageClient
+from dflow.lineage import BufferedLineageClient
+
+
+class FakeGMS(BaseHTTPRequestHandler):
+    """Metadata service storing the records posted, one or a batch"""
+    protocol_version = "HTTP/1.1"
+    # set by the server
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        state = self.state
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(state["latency"])
+        if state["down"]:
+            self.reply(503, {"error": "unavailable"})
+            return
+        records = json.loads(body)
+        if self.path == "/entities":
+            records = [records]
+        with state["lock"]:
+            state["requests"] += 1
+            state["records"] += records
+        self.reply(200, {"urns": ["urn:%s" % r["name"] for r in records]})
+
+
+@pytest.fixture
+def gms():
+    state = {"lock": threading.Lock(), "latency": 0.0, "down": False,
+             "requests": 0, "records": []}
+    handler = type("Handler", (FakeGMS,), {"state": state})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = "http://127.0.0.1:%s" % httpd.server_port
+    yield state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class HTTPLineageClient(LineageClient):
+    def __init__(self, url, predict_urns=True):
+        self.url = url
+        self.predict_urns = predict_urns
+
+    def post(self, path, body):
+        req = urllib.request.Request(
+            self.url + path, data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req) as res:
+            return json.loads(res.read())["urns"]
+
+    def to_record(self, method, kwargs):
+        if method == "register_artifact":
+            return {"name": "%s/%s" % (kwargs["namespace"], kwargs["name"]),
+                    "uri": kwargs["uri"]}
+        return {"name": kwargs["task_name"],
+                "outputs": sorted(kwargs["output_uris"])}
+
+    def register_workflow(self, workflow_name):
+        return self.post("/entities", {"name": workflow_name})[0]
+
+    def register_artifact(self, namespace, name, uri, **kwargs):
+        return self.post("/entities", self.to_record(
+            "register_artifact", dict(namespace=namespace, name=name,
+                                      uri=uri)))[0]
+
+    def register_task(self, task_name, input_urns, output_uris,
+                      workflow_urn):
+        self.post("/entities", self.to_record(
+            "register_task", dict(task_name=task_name,
+                                  output_uris=output_uris)))
+        return {name: "urn:%s/%s" % (task_name, name)
+                for name in output_uris}
+
+    def get_artifact_metadata(self, urn):
+        return urn
+
+    def gen_artifact_urn(self, namespace, name):
+        if self.predict_urns:
+            return "urn:%s/%s" % (namespace, name)
+
+    def register_batch(self, records):
+        self.post("/batch", [self.to_record(r["method"], r["kwargs"])
+                             for r in records])
+
+
+def wait_until(cond, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_batching(gms):
+    client = BufferedLineageClient(HTTPLineageClient(gms["url"]),
+                                   batch_size=10, flush_interval=10)
+    for i in range(25):
+        urn = client.register_artifact("ns", "art%s" % i, "key%s" % i)
+        assert urn == "urn:ns/art%s" % i
+    assert client.register_task("wf/pod", {}, {"out": "key"}, "urn:wf") == \
+        {"out": "urn:wf/pod/out"}
+    assert client.flush(10)
+    assert gms["requests"] == 3
+    assert [r["name"] for r in gms["records"]] == \
+        ["ns/art%s" % i for i in range(25)] + ["wf/pod"]
+    assert client.stats["registered"] == 26
+    client.close()
+    # registered synchronously after closed
+    client.register_artifact("ns", "late", "key")
+    assert gms["requests"] == 4
+
+
+def test_flush_interval(gms):
+    client = BufferedLineageClient(HTTPLineageClient(gms["url"]),
+                                   batch_size=100, flush_interval=0.1)
+    client.register_artifact("ns", "art", "key")
+    wait_until(lambda: gms["requests"] == 1)
+    client.close()
+
+
+@pytest.fixture
+def metadata(monkeypatch):
+    """dflow.plugins.metadata loaded with dp.metadata stubbed"""
+    state = {"contexts": 0, "exits": 0, "datasets": [], "jobs": [],
+             "ended": []}
+
+    class Client:
+        def update_dataset(self, ds):
+            state["datasets"].append((ds.urn, ds.uri))
+
+        def prepare_job(self, task):
+            return task
+
+        def begin_job(self, job, inputs):
+            state["jobs"].append((job.name, inputs))
+            return job
+
+        def end_job(self, run, outputs):
+            state["ended"].append((run.name, outputs))
+
+    class MetadataContext:
+        def __init__(self, project, endpoint, token):
+            state["contexts"] += 1
+            self.project = project
+            self.client = Client()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            state["exits"] += 1
+
+    class Dataset:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+        @staticmethod
+        def gen_urn(context, namespace, name):
+            return "urn:%s:%s/%s" % (context.project, namespace, name)
+
+    class Task:
+        def __init__(self, name, workflow_urn):
+            self.name = name
+
+    modules = {"dp": {}, "dp.metadata": {
+        "Dataset": Dataset, "MetadataContext": MetadataContext},
+        "dp.metadata.entity": {},
+        "dp.metadata.entity.task": {"Task": Task},
+        "dp.metadata.entity.workflow": {"WorkFlow": object}}
+    for name, attrs in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        monkeypatch.setitem(sys.modules, name, module)
+    import dflow.plugins
+    spec = importlib.util.spec_from_file_location(
+        "dflow.plugins.metadata", os.path.join(
+            os.path.dirname(dflow.plugins.__file__), "metadata.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return state, module
+
+
+def test_metadata_client(metadata):
+    state, module = metadata
+    client = module.MetadataClient(project="p")
+    buffered = BufferedLineageClient(client, batch_size=100,
+                                     flush_interval=60)
+    urns = [buffered.register_artifact("ns", "a%s" % i, "s3://a%s" % i)
+            for i in range(3)]
+    assert urns == ["urn:p:ns/a%s" % i for i in range(3)]
+    output_urns = buffered.register_task(
+        "task", {"x": urns[0], "y": [urns[1], ""]},
+        {"o1": "s3://o1", "o2": "s3://o2"}, "urn:wf")
+    assert output_urns == {"o1": "urn:p:task/o1", "o2": "urn:p:task/o2"}
+    # queued, URNs generated in one context
+    assert state["datasets"] == []
+    assert state["contexts"] == 1
+    assert buffered.flush(10)
+    # and the batch registered in another one
+    assert state["contexts"] == 2
+    assert state["datasets"] == [
+        ("urn:p:ns/a%s" % i, "s3://a%s" % i) for i in range(3)] + [
+        ("urn:p:task/o1", "s3://o1"), ("urn:p:task/o2", "s3://o2")]
+    assert state["jobs"] == [("task", urns[:2])]
+    assert state["ended"] == [("task", list(output_urns.values()))]
+    buffered.close()
+    client.close()
+    assert state["exits"] == 2
+    # synchronous registrations still have their own context
+    assert client.register_artifact("ns", "b", "s3://b") == "urn:p:ns/b"
+    assert state["contexts"] == 3
+
+
+def test_unknown_urns(gms):
+    client = BufferedLineageClient(
+        HTTPLineageClient(gms["url"], predict_urns=False), batch_size=100,
+        flush_interval=10)
+    assert client.register_artifact("ns", "art", "key") == "urn:ns/art"
+    assert gms["requests"] == 1
+    assert client.thread is None
+    client.close()
+
+
+def test_spill_and_replay(gms):
+    gms["down"] = True
+    with tempfile.TemporaryDirectory() as tmpdir:
+        client = BufferedLineageClient(
+            HTTPLineageClient(gms["url"]), batch_size=2, flush_interval=0.05,
+            max_queue=5, spill_dir=tmpdir)
+        for i in range(12):
+            client.register_artifact("ns", "art%s" % i, "key%s" % i)
+        client.close(1)
+        assert client.stats["spilled"] == 12
+        assert gms["records"] == []
+        # replayed by the next process using the spill directory
+        gms["down"] = False
+        client = BufferedLineageClient(
+            HTTPLineageClient(gms["url"]), batch_size=5, spill_dir=tmpdir)
+        wait_until(lambda: client.stats["replayed"] == 12)
+        assert sorted(r["name"] for r in gms["records"]) == \
+            sorted("ns/art%s" % i for i in range(12))
+        assert os.listdir(tmpdir) == []
+        client.close()
+
+
+def benchmark(n=500, latency=0.01):
+    state = {"lock": threading.Lock(), "latency": latency, "down": False,
+             "requests": 0, "records": []}
+    handler = type("Handler", (FakeGMS,), {"state": state})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%s" % httpd.server_port
+    for name, client in [
+            ("synchronous", HTTPLineageClient(url)),
+            ("buffered", BufferedLineageClient(HTTPLineageClient(url)))]:
+        t = time.time()
+        for i in range(n):
+            client.register_artifact("ns", "art%s" % i, "key%s" % i)
+        blocked = time.time() - t
+        if isinstance(client, BufferedLineageClient):
+            client.close()
+        print("%s: %.3fs blocked, %.3fs in total for %s registrations" % (
+            name, blocked, time.time() - t, n))
+    httpd.shutdown()
+
+
+if __name__ == "__main__":
+    benchmark()
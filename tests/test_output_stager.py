@@ -0,0 +1,97 @@
+import glob
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import List
+
+from dflow.config import config
+from dflow.python.opio import Artifact
+from dflow.python.utils import (OutputStager, handle_empty_dir,
+                                handle_output_artifact)
+
+
+def make_tree(root):
+    for path in ["a/b/file.txt", "a/c/d/file.txt", "e.txt"]:
+        os.makedirs(os.path.dirname(os.path.join(root, path)) or root,
+                    exist_ok=True)
+        with open(os.path.join(root, path), "w") as f:
+            f.write(path)
+    for path in ["a/empty", "a/c/empty", "f/g"]:
+        os.makedirs(os.path.join(root, path))
+
+
+def tree(root):
+    return sorted(os.path.relpath(os.path.join(dn, f), root)
+                  for dn, ds, fs in os.walk(root) for f in fs + ds)
+
+
+def test_stage_and_tag_empty_dirs(monkeypatch):
+    monkeypatch.setitem(config, "detect_empty_dir", True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = os.path.join(tmpdir, "work")
+        make_tree(workdir)
+        monkeypatch.chdir(workdir)
+        data_root = os.path.join(tmpdir, "data")
+        handle_output_artifact("foo", [Path("a"), Path("e.txt"), Path("f")],
+                               Artifact(List[Path]), data_root=data_root)
+        art_path = os.path.join(data_root, "outputs", "artifacts", "foo")
+        # the same tags as walking the staged tree again
+        expected = os.path.join(tmpdir, "expected")
+        make_tree(expected)
+        handle_empty_dir(expected)
+        assert [p for p in tree(art_path) if not p.startswith(
+            config["catalog_dir_name"])] == tree(expected)
+        # files are hardlinked
+        for path in ["a/b/file.txt", "e.txt"]:
+            assert os.path.samefile(os.path.join(art_path, path),
+                                    os.path.join(workdir, path))
+        fragment = glob.glob(os.path.join(
+            art_path, config["catalog_dir_name"], "*"))[0]
+        with open(fragment) as f:
+            content = json.load(f)
+        assert [item["dflow_list_item"] for item in content["path_list"]] \
+            == ["a", "e.txt", "f"]
+        assert content["staging"]["files"] == 3
+
+
+def test_copy_in_pool():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_tree(os.path.join(tmpdir, "src"))
+        stager = OutputStager(max_workers=4)
+        copied = []
+
+        def copy(src, dst):
+            copied.append(dst)
+            with open(src) as fsrc, open(dst, "w") as fdst:
+                fdst.write(fsrc.read())
+
+        stager.add(os.path.join(tmpdir, "src"), os.path.join(tmpdir, "dst"),
+                   copy)
+        # the last one wins for the same target
+        with open(os.path.join(tmpdir, "new.txt"), "w") as f:
+            f.write("new")
+        stager.add(os.path.join(tmpdir, "new.txt"),
+                   os.path.join(tmpdir, "dst", "e.txt"), copy)
+        stats = stager.run()
+        assert stats["files"] == 3
+        assert sorted(copied) == sorted(os.path.join(tmpdir, "dst", p) for p
+                                        in ["a/b/file.txt", "a/c/d/file.txt",
+                                            "e.txt"])
+        with open(os.path.join(tmpdir, "dst", "e.txt")) as f:
+            assert f.read() == "new"
+        assert not os.path.samefile(os.path.join(tmpdir, "src", "e.txt"),
+                                    os.path.join(tmpdir, "dst", "e.txt"))
+
+
+def test_symlinks(monkeypatch):
+    monkeypatch.setitem(config, "detect_empty_dir", True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_tree(os.path.join(tmpdir, "src"))
+        stager = OutputStager()
+        stager.add_symlink(os.path.join(tmpdir, "src"),
+                           os.path.join(tmpdir, "dst"))
+        assert stager.run()["files"] == 1
+        assert os.path.islink(os.path.join(tmpdir, "dst"))
+        assert os.path.exists(os.path.join(tmpdir, "dst", "f", "g",
+                                           ".empty_dir"))
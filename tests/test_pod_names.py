@@ -0,0 +1,45 @@
+import random
+import sys
+
+import pytest
+
+from dflow.argo_objects import (FNV1_32_INIT, FNV_32_PRIME, fnva, get_hash,
+                                get_hashes, get_pod_name, get_pod_names)
+
+
+def make_names(n=200):
+    rng = random.Random(0)
+    names = ["", "wf-abc", "wf-abc.steps[0].hello",
+             "wf-abc.loop(0:{\"i\":\"ü\"})"]
+    names += ["wf-abc.step%s%s" % (i, "x" * rng.randrange(50))
+              for i in range(n)]
+    return names
+
+
+def test_fnva():
+    assert fnva(b"", FNV1_32_INIT, FNV_32_PRIME, 2**32) == FNV1_32_INIT
+    # the non-power of 2 size is reduced by modulo
+    assert fnva(b"abc", FNV1_32_INIT, FNV_32_PRIME, 1000) < 1000
+    assert get_hash("wf-abc") == fnva(b"wf-abc", FNV1_32_INIT, FNV_32_PRIME,
+                                      2**32)
+
+
+@pytest.mark.parametrize("with_numpy", [True, False])
+def test_get_hashes(monkeypatch, with_numpy):
+    if with_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setitem(sys.modules, "numpy", None)
+    names = make_names()
+    assert get_hashes(names) == [get_hash(name) for name in names]
+    # only empty names
+    assert get_hashes([""] * 100) == [FNV1_32_INIT] * 100
+    assert get_hashes([]) == []
+
+
+def test_get_pod_names():
+    names = make_names()
+    nodes = [(name, "hello") for name in names] + [("wf-abc", "main")]
+    assert get_pod_names("wf-abc", nodes) == [
+        get_pod_name("wf-abc", name, template, None)
+        for name, template in nodes]
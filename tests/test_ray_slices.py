@@ -0,0 +1,119 @@
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+from dflow.plugins.ray import RayClusterExecutor
+from dflow.python import (OP, OPIO, Artifact, OPIOSign, PythonOPTemplate,
+                          Slices)
+
+
+class Count(OP):
+    @classmethod
+    def get_input_sign(cls):
+        return OPIOSign({
+            "text": Artifact(Path),
+            "n": int,
+        })
+
+    @classmethod
+    def get_output_sign(cls):
+        return OPIOSign({
+            "count": Artifact(Path),
+            "length": int,
+        })
+
+    @OP.exec_sign_check
+    def execute(self, op_in: OPIO) -> OPIO:
+        if op_in["n"] < 0:
+            raise ValueError("negative")
+        length = len(op_in["text"].read_text()) * op_in["n"]
+        count = Path("count.txt")
+        count.write_text(str(length))
+        return OPIO({"count": count, "length": length})
+
+
+def test_render_ray_slices():
+    template = PythonOPTemplate(
+        Count, image="python:3.8",
+        slices=Slices("{{item}}", input_artifact=["text"],
+                      input_parameter=["n"], output_artifact=["count"],
+                      output_parameter=["length"], pool_size=4))
+    executor = RayClusterExecutor(ray_host="ray://head:10001",
+                                  ray_slices=True, num_cpus=1,
+                                  max_in_flight=100)
+    script = executor.render(template).script
+    assert "run_slices = partial(run_slices_on_ray, " in script
+    assert "'num_cpus': 1" in script
+    # ray is initialized once, before the configuration is loaded
+    assert script.index("ray.init(") < script.index(
+        "from dflow.runtime import config")
+
+
+@pytest.fixture(scope="module")
+def ray_cluster():
+    ray = pytest.importorskip("ray")
+    # workers import the OP from this module
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__))] + sys.path)
+    ray.init(num_cpus=2, include_dashboard=False, log_to_driver=False)
+    yield ray
+    ray.shutdown()
+
+
+@pytest.mark.parametrize("shared_fs", [False, True])
+def test_run_slices_on_ray(ray_cluster, shared_fs):
+    from dflow.plugins.ray import run_slices_on_ray
+    with tempfile.TemporaryDirectory() as tmpdir:
+        texts = []
+        for i in range(4):
+            text = Path(tmpdir) / "inputs" / ("text%s.txt" % i)
+            text.parent.mkdir(parents=True, exist_ok=True)
+            text.write_text("x" * i)
+            texts.append(text)
+        op_in = OPIO({"text": texts, "n": [1, 2, -1, 3]})
+        slice_dirs = ["task.%04d" % i for i in range(4)]
+        completed = []
+        outputs, errors = run_slices_on_ray(
+            op_in, ["text", "n"], slice_dirs, Count(),
+            Count.get_output_sign(), tmpdir, max_in_flight=2,
+            shared_fs=shared_fs, num_cpus=1,
+            callback=lambda i, o, e: completed.append(i))
+        assert sorted(completed) == [0, 1, 2, 3]
+        assert outputs[2] is None and isinstance(errors[2], ValueError)
+        for i, n in [(0, 1), (1, 2), (3, 3)]:
+            assert errors[i] is None
+            assert outputs[i]["length"] == i * n
+            count = Path(tmpdir) / slice_dirs[i] / "count.txt"
+            assert Path(outputs[i]["count"]) == count
+            assert count.read_text() == str(i * n)
+
+
+def benchmark(n=1000):
+    import ray
+
+    from dflow.plugins.ray import run_slices_on_ray
+    from dflow.python.utils import run_slices
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__))] + sys.path)
+    ray.init(include_dashboard=False, log_to_driver=False)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        text = Path(tmpdir) / "text.txt"
+        text.write_text("x")
+        op_in = OPIO({"text": [text] * n, "n": list(range(n))})
+        slice_dirs = ["task.%06d" % i for i in range(n)]
+        for name, func, kwargs in [
+                ("process pool", run_slices, {"pool_size": os.cpu_count()}),
+                ("ray", run_slices_on_ray, {"shared_fs": True}),
+                ("ray, shipped files", run_slices_on_ray, {})]:
+            t = time.time()
+            func(op_in, ["text", "n"], slice_dirs, Count(),
+                 Count.get_output_sign(), tmpdir, **kwargs)
+            print("%s: %.2fs for %s slices" % (name, time.time() - t, n))
+    ray.shutdown()
+
+
+if __name__ == "__main__":
+    benchmark()
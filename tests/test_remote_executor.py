@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from dflow import ShellOPTemplate, Step
+from dflow.executor import RemoteExecutor
+from dflow.io import (InputArtifact, InputParameter, OutputArtifact,
+                      OutputParameter)
+from dflow.python import OP, OPIO, Artifact, OPIOSign, PythonOPTemplate, Slices
+from dflow.slurm import SlurmRemoteExecutor
+
+fake_ssh = """#!/bin/sh
+# run the command after "--" locally, count the sessions
+echo $@ >> %s/ssh.log
+for arg; do
+    shift
+    if [ "$arg" = "-O" ]; then
+        exit 0
+    fi
+    if [ "$arg" = "--" ]; then
+        exec sh -c "$*"
+    fi
+done
+"""
+
+
+# a fake Slurm running the tasks of an array one by one at submission
+fake_slurm = {
+    "sbatch": """#!/bin/sh
+for arg; do
+    case $arg in
+        --array=*) range=${arg#--array=} ;;
+        --*) ;;
+        *) if [ -z "$script" ]; then script=$arg; else args="$args $arg"; fi
+    esac
+done
+id=$(($(cat fake_job_id 2>/dev/null || echo 0)+1))
+echo $id > fake_job_id
+echo $range >> fake_arrays
+i=${range%-*}
+while [ $i -le ${range#*-} ]; do
+    SLURM_ARRAY_JOB_ID=$id SLURM_ARRAY_TASK_ID=$i sh $script $args \\
+        > slurm-${id}_$i.out 2>&1
+    echo "${id}_$i|COMPLETED|0:0" >> fake_sacct
+    i=$(($i+1))
+done
+echo $id
+""",
+    "squeue": "#!/bin/sh\n",
+    "sacct": "#!/bin/sh\ncat fake_sacct\n",
+    "scontrol": "#!/bin/sh\necho 'MaxArraySize            = 2'\n",
+}
+
+
+def install_shims(tmpdir):
+    bin_dir = Path(tmpdir) / "bin"
+    bin_dir.mkdir()
+    shims = dict(fake_slurm, ssh=fake_ssh % tmpdir)
+    for name, content in shims.items():
+        (bin_dir / name).write_text(content)
+        (bin_dir / name).chmod(0o755)
+    return bin_dir
+
+
+class Square(OP):
+    @classmethod
+    def get_input_sign(cls):
+        return OPIOSign({"x": int, "f": Artifact(Path)})
+
+    @classmethod
+    def get_output_sign(cls):
+        return OPIOSign({"y": int, "out": Artifact(Path)})
+
+    @OP.exec_sign_check
+    def execute(self, op_in):
+        if op_in["x"] == 2:
+            raise RuntimeError("boom")
+        p = Path("out%s.txt" % op_in["x"])
+        p.write_text(op_in["f"].read_text())
+        return OPIO({"y": op_in["x"]**2, "out": p})
+
+
+@pytest.mark.skipif(shutil.which("tar") is None, reason="tar not found")
+def test_remote_executor():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bin_dir = install_shims(tmpdir)
+        local = Path(tmpdir) / "local"
+        (local / "tmp/inputs/artifacts/foo").mkdir(parents=True)
+        (local / "tmp/inputs/artifacts/foo/a.txt").write_text("a")
+        workdir = Path(tmpdir) / "remote"
+
+        # the script runs in the remote working directory, where the paths
+        # are relative to /
+        rel = str(local).lstrip("/")
+        template = ShellOPTemplate(
+            name="remote", image="alpine",
+            script="cat %s/tmp/inputs/artifacts/foo/a.txt > %s/tmp/bar.txt"
+            " && echo 1 > %s/tmp/msg" % (rel, rel, rel))
+        template.inputs.artifacts["foo"] = InputArtifact(
+            path="%s/tmp/inputs/artifacts/foo" % local)
+        template.outputs.artifacts["bar"] = OutputArtifact(
+            path="%s/tmp/bar.txt" % local)
+        template.outputs.artifacts["missing"] = OutputArtifact(
+            path="%s/tmp/missing" % local)
+        template.outputs.parameters["msg"] = OutputParameter(
+            value_from_path="%s/tmp/msg" % local)
+        executor = RemoteExecutor(
+            host="localhost", username="root", workdir=str(workdir),
+            map_tmp_dir=False, remote_command="sh")
+        script = executor.get_script(template)
+        env = dict(os.environ, PATH="%s:%s" % (bin_dir, os.environ["PATH"]))
+        subprocess.run(["sh", "-c", script], cwd=tmpdir, env=env, check=True)
+        assert (workdir / rel / "tmp/inputs/artifacts/foo/a.txt").read_text() \
+            == "a"
+        assert (workdir / "script").exists()
+        assert (local / "tmp/bar.txt").read_text() == "a"
+        assert (local / "tmp/msg").read_text() == "1\n"
+        assert not (local / "tmp/missing").exists()
+        # upload, run and download each take one session
+        with open(Path(tmpdir) / "ssh.log") as f:
+            sessions = [line for line in f if "-O" not in line.split()]
+        assert len(sessions) == 3
+
+
+@pytest.mark.skipif(shutil.which("tar") is None, reason="tar not found")
+@pytest.mark.parametrize("max_array_size,arrays", [
+    (None, ["0-1", "0-0"]), (1, ["0-0"] * 3), (1001, ["0-2"])])
+def test_slurm_job_array(max_array_size, arrays):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bin_dir = install_shims(tmpdir)
+        workdir = Path(tmpdir) / "remote"
+        template = PythonOPTemplate(
+            Square, image="python", slices=Slices(
+                "{{item}}", input_parameter=["x"], output_parameter=["y"],
+                output_artifact=["out"]))
+        executor = SlurmRemoteExecutor(
+            host="localhost", workdir=str(workdir), remote_command=[
+                sys.executable], python_executable=sys.executable,
+            merge_sliced_step=True, max_array_size=max_array_size)
+        new_template = executor.render(template)
+        # stage the pod's /tmp in a local directory
+        local = Path(tmpdir) / "local"
+        params = {"x": json.dumps([1, 2, 3]),
+                  "dflow_with_param": json.dumps([0, 1, 2])}
+        for name, par in new_template.inputs.parameters.items():
+            if name not in params:
+                params[name] = "null" if par.value is None else par.value \
+                    if isinstance(par.value, str) else json.dumps(par.value)
+        script = re.sub(r"\{\{inputs\.parameters\.([\w-]+)\}\}",
+                        lambda m: params[m.group(1)], new_template.script)
+        script = script.replace("-C / tmp/", "-C %s tmp/" % local).replace(
+            "[ -e /tmp/", "[ -e %s/tmp/" % local).replace(
+            "\"/\" tmp/", "\"%s\" tmp/" % local).replace(
+            "cat /tmp/", "cat %s/tmp/" % local)
+        f = local / "tmp/inputs/artifacts/f"
+        f.parent.mkdir(parents=True)
+        f.write_text("shared")
+        env = dict(os.environ, PATH="%s:%s" % (bin_dir, os.environ["PATH"]),
+                   PYTHONPATH=os.pathsep.join(
+                       [os.path.dirname(os.path.abspath(__file__))] +
+                       sys.path))
+        res = subprocess.run(["sh", "-c", script], cwd=tmpdir, env=env)
+        # the failed item fails the step after the outputs are collected
+        assert res.returncode != 0
+        outputs = local / "tmp/outputs"
+        results = json.loads((outputs / "parameters/dflow_batch_results")
+                             .read_text())
+        assert [r["exit_code"] for r in results] == [0, 1, 0]
+        assert [r["state"] for r in results] == ["COMPLETED"] * 3
+        y = json.loads((outputs / "parameters/y").read_text())
+        assert y[1] is None
+        assert (outputs / "artifacts/out/out3.txt").read_text() == "shared"
+        # more arrays than MaxArraySize allows are all tracked
+        assert (workdir / "fake_arrays").read_text().split() == arrays
+        assert (workdir / "dflow_job_id").read_text() == ",".join(
+            str(i + 1) for i in range(len(arrays)))
+        # upload, submit, poll, collect and download
+        with open(Path(tmpdir) / "ssh.log") as f:
+            sessions = [line for line in f if "-O" not in line.split()]
+        assert len(sessions) == 5
+
+
+def test_slurm_fan_out():
+    executor = SlurmRemoteExecutor(host="localhost", merge_sliced_step=True)
+    template = ShellOPTemplate(name="echo", image="alpine",
+                               script="echo {{inputs.parameters.x}}")
+    template.inputs.parameters["x"] = InputParameter()
+    step = Step("echo", template, parameters={"x": "{{item}}"},
+                with_param=[1, 2, 3], executor=executor)
+    step.prepare_argo_arguments()
+    # a template not sliced is not run as an array, Argo fans it out
+    assert step.with_param == "[1, 2, 3]"
+    assert "dflow_with_param" not in step.inputs.parameters
+    template = PythonOPTemplate(
+        Square, image="python", upload_dflow=False, slices=Slices(
+            "{{item}}", input_parameter=["x"], output_parameter=["y"]))
+    step = Step("square", template, parameters={"x": [1, 2, 3]},
+                artifacts={"f": None}, with_param=[0, 1, 2],
+                executor=executor)
+    step.prepare_argo_arguments()
+    assert step.with_param is None
+    assert step.inputs.parameters["dflow_with_param"].value == "[0, 1, 2]"
@@ -0,0 +1,122 @@
+import json
+import threading
+
+import pytest
+from dflow import Step, Steps, Workflow
+from dflow.io import InputParameter
+from dflow.op_template import ShellOPTemplate
+from dflow.reuse import ReusePlanner, resolve_memoize_key
+
+
+def make_template(name):
+    template = ShellOPTemplate(name=name, image="alpine",
+                               script="echo {{inputs.parameters.iter}}")
+    template.inputs.parameters = {"iter": InputParameter()}
+    return template
+
+
+class FakeApiClient:
+    def __init__(self, existing=()):
+        self.created = []
+        self.existing = set(existing)
+        self.lock = threading.Lock()
+
+    def call_api(self, path, method, body=None, **kwargs):
+        if method == "GET":
+            return FakeList(self.existing)
+        from kubernetes.client.exceptions import ApiException
+        with self.lock:
+            if body.metadata.name in self.existing:
+                raise ApiException(status=409)
+            self.existing.add(body.metadata.name)
+            self.created.append(body)
+        return body
+
+
+class FakeList:
+    def __init__(self, names):
+        from kubernetes.client import V1ConfigMap, V1ObjectMeta
+        self.items = [V1ConfigMap(metadata=V1ObjectMeta(name=name))
+                      for name in names]
+
+
+class FakeCoreV1Api:
+    def __init__(self, existing=()):
+        self.api_client = FakeApiClient(existing)
+
+
+def test_plan():
+    memoize_map = {"wf-a": {"phase": "Succeeded"},
+                   "wf-b": {"phase": "Succeeded"}}
+    planner = ReusePlanner("wf", "argo", size_limit=1024)
+    plan = planner.plan(memoize_map)
+    assert planner.is_packed(plan)
+    assert plan == {"dflow-wf": {k: json.dumps(v)
+                                 for k, v in memoize_map.items()}}
+    planner = ReusePlanner("wf", "argo", size_limit=10)
+    plan = planner.plan(memoize_map)
+    assert not planner.is_packed(plan)
+    assert sorted(plan) == ["dflow-wf-a", "dflow-wf-b"]
+    assert planner.plan({}) == {}
+
+
+def test_apply():
+    pytest.importorskip("kubernetes")
+    planner = ReusePlanner("wf", "argo", size_limit=10)
+    plan = planner.plan({"wf-%s" % i: {} for i in range(5)})
+    api = FakeCoreV1Api(existing=["dflow-wf-0"])
+    planner.apply(plan, api)
+    assert sorted(cm.metadata.name for cm in api.api_client.created) == \
+        ["dflow-wf-%s" % i for i in range(1, 5)]
+    # a resubmission does not create them again
+    api = FakeCoreV1Api()
+    planner.apply(plan, api)
+    assert api.api_client.created == []
+
+
+def configmaps_of_steps(wf):
+    return {step.name: resolve_memoize_key(
+        memoize.cache.config_map.name, step)
+        for memoize, steps in wf.memoized_steps().values()
+        for step in steps}
+
+
+def test_use_packed_configmap():
+    templ = make_template("plus")
+    other = make_template("other")
+    steps = Steps(name="main")
+    steps.add(Step("reused", templ, parameters={"iter": 0}, key="reused"))
+    steps.add(Step("new", other, parameters={"iter": 0}, key="new"))
+    # the same template for a packed and a new key
+    steps.add(Step("mixed", templ, parameters={"iter": 0}, key="mixed"))
+    wf = Workflow("wf", steps=steps, id="wf-abc")
+    wf.parents = {}
+    wf.handle_template(wf.entrypoint, memoize_prefix=wf.id)
+    memoize_map = {"wf-abc-reused": {}}
+    planner = ReusePlanner("wf-abc", "argo", size_limit=1024)
+    plan = planner.plan(memoize_map, wf.packable_keys(memoize_map))
+    # the entry of the mixed template has its own ConfigMap
+    assert plan == {"dflow-wf-abc-reused": {"wf-abc-reused": "{}"}}
+    assert not planner.is_packed(plan)
+    assert configmaps_of_steps(wf)["reused"] in plan
+
+    steps = Steps(name="main")
+    steps.add(Step("reused", templ, parameters={"iter": 0}, key="reused"))
+    steps.add(Step("new", other, parameters={"iter": 0}, key="new"))
+    wf = Workflow("wf", steps=steps, id="wf-abc")
+    wf.parents = {}
+    wf.handle_template(wf.entrypoint, memoize_prefix=wf.id)
+    plan = planner.plan(memoize_map, wf.packable_keys(memoize_map))
+    assert planner.is_packed(plan)
+    wf.use_packed_configmap(planner.packed_name, plan[planner.packed_name])
+    names = configmaps_of_steps(wf)
+    assert names["reused"] == "dflow-wf-abc"
+    assert "wf-abc-reused" in plan[names["reused"]]
+    assert names["new"] == "dflow-wf-abc-new"
+
+
+def test_plan_partially_packed():
+    planner = ReusePlanner("wf", "argo", size_limit=1024)
+    plan = planner.plan({"wf-a": {}, "wf-b": {}}, packable_keys=["wf-a"])
+    assert plan == {"dflow-wf": {"wf-a": "{}"}, "dflow-wf-b": {"wf-b": "{}"}}
+    assert planner.is_packed(plan)
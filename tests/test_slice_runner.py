@@ -0,0 +1,108 @@
+import os
+import tempfile
+import time
+
+import pytest
+from dflow.python import OP, OPIO, OPIOSign
+from dflow.python.utils import run_slices
+
+
+class Square(OP):
+    @classmethod
+    def get_input_sign(cls):
+        return OPIOSign({
+            "x": int,
+            "offset": int,
+        })
+
+    @classmethod
+    def get_output_sign(cls):
+        return OPIOSign({
+            "y": int,
+            "cwd": str,
+            "pid": int,
+        })
+
+    @OP.exec_sign_check
+    def execute(self, op_in: OPIO) -> OPIO:
+        if op_in["x"] < 0:
+            raise ValueError("negative")
+        if op_in["x"] >= 100:
+            # sleep or crash
+            if op_in["x"] == 666:
+                os._exit(3)
+            time.sleep(op_in["x"] / 100)
+        return OPIO({"y": op_in["x"] ** 2 + op_in["offset"],
+                     "cwd": os.getcwd(), "pid": os.getpid()})
+
+
+def run(xs, **kwargs):
+    op_obj = Square()
+    slice_dirs = kwargs.pop("slice_dirs", [None] * len(xs))
+    return run_slices(OPIO({"x": xs, "offset": 1}), ["x"], slice_dirs,
+                      op_obj, op_obj.get_output_sign(), os.getcwd(),
+                      **kwargs)
+
+
+@pytest.mark.parametrize("pool_size,start_method", [
+    (1, None), (2, "fork"), (-1, "spawn")])
+def test_run_slices(pool_size, start_method):
+    xs = list(range(20))
+    completed = []
+    output_list, error_list = run(
+        xs, pool_size=pool_size, start_method=start_method,
+        callback=lambda i, output, error: completed.append(i))
+    # in the order of slices, whatever the order of completion
+    assert [o["y"] for o in output_list] == [x ** 2 + 1 for x in xs]
+    assert error_list == [None] * 20
+    assert sorted(completed) == xs
+    pids = {o["pid"] for o in output_list}
+    if pool_size == 1:
+        assert pids == {os.getpid()}
+    else:
+        assert os.getpid() not in pids
+
+
+def test_run_slices_errors():
+    output_list, error_list = run([1, -1, 2], pool_size=2, chunksize=1)
+    assert output_list[1] is None
+    assert isinstance(error_list[1], ValueError)
+    assert [o["y"] for o in output_list if o is not None] == [2, 5]
+
+
+def test_run_slices_dirs():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        slice_dirs = [os.path.join(tmpdir, "task.%04d" % i) for i in range(3)]
+        output_list, _ = run([0, 1, 2], pool_size=2, slice_dirs=slice_dirs)
+        assert [o["cwd"] for o in output_list] == slice_dirs
+        assert all(os.path.isdir(d) for d in slice_dirs)
+
+
+def test_slice_timeout():
+    t = time.monotonic()
+    output_list, error_list = run([1, 1000, 2, 3], pool_size=2, timeout=1)
+    assert time.monotonic() - t < 5
+    assert isinstance(error_list[1], TimeoutError)
+    assert [o["y"] for i, o in enumerate(output_list) if i != 1] == \
+        [2, 5, 10]
+
+
+def test_slice_deadline():
+    t = time.monotonic()
+    output_list, error_list = run([1, 1000, 1000, 2, 3], pool_size=2,
+                                  deadline=1)
+    assert time.monotonic() - t < 5
+    assert output_list[0]["y"] == 2
+    # running and remaining slices are cancelled
+    assert [type(e) for e in error_list[1:3]] == [TimeoutError] * 2
+    for i in [3, 4]:
+        assert output_list[i] is not None or \
+            isinstance(error_list[i], TimeoutError)
+
+
+def test_crashed_worker():
+    output_list, error_list = run([1, 666, 2], pool_size=1, timeout=10)
+    assert isinstance(error_list[1], RuntimeError)
+    assert "exited with code 3" in str(error_list[1])
+    # the worker is replaced
+    assert [output_list[0]["y"], output_list[2]["y"]] == [2, 5]
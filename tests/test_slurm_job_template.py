@@ -0,0 +1,108 @@
+import os
+import subprocess
+import tempfile
+
+import yaml
+
+from dflow import Step, Steps, Workflow
+from dflow.io import InputArtifact, OutputArtifact
+from dflow.op_template import ShellOPTemplate
+from dflow.slurm import SlurmJob, SlurmJobTemplate
+
+
+def make_template(name):
+    template = ShellOPTemplate(
+        name=name, image="alpine", script="cp -r /tmp/in /tmp/out")
+    template.inputs.artifacts = {"in": InputArtifact(path="/tmp/in")}
+    template.outputs.artifacts = {"out": OutputArtifact(path="/tmp/out")}
+    return template
+
+
+def test_cluster_artifacts():
+    executor = SlurmJobTemplate(cluster_artifacts=True, upload_artifacts=[])
+    first = Step("first", template=make_template("first"),
+                 artifacts={"in": "raw content"}, executor=executor)
+    second = Step("second", template=make_template("second"),
+                  artifacts={"in": first.outputs.artifacts["out"]},
+                  executor=executor)
+    steps = Steps("main")
+    steps.add(first)
+    steps.add(second)
+    wf = Workflow("slurm-cluster", steps=steps)
+    manifest = wf.to_dict()
+    templates = {t["name"]: t for t in manifest["spec"]["templates"]}
+    main = templates["main"]["steps"]
+    # the consumer links the artifact on the cluster instead of downloading
+    args = main[1][0]["arguments"]
+    assert not args.get("artifacts")
+    path = [p for p in args["parameters"]
+            if p["name"] == "dflow_in_cluster_path"][0]
+    assert "dflow_out_cluster_path" in path["value"]
+
+    slurm = templates[main[1][0]["template"]]
+    assert [s[0]["name"] for s in slurm["steps"]] == [
+        "slurm-prepare", "slurm-run"]
+    prepare = templates[slurm["steps"][0][0]["template"]]
+    assert prepare["inputs"]["artifacts"][0]["optional"]
+    run = templates[slurm["steps"][1][0]["template"]]
+    assert "cp -al {{inputs.parameters.dflow_in_cluster_path}}" in \
+        run["resource"]["manifest"]
+    outputs = {p["name"]: p for p in run["outputs"]["parameters"]}
+    assert outputs["dflow_out_cluster_path"]["value"].endswith(
+        "{{pod.name}}/workdir/tmp/out")
+    # nothing is uploaded back to the artifact repository
+    assert not slurm["outputs"].get("artifacts")
+    assert "results" not in run["resource"]["manifest"]
+
+
+def test_upload_artifacts():
+    executor = SlurmJobTemplate(cluster_artifacts=True)
+    step = Step("step", template=make_template("step"),
+                artifacts={"in": "raw content"}, executor=executor)
+    steps = Steps("main")
+    steps.add(step)
+    manifest = Workflow("slurm-upload", steps=steps).to_dict()
+    templates = {t["name"]: t for t in manifest["spec"]["templates"]}
+    slurm = templates[templates["main"]["steps"][0][0]["template"]]
+    assert [s[0]["name"] for s in slurm["steps"]] == [
+        "slurm-prepare", "slurm-run", "slurm-collect"]
+    assert [a["name"] for a in slurm["outputs"]["artifacts"]] == ["out"]
+    assert "dflow_out_cluster_path" in [
+        p["name"] for p in slurm["outputs"]["parameters"]]
+
+
+def test_other_cluster():
+    first = Step("first", template=make_template("first"),
+                 artifacts={"in": "raw content"},
+                 executor=SlurmJobTemplate(cluster_artifacts=True,
+                                           node_selector={"cluster": "a"}))
+    executor = SlurmJobTemplate(cluster_artifacts=True,
+                                node_selector={"cluster": "b"})
+    assert not executor.shares_cluster_with(first.executor)
+    assert not executor.shares_cluster_with(SlurmJobTemplate(
+        cluster_artifacts=True, node_selector={"cluster": "b"},
+        workdir="other/{{pod.name}}"))
+    assert executor.shares_cluster_with(SlurmJobTemplate(
+        cluster_artifacts=True, node_selector={"cluster": "b"}))
+    second = Step("second", template=make_template("second"),
+                  artifacts={"in": first.outputs.artifacts["out"]},
+                  executor=executor)
+    # downloaded from the artifact repository
+    assert second.inputs.artifacts["in"].source is not None
+    assert "dflow_in_cluster_path" not in second.inputs.parameters
+
+
+def test_failed_link():
+    template = ShellOPTemplate(name="hello", image=None, script="ls")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.makedirs(os.path.join(tmpdir, "src"))
+        for src, code in [("src", 0), ("missing", 1)]:
+            job = SlurmJob(workdir="job", remote_command="true",
+                           links={"job/tmp/in": src})
+            batch = yaml.safe_load(job.get_manifest(template))["spec"][
+                "batch"]
+            res = subprocess.run(["sh", "-c", batch], cwd=tmpdir,
+                                 stderr=subprocess.PIPE, text=True)
+            # the job does not run without its input
+            assert res.returncode == code, res.stderr
+        assert "Failed to link missing" in res.stderr
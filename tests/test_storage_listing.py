@@ -0,0 +1,147 @@
+import os
+import tempfile
+import threading
+import time
+
+from dflow.common import S3Artifact
+from dflow.utils import (StorageClient, catalog_of_artifact, copy_s3,
+                         download_s3, iter_list_sharded)
+
+
+class MemoryClient(StorageClient):
+    """In-memory storage listing like Minio, page by page"""
+
+    def __init__(self, objects, page_size=10, latency=0.0):
+        self.objects = dict(objects)
+        self.page_size = page_size
+        self.latency = latency
+        self.pages = 0
+        self.lock = threading.Lock()
+
+    def upload(self, key, path):
+        with open(path, "r") as f:
+            self.objects[key] = f.read()
+
+    def download(self, key, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.objects[key])
+
+    def _iter_list(self, prefix, recursive):
+        keys = sorted(k for k in self.objects if k.startswith(prefix))
+        if not recursive:
+            entries = []
+            for k in keys:
+                rest = k[len(prefix):]
+                entry = prefix + rest.split("/")[0] + "/" if "/" in rest \
+                    else k
+                if not entries or entries[-1] != entry:
+                    entries.append(entry)
+            keys = entries
+        for i in range(0, len(keys), self.page_size):
+            time.sleep(self.latency)
+            with self.lock:
+                self.pages += 1
+            yield from keys[i:i + self.page_size]
+
+    def list(self, prefix, recursive=False):
+        return list(self._iter_list(prefix, recursive))
+
+    def iter_list(self, prefix, recursive=False):
+        return self._iter_list(prefix, recursive)
+
+    def copy(self, src, dst):
+        self.objects[dst] = self.objects[src]
+
+    def get_md5(self, key):
+        return ""
+
+
+def make_objects(n_shards=8, n_files=25):
+    return {"art/%s/%s.txt" % (i, j): "%s-%s" % (i, j)
+            for i in range(n_shards) for j in range(n_files)}
+
+
+def test_iter_list_sharded():
+    objects = make_objects()
+    objects["art/top.txt"] = "top"
+    client = MemoryClient(objects)
+    keys = list(iter_list_sharded(client._iter_list, "art/", 4))
+    assert sorted(keys) == sorted(objects)
+    keys = list(iter_list_sharded(client._iter_list, "art/", 1))
+    assert keys == sorted(objects)
+
+
+def test_close_sharded_listing():
+    client = MemoryClient(make_objects(16, 5))
+    listed = []
+    release = threading.Event()
+
+    def iter_list(prefix, recursive=False):
+        if recursive:
+            listed.append(prefix)
+            # the other shards wait until the listing is closed
+            if prefix != "art/0/":
+                assert release.wait(10)
+        return client._iter_list(prefix, recursive)
+    keys = iter_list_sharded(iter_list, "art/", 2)
+    next(keys)
+    keys.close()
+    release.set()
+    time.sleep(0.5)
+    # five shards submitted, the queued ones are cancelled
+    assert len(listed) <= 3
+
+
+def test_download_overlaps_listing():
+    client = MemoryClient(make_objects(1, 30), page_size=10)
+    downloaded = threading.Event()
+    download = client.download
+
+    def iter_list(prefix, recursive=False):
+        for i, key in enumerate(client._iter_list(prefix, recursive)):
+            yield key
+            # the rest of the listing waits for the first download
+            if recursive and i == 0:
+                assert downloaded.wait(10)
+
+    def download_and_notify(key, path):
+        download(key, path)
+        downloaded.set()
+    client.iter_list = iter_list
+    client.download = download_and_notify
+    with tempfile.TemporaryDirectory() as tmpdir:
+        download_s3("art/", tmpdir, storage_client=client)
+        for j in range(30):
+            with open(os.path.join(tmpdir, "0", "%s.txt" % j)) as f:
+                assert f.read() == "0-%s" % j
+
+
+def test_copy_and_catalog():
+    objects = make_objects(2, 3)
+    objects["art/.dflow/0"] = '{"path_list": [{"dflow_list_item": "0", ' \
+        '"order": 0}]}'
+    client = MemoryClient(objects, page_size=1)
+    copy_s3("art", "dst", ignore_catalog=True, storage_client=client)
+    assert sorted(k for k in client.objects if k.startswith("dst/")) == \
+        sorted("dst/" + k[4:] for k in objects if ".dflow" not in k)
+    client.pages = 0
+    catalog = catalog_of_artifact(S3Artifact(key="art"),
+                                  storage_client=client)
+    assert catalog == [{"dflow_list_item": "0", "order": 0}]
+    # resolving the artifact key lists two entries, not the whole level
+    assert client.pages == 3
+
+
+def benchmark(n_shards=32, n_files=100, latency=0.01):
+    objects = make_objects(n_shards, n_files)
+    for workers in [1, 8]:
+        client = MemoryClient(objects, page_size=100, latency=latency)
+        t = time.time()
+        keys = list(iter_list_sharded(client._iter_list, "art/", workers))
+        print("%s shard workers: %.2fs to list %s keys" % (
+            workers, time.time() - t, len(keys)))
+
+
+if __name__ == "__main__":
+    benchmark()
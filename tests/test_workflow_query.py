@@ -0,0 +1,188 @@
+import os
+import subprocess
+import sys
+import tempfile
+from copy import deepcopy
+
+from dflow import Workflow, config
+from dflow.argo_objects import get_pod_name
+from dflow.snapshot import SnapshotStore
+from dflow.workflow import project_fields, query_step_fields
+
+
+def make_node(id, name, phase="Succeeded", key=None):
+    parameters = [{"name": "msg", "value": "hello"}]
+    if key is not None:
+        parameters.append({"name": "dflow_key", "value": key})
+    return {"id": id, "name": name, "displayName": name.split(".")[-1],
+            "type": "Pod", "phase": phase, "templateName": "hello",
+            "startedAt": "2024-01-01T00:00:00Z",
+            "inputs": {"parameters": parameters},
+            "outputs": {"parameters": [{"name": "out", "value": "x" * 100}]}}
+
+
+def make_workflow(phase="Succeeded", n=3):
+    nodes = {"wf-abc": {"id": "wf-abc", "name": "wf-abc", "type": "Steps",
+                        "displayName": "wf-abc", "phase": phase,
+                        "startedAt": "2024-01-01T00:00:00Z",
+                        "children": ["wf-abc-%s" % i for i in range(n)]}}
+    for i in range(n):
+        nodes["wf-abc-%s" % i] = make_node(
+            "wf-abc-%s" % i, "wf-abc.step%s" % i, key="key%s" % i)
+    return {"metadata": {"name": "wf-abc", "uid": "uid-1",
+                         "resourceVersion": "1"},
+            "spec": {"templates": [{"name": "hello"}] * 10},
+            "status": {"phase": phase, "nodes": nodes}}
+
+
+class FakeApiClient:
+    """Argo server returning a workflow with fields selected"""
+
+    def __init__(self, workflow):
+        self.workflow = workflow
+        self.requests = []
+
+    def call_api(self, path, method, query_params=None, **kwargs):
+        fields = None
+        for k, v in query_params or []:
+            if k == "fields":
+                fields = v.split(",")
+        self.requests.append((path, fields))
+        if fields is None:
+            return deepcopy(self.workflow)
+        return project_fields(deepcopy(self.workflow), fields)
+
+
+class FakeApi:
+    def __init__(self, workflow):
+        self.api_client = FakeApiClient(workflow)
+
+
+def make_client(workflow, **kwargs):
+    wf = Workflow(id="wf-abc", **kwargs)
+    wf.api_instance = FakeApi(workflow)
+    return wf
+
+
+def test_query_step_fields():
+    assert query_step_fields() == ["metadata.name", "status.nodes"]
+    assert query_step_fields(id="wf-abc-1") == [
+        "metadata.name", "status.nodes.wf-abc-1"]
+    assert query_step_fields(id="wf-abc-1", parent_id="wf-abc") == [
+        "metadata.name", "status.nodes"]
+
+
+def test_query_step_projection():
+    wf = make_client(make_workflow())
+    steps = wf.query_step(key="key1")
+    assert [s.id for s in steps] == ["wf-abc-1"]
+    assert steps[0].outputs.parameters["out"].value == "x" * 100
+    # neither the spec nor the stored templates are requested
+    assert wf.api_instance.api_client.requests[-1][1] == [
+        "metadata.name", "status.nodes"]
+    steps = wf.query_step(id="wf-abc-2")
+    assert [s.key for s in steps] == ["key2"]
+    assert wf.api_instance.api_client.requests[-1][1] == [
+        "metadata.name", "status.nodes.wf-abc-2"]
+
+
+def test_query_step_lite():
+    wf = make_client(make_workflow())
+    steps = wf.query_step(type="Pod", lite=True)
+    assert [s.key for s in steps] == ["key0", "key1", "key2"]
+    assert [s.phase for s in steps] == ["Succeeded"] * 3
+    assert not hasattr(steps[0], "outputs")
+    assert list(steps[0].inputs.parameters) == ["dflow_key"]
+
+
+def test_pod_names_for_keys():
+    # keys not in the global outputs are found by querying nodes
+    workflow = make_workflow()
+    workflow["status"]["outputs"] = {"parameters": [
+        {"name": "dflow_key_key0", "value": "wf-abc-0"}]}
+    wf = make_client(workflow)
+    requests = wf.api_instance.api_client.requests
+    pod_names = wf.pod_names_for_keys(["key0", "key2", "missing"])
+    assert pod_names == {
+        "key0": "wf-abc-0",
+        "key2": get_pod_name("wf-abc", "wf-abc.step2", "hello", None)}
+    assert [fields for _, fields in requests] == [
+        ["metadata.name", "status.outputs"],
+        ["metadata.name", "status.nodes"]]
+    # all found in the global outputs
+    assert wf.pod_names_for_keys("key0") == {"key0": "wf-abc-0"}
+    assert len(requests) == 3
+    # no global outputs
+    wf = make_client(make_workflow())
+    assert wf.pod_names_for_keys(["key1"]) == {
+        "key1": get_pod_name("wf-abc", "wf-abc.step1", "hello", None)}
+
+
+def test_query_cache(monkeypatch):
+    monkeypatch.setitem(config, "snapshot_dir", None)
+    workflow = make_workflow(phase="Running")
+    wf = make_client(workflow, query_cache_ttl=60)
+    requests = wf.api_instance.api_client.requests
+    assert wf.query().status.phase == "Running"
+    # served from the cache, projected locally
+    assert wf.query_status() == "Running"
+    assert [s.key for s in wf.query_step(key="key0")] == ["key0"]
+    assert len(requests) == 1
+    assert wf.query_cache_stats["hits"] == 2
+    # revalidated by the resource version after the TTL
+    wf.query_cache_time -= 61
+    assert wf.query_status() == "Running"
+    assert requests[-1][1] == ["metadata.resourceVersion"]
+    assert wf.query_cache_stats["revalidations"] == 1
+    workflow["status"]["phase"] = "Succeeded"
+    workflow["metadata"]["resourceVersion"] = "2"
+    wf.query_cache_time -= 61
+    assert wf.query().status.phase == "Succeeded"
+    assert requests[-1][1] is None
+    # invalidated explicitly
+    workflow["status"]["phase"] = "Running"
+    wf.invalidate_cache()
+    assert wf.query_status() == "Running"
+    assert wf.query_cache_stats["hits"] == 3
+    assert wf.query_cache_stats["misses"] == 3
+    assert wf.query_cache_hit_rate == 0.5
+
+
+def test_snapshot_opt_in():
+    env = dict(os.environ)
+    env.pop("DFLOW_SNAPSHOT_DIR", None)
+    out = subprocess.check_output([sys.executable, "-c", "from dflow import "
+                                   "config; print(config['snapshot_dir'])"],
+                                  env=env, text=True)
+    assert out.strip() == "None"
+
+
+def test_snapshot(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setitem(config, "snapshot_dir", tmpdir)
+        workflow = make_workflow(phase="Failed")
+        wf = make_client(workflow, uid="uid-1")
+        requests = wf.api_instance.api_client.requests
+        # failed workflows may be retried, not saved
+        wf.query()
+        wf.query()
+        assert len(requests) == 2
+        workflow["status"]["phase"] = "Succeeded"
+        wf.query()
+        assert wf.query_status() == "Succeeded"
+        assert len(requests) == 3
+        store = SnapshotStore()
+        assert store.load("argo", "wf-abc", "uid-1")["status"]["phase"] == \
+            "Succeeded"
+        # the snapshot is only found by its UID
+        for uid in [None, "uid-2"]:
+            wf = make_client(workflow, uid=uid)
+            wf.query_status()
+            assert len(wf.api_instance.api_client.requests) == 1
+        store.mark_archived("argo", "wf-abc", "uid-1")
+        assert not store.is_archived("argo", "wf-abc", None)
+        assert not store.is_archived("argo", "wf-abc", "uid-2")
+        wf = make_client(workflow, uid="uid-1")
+        wf.invalidate_cache()
+        assert store.load("argo", "wf-abc", "uid-1") is None
+        assert not store.is_archived("argo", "wf-abc", "uid-1")
@@ -0,0 +1 @@
+/root/package/tests/test_big_parameter.py
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/tests/test_conditional_outputs.py
\ No newline at end of file
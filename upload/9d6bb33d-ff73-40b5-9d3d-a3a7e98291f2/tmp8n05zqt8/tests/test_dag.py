@@ -0,0 +1 @@
+/root/package/tests/test_dag.py
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/tests/test_group_size.py
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/tests/test_makevasp.py
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/tests/test_python.py
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/tests/test_recurse.py
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/tests/test_reuse.py
\ No newline at end of file
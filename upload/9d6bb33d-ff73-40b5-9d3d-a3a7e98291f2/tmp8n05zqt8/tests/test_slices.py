@@ -0,0 +1 @@
+/root/package/tests/test_slices.py
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/tests/test_subpath_slices.py
\ No newline at end of file